@@ -0,0 +1,12 @@
+import pytest
+
+from core.selenium_automation import clean_cookies
+
+from generators import SIZES, msal_heavy_cookies
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_clean_cookies_msal_heavy(regression, size):
+    cookies = msal_heavy_cookies(size)
+    cleaned = regression(clean_cookies, cookies)
+    assert 0 < len(cleaned) < len(cookies)
@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+from core.importers import normalize_state, parse_state_text
+
+from generators import SIZES, state_export
+
+FORMATS = ['export', 'list', 'plain', 'header']
+
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_parse_pasted_state(regression, fmt, size):
+    """The text-paste path of `update_cookies` (JSON decode + normalize, or Cookie header)."""
+    export = state_export(size, fmt)
+    text = export if fmt == 'header' else json.dumps(export)
+    cookies, _local, _session = regression(parse_state_text, text)
+    assert len(cookies) == size
+
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('fmt', ['export', 'list', 'plain'])
+def test_normalize_uploaded_state(regression, fmt, size):
+    """The file-upload path of `update_cookies`, after JSON decoding."""
+    export = state_export(size, fmt)
+    cookies, _local, _session = regression(normalize_state, export)
+    assert len(cookies) == size
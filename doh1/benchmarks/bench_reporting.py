@@ -0,0 +1,35 @@
+import datetime
+
+import pytest
+
+from core.reportable_days import ReportableCalendar
+from core.views import build_calendar, format_log
+
+from generators import SIZES, log_entries, report_results
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_reportable_calendar(regression, size):
+    calendar = regression(ReportableCalendar, datetime.date(2030, 1, 1), size, weekend=(4, 5))
+    assert calendar.days and all(d.weekday() not in (4, 5) for d in calendar.days)
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_report_dates(regression, size):
+    calendar = ReportableCalendar(datetime.date(2030, 1, 1), size * 2, weekend=(4, 5))
+    dates = regression(calendar.next_days, size, datetime.date(2030, 1, 7))
+    assert len(dates) == size
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_format_log(regression, size):
+    entries = log_entries(size)
+    lines = regression(lambda: [format_log(entry) for entry in entries])
+    assert len(lines) == size
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_build_calendar(regression, size):
+    results = report_results(size)
+    months = regression(build_calendar, results)
+    assert sum(1 for m in months for w in m['weeks'] for d in w if d and d['result']) == size
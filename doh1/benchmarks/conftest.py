@@ -0,0 +1,130 @@
+"""
+Micro-benchmarks for the pure-Python hot paths (run from doh1/):
+
+    python -m pytest benchmarks                          # run and report timings
+    python -m pytest benchmarks --bench-compare          # also compare against baseline.json
+    python -m pytest benchmarks --bench-compare --bench-threshold 1.0    # allow 2x before failing
+    python -m pytest benchmarks --bench-update-baseline  # re-record the baseline
+
+With --bench-compare (or DOH1_BENCH_COMPARE=1), a case fails when its
+fastest round is more than `threshold` slower than the recorded fastest
+round (the minimum is the figure least disturbed by scheduler noise).
+
+Timings only compare on the machine that recorded them, so baseline.json is
+not checked in and keeps one set of baselines per machine (host, CPU, Python).
+Record one with --bench-update-baseline before the first --bench-compare;
+cases with no baseline for this machine are skipped.
+"""
+import json
+import os
+import platform
+import sys
+from pathlib import Path
+
+import django
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'doh1.settings')
+django.setup()
+
+BASELINE_FILE = Path(__file__).with_name('baseline.json')
+DEFAULT_THRESHOLD = float(os.environ.get('DOH1_BENCH_THRESHOLD', '0.5'))
+
+_recorded = {}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('auto-reporter baselines')
+    group.addoption('--bench-compare', action='store_true',
+                    default=os.environ.get('DOH1_BENCH_COMPARE') == '1',
+                    help="Fail cases that are slower than baseline.json (or $DOH1_BENCH_COMPARE=1)")
+    group.addoption('--bench-threshold', type=float, default=DEFAULT_THRESHOLD,
+                    help="Allowed slowdown vs. the baseline, as a fraction (default 0.5 "
+                         "or $DOH1_BENCH_THRESHOLD)")
+    group.addoption('--bench-update-baseline', action='store_true',
+                    help="Write this run's minimums to baseline.json instead of comparing")
+
+
+def _cpu_model() -> str:
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def _machine() -> dict:
+    return {
+        'host': platform.node(),
+        'cpu': _cpu_model(),
+        'cpu_count': os.cpu_count(),
+        'system': f"{platform.system()} {platform.machine()}",
+        'python': f"{platform.python_implementation()} {platform.python_version()}",
+    }
+
+
+def _machine_key(machine: dict) -> str:
+    return f"{machine['host']} | {machine['cpu']} x{machine['cpu_count']} | {machine['python']}"
+
+
+def _load_machines() -> dict:
+    try:
+        with open(BASELINE_FILE, encoding='utf-8') as f:
+            return json.load(f).get('machines', {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+@pytest.fixture(scope='session')
+def baseline():
+    return _load_machines().get(_machine_key(_machine()), {}).get('benchmarks', {})
+
+
+@pytest.fixture
+def regression(benchmark, baseline, request):
+    """`benchmark`, plus a check of the fastest round against the recorded baseline."""
+    config = request.config
+
+    def run(fn, *args, **kwargs):
+        result = benchmark(fn, *args, **kwargs)
+        stats = getattr(benchmark.stats, 'stats', None)
+        if stats is None:  # --benchmark-disable
+            return result
+
+        name = request.node.nodeid
+        if config.getoption('--bench-update-baseline'):
+            _recorded[name] = stats.min
+            return result
+        if not config.getoption('--bench-compare'):
+            return result
+
+        expected = baseline.get(name)
+        if expected is None:
+            pytest.skip(f"No baseline for {name} on this machine; record one with --bench-update-baseline")
+
+        threshold = config.getoption('--bench-threshold')
+        if stats.min > expected * (1 + threshold):
+            pytest.fail(
+                f"{name}: min {stats.min * 1e3:.3f} ms is {stats.min / expected - 1:.0%} slower "
+                f"than the baseline {expected * 1e3:.3f} ms (threshold {threshold:.0%})"
+            )
+        return result
+
+    return run
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not _recorded:
+        return
+    machine = _machine()
+    key = _machine_key(machine)
+    machines = _load_machines()
+    merged = {**machines.get(key, {}).get('benchmarks', {}), **_recorded}
+    machines[key] = {'machine': machine, 'benchmarks': dict(sorted(merged.items()))}
+    with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'machines': dict(sorted(machines.items()))}, f, indent=2)
+        f.write('\n')
@@ -0,0 +1,93 @@
+"""
+Deterministic synthetic inputs for the benchmarks, scalable to 10k entries so
+that algorithmic regressions (not just constant factors) show up.
+"""
+import datetime
+import json
+import random
+import uuid
+
+SIZES = [100, 1_000, 10_000]
+
+_JUNK_NAMES = ['_ga', '_gid', '_gat_UA', 'amp_a1b2', '_fbp', 'ai_user', 'ai_session', '_hjSession', '_gcl_au']
+_MSAL_KINDS = ['nonce.id_token', 'request.state', 'authority', 'credential', 'request.params']
+
+
+def _rng(seed: int) -> random.Random:
+    return random.Random(seed)
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+
+def msal_heavy_cookies(n: int, seed: int = 1) -> dict:
+    """~60% transient MSAL artifacts, ~20% analytics junk, the rest session cookies."""
+    rng = _rng(seed)
+    cookies = {}
+    for i in range(n):
+        roll = rng.random()
+        if roll < 0.6:
+            name = f"msal.{_uuid(rng)}.{rng.choice(_MSAL_KINDS)}.{_uuid(rng)}"
+        elif roll < 0.8:
+            name = f"{rng.choice(_JUNK_NAMES)}_{i}"
+        else:
+            name = f"AppCookie{i}"
+        cookies[name] = _uuid(rng)
+    return cookies
+
+
+def state_export(n: int, fmt: str, seed: int = 2):
+    """
+    One session export in a format `update_cookies` accepts, with `n` cookies:
+      'export'  {"cookies": [...], "localStorage": {...}, "sessionStorage": {...}}
+      'list'    EditThisCookie list
+      'plain'   {"name": "value", ...}
+      'header'  raw `Cookie:` header text
+    """
+    rng = _rng(seed)
+    pairs = [(f"c{i}", _uuid(rng).replace('-', '')) for i in range(n)]
+
+    if fmt == 'export':
+        return {
+            'cookies': [{'name': k, 'value': v, 'domain': '.prat.idf.il', 'path': '/'} for k, v in pairs],
+            'localStorage': {f"msal.{_uuid(rng)}": json.dumps({'secret': v}) for _k, v in pairs[: n // 4]},
+            'sessionStorage': {f"s{i}": v for i, (_k, v) in enumerate(pairs[: n // 10])},
+        }
+    if fmt == 'list':
+        return [{'name': k, 'value': v} for k, v in pairs]
+    if fmt == 'plain':
+        return dict(pairs)
+    if fmt == 'header':
+        return '; '.join(f"{k}={v}" for k, v in pairs)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def log_entries(n: int, seed: int = 3) -> list:
+    rng = _rng(seed)
+    levels = ['info', 'info', 'info', 'success', 'warning', 'error']
+    return [
+        {
+            'time': f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}",
+            'level': rng.choice(levels),
+            'msg': f"[SUCCESS] Updated date for [{i % 28 + 1:02d}.01.2030] - it's {_uuid(rng)}",
+        }
+        for i in range(n)
+    ]
+
+
+def report_results(n: int, start: datetime.date = datetime.date(2030, 1, 1), seed: int = 4) -> list:
+    """`n` consecutive days of results, shaped as `view_report_results` passes them to the calendar."""
+    rng = _rng(seed)
+    results = []
+    for i in range(n):
+        d = start + datetime.timedelta(days=i)
+        results.append({
+            'date': d.strftime("%d.%m.%Y"),
+            'dt': d,
+            'success': rng.random() < 0.9,
+            'status': 200,
+            'message': "Reported successfully",
+            'debug': {},
+        })
+    return results
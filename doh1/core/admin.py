@@ -1,3 +1,74 @@
-from django.contrib import admin
+import io
+import zipfile
 
-# Register your models here.
+from django import forms
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+
+from .importers import import_states, iter_ndjson, iter_zip
+from .models import OutboxReport, Soldier
+
+
+class SessionImportForm(forms.Form):
+    export_file = forms.FileField(
+        help_text="A zip of per-soldier exports (file name = personal_id) or an NDJSON file "
+                  "with one export per line keyed by personal_id."
+    )
+    create_missing = forms.BooleanField(required=False, initial=True,
+                                        label="Create soldiers that don't exist yet")
+
+
+@admin.register(Soldier)
+class SoldierAdmin(admin.ModelAdmin):
+    list_display = ('personal_id', 'name', 'last_updated')
+    search_fields = ('personal_id', 'name')
+    exclude = ('_cookies_data', '_local_storage_data', '_session_storage_data')
+    change_list_template = 'admin/core/soldier/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import-sessions/', self.admin_site.admin_view(self.import_sessions_view),
+                 name='core_soldier_import_sessions'),
+        ] + super().get_urls()
+
+    def import_sessions_view(self, request):
+        form = SessionImportForm(request.POST or None, request.FILES or None)
+
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['export_file']
+            if zipfile.is_zipfile(upload):
+                upload.seek(0)
+                records = iter_zip(upload)
+            else:
+                upload.seek(0)
+                records = iter_ndjson(io.TextIOWrapper(upload, encoding='utf-8'), label=upload.name)
+
+            report = import_states(records, create_missing=form.cleaned_data['create_missing'])
+
+            messages.success(request, (
+                f"Processed {report['processed']} records ({report['rows_per_sec']:.0f} rows/s): "
+                f"{report['created']} created, {report['updated']} updated, "
+                f"{len(report['errors'])} errors."
+            ))
+            for label, message in report['errors'][:20]:
+                messages.warning(request, f"{label}: {message}")
+            return redirect(reverse('admin:core_soldier_changelist'))
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': "Import session exports",
+        }
+        return TemplateResponse(request, 'admin/core/soldier/import_sessions.html', context)
+
+
+@admin.register(OutboxReport)
+class OutboxReportAdmin(admin.ModelAdmin):
+    list_display = ('soldier', 'report_date', 'status', 'attempts', 'next_attempt_at', 'last_error')
+    list_filter = ('status',)
+    search_fields = ('soldier__personal_id',)
+    list_select_related = ('soldier',)
+    exclude = ('_payload_data',)
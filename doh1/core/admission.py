@@ -0,0 +1,168 @@
+"""
+Admission control for headless Chrome.
+
+Each browser costs a few hundred MB, so before `refresh_with_selenium` runs it
+must get a slot here. The number of slots is derived from live memory and CPU
+samples; requests beyond it wait in priority lanes (see core.lanes: FIFO per
+class, interactive first) with a timeout, and are told their queue position
+while they wait.
+
+The lanes live in one process, but the web process, every report_worker and
+the refresh service all start browsers. So AUTO_REPORTER_MAX_BROWSERS is also
+enforced machine-wide: each running browser holds one of that many flock(2)'d
+slot files in AUTO_REPORTER_BROWSER_SLOT_DIR, and the process's own lanes only
+admit a waiter once it has one.
+"""
+import fcntl
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .lanes import LaneTimeout, PriorityLanes
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# Kept as the name callers catch; raised by the lanes
+AdmissionTimeout = LaneTimeout
+
+
+def _mem_available() -> Optional[int]:
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open("/proc/meminfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _load_average() -> Optional[float]:
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def sample_resources() -> Dict[str, Optional[float]]:
+    return {
+        'mem_available': _mem_available(),
+        'cpu_count': os.cpu_count() or 1,
+        'load': _load_average(),
+    }
+
+
+class MachineSlots:
+    """`slots` lock files shared by every process on the machine; a held flock is a used slot."""
+
+    def __init__(self, directory: Path, slots: int):
+        self.directory = Path(directory)
+        self.slots = slots
+
+    def try_acquire(self):
+        """An open, locked slot file (close it to release), or None if all are taken."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for i in range(self.slots):
+            f = open(self.directory / f"browser-{i}.lock", "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        return None
+
+
+class BrowserAdmission(PriorityLanes):
+    def __init__(self, max_browsers: int, browser_bytes: int, reserve_bytes: int,
+                 cpus_per_browser: float, sample_interval: float = 1.0, sampler=sample_resources,
+                 background_share: float = None, slot_dir: Optional[Path] = None):
+        # Waiters wake on releases, and every sample_interval to re-sample memory/CPU
+        super().__init__(slots=max_browsers, background_share=background_share, poll_interval=sample_interval)
+        self.max_browsers = max_browsers
+        self.browser_bytes = browser_bytes
+        self.reserve_bytes = reserve_bytes
+        self.cpus_per_browser = cpus_per_browser
+        self.sample_interval = sample_interval
+        self._sampler = sampler
+
+        self._sample = None
+        self._sampled_at = 0.0
+        self._active_at_sample = 0
+
+        self._machine_slots = MachineSlots(slot_dir, max_browsers) if slot_dir else None
+        self._held_slots = {}
+
+    # --- Machine-wide cap ---
+    def _acquire_external(self, waiter) -> bool:
+        if self._machine_slots is None:
+            return True
+        held = self._machine_slots.try_acquire()
+        if held is None:
+            return False  # every slot is used by some process; re-checked every sample_interval
+        self._held_slots[waiter] = held
+        return True
+
+    def _release_external(self, waiter) -> None:
+        held = self._held_slots.pop(waiter, None)
+        if held is not None:
+            held.close()
+
+    # --- Capacity ---
+    def _current_sample(self):
+        now = time.monotonic()
+        if self._sample is None or now - self._sampled_at >= self.sample_interval:
+            self._sample = self._sampler()
+            self._sampled_at = now
+            self._active_at_sample = self.active
+        return self._sample
+
+    def capacity(self) -> int:
+        """How many browsers may run right now (including the ones already running)."""
+        sample = self._current_sample()
+        active = self.active
+        limit = self.max_browsers
+
+        # Memory: running browsers are already out of MemAvailable, so only the
+        # headroom above the reserve decides how many *more* can start. Browsers
+        # started since the sample was taken are not in it yet.
+        if sample['mem_available'] is not None:
+            started_since = max(0, active - self._active_at_sample)
+            headroom = sample['mem_available'] - self.reserve_bytes - started_since * self.browser_bytes
+            limit = min(limit, active + max(0, headroom // self.browser_bytes))
+
+        # CPU: a static cap by core count, and no new browsers while overloaded
+        cpu_count = sample['cpu_count']
+        limit = min(limit, max(1, int(cpu_count / self.cpus_per_browser)))
+        if sample['load'] is not None and sample['load'] > cpu_count:
+            limit = min(limit, active)
+
+        # Never starve completely: one browser may always run on an idle controller
+        return max(int(limit), 1 if active == 0 else 0)
+
+
+_admission: Optional[BrowserAdmission] = None
+_admission_lock = threading.Lock()
+
+
+def get_browser_admission() -> BrowserAdmission:
+    global _admission
+    with _admission_lock:
+        if _admission is None:
+            _admission = BrowserAdmission(
+                max_browsers=settings.AUTO_REPORTER_MAX_BROWSERS,
+                browser_bytes=settings.AUTO_REPORTER_BROWSER_MEMORY_MB * 1024 ** 2,
+                reserve_bytes=settings.AUTO_REPORTER_MEMORY_RESERVE_MB * 1024 ** 2,
+                cpus_per_browser=settings.AUTO_REPORTER_CPUS_PER_BROWSER,
+                slot_dir=settings.AUTO_REPORTER_BROWSER_SLOT_DIR,
+            )
+        return _admission
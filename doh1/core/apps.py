@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Soldier cache invalidation (post_save/post_delete receivers)
+        from . import soldier_cache  # noqa: F401
+
+        # Cheap check only (no downloads): warms the in-process path cache
+        # so the first Selenium refresh doesn't have to resolve the driver.
+        from .driver_cache import check_driver_cache
+        check_driver_cache()
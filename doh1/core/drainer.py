@@ -0,0 +1,139 @@
+"""
+Background drainer for the report outbox (see core.outbox).
+
+Due rows are grouped per soldier and sent over one pooled HTTP client per
+soldier. Clients live for one pass: retries are minutes apart, so keeping them
+would only hold a client for every soldier the drainer ever saw.
+A browser refresh only happens if the stored tokens have actually expired,
+or if upstream answers 401/403.
+"""
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import outbox
+from .fleet import invalidate_rollup
+from .lanes import PRIORITY_BACKGROUND, get_report_lanes
+from .loggers import get_ui_logger
+from .models import OutboxReport, Soldier
+from .services import AUTH_FAILURE_STATUSES, build_client, refresh_session, send_report
+
+logger = get_ui_logger()
+
+
+class OutboxDrainer:
+    def __init__(self, batch: int = 200, concurrency: int = None, max_attempts: int = None):
+        self.batch = batch
+        self.concurrency = concurrency or settings.AUTO_REPORTER_OUTBOX_CONCURRENCY
+        self.max_attempts = max_attempts or settings.AUTO_REPORTER_OUTBOX_MAX_ATTEMPTS
+
+        # soldier id -> (session version it was built from, client)
+        self._clients: Dict[int, Tuple[object, object]] = {}
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    # --- Clients ---
+    def _client_for(self, soldier: Soldier):
+        version = soldier.last_updated
+        with self._lock:
+            cached = self._clients.get(soldier.id)
+            if cached and cached[0] == version:
+                return cached[1]
+            client = build_client(soldier.cookies, soldier.local_storage)
+            self._clients[soldier.id] = (version, client)
+        if cached:
+            cached[1].close()
+        return client
+
+    def close(self) -> None:
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for _version, client in clients.values():
+            client.close()
+
+    # --- Draining ---
+    def drain_once(self) -> Dict[str, float]:
+        """Sends every due row once. Returns this pass's counts and duration."""
+        started = time.monotonic()
+        before = (self.sent, self.retried, self.failed)
+
+        expired = outbox.expire_past_dates()
+        if expired:
+            logger.warning(f"Gave up on {expired} outbox reports whose date has passed.")
+            self._count('failed', expired)
+
+        by_soldier: Dict[int, List[OutboxReport]] = defaultdict(list)
+        for entry in outbox.due_reports(self.batch):
+            by_soldier[entry.soldier_id].append(entry)
+
+        if by_soldier:
+            try:
+                with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="outbox") as executor:
+                    list(executor.map(self._drain_soldier, by_soldier.values()))
+            finally:
+                self.close()
+
+        sent, retried, failed = (now - then for now, then in zip((self.sent, self.retried, self.failed), before))
+        if sent or failed:
+            invalidate_rollup()
+        return {'sent': sent, 'retried': retried, 'failed': failed, 'elapsed': time.monotonic() - started}
+
+    def _drain_soldier(self, entries: List[OutboxReport]) -> None:
+        soldier = entries[0].soldier
+        try:
+            # Same HTTP lanes as report runs, behind interactive users
+            with get_report_lanes().slot(PRIORITY_BACKGROUND):
+                self._send_entries(soldier, entries)
+        except Exception as e:
+            logger.warning(f"Outbox drain for {soldier.personal_id} crashed: {e}")
+        finally:
+            connection.close()
+
+    def _send_entries(self, soldier: Soldier, entries: List[OutboxReport]) -> None:
+        expires_at = soldier.session_expires_at
+        refreshed = False
+        if expires_at is not None and expires_at <= timezone.now():
+            logger.info(f"Session of {soldier.personal_id} expired at {expires_at:%H:%M}; refreshing before resend.")
+            refresh_session(soldier, PRIORITY_BACKGROUND)
+            refreshed = True
+
+        client = self._client_for(soldier)
+        delivered = []
+        for i, entry in enumerate(entries):
+            result = send_report(client, entry.report_date, entry.payload)
+
+            if result['status'] in AUTH_FAILURE_STATUSES and not refreshed:
+                refreshed = True
+                if refresh_session(soldier, PRIORITY_BACKGROUND):
+                    client = self._client_for(soldier)
+                    result = send_report(client, entry.report_date, entry.payload)
+
+            if result['success']:
+                delivered.append(entry)
+            elif outbox.is_transport_failure(result):
+                # Upstream is still down: back off this soldier's remaining rows without trying them
+                for pending in entries[i:]:
+                    if outbox.mark_retry(pending, result['message'], self.max_attempts):
+                        self._count('retried')
+                    else:
+                        self._count('failed')
+                break
+            else:
+                outbox.mark_failed(entry, result['message'])
+                self._count('failed')
+
+        if delivered:
+            outbox.mark_sent(delivered)
+            self._count('sent', len(delivered))
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
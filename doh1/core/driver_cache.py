@@ -0,0 +1,151 @@
+import json
+import os
+import shutil
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+# --- Constants ---
+CHROMEDRIVER_NAME = "chromedriver"
+CHROME_BINARY_NAMES = (
+    "google-chrome", "google-chrome-stable",
+    "chromium", "chromium-browser", "chrome",
+)
+
+# In-process memo so we only touch the disk once per process
+_resolved_paths: Optional[Dict[str, Optional[str]]] = None
+
+
+def _cache_file() -> Path:
+    return Path(settings.DRIVER_CACHE_FILE)
+
+
+def _paths_exist(paths: Dict[str, Optional[str]]) -> bool:
+    """A cache entry is only valid while the binaries it points to are still there."""
+    driver_path = paths.get("driver_path")
+    if not driver_path or not os.path.exists(driver_path):
+        return False
+    chrome_binary = paths.get("chrome_binary")
+    return chrome_binary is None or os.path.exists(chrome_binary)
+
+
+def load_cached_paths() -> Optional[Dict[str, Optional[str]]]:
+    """Reads the on-disk cache. Returns None if it is missing, corrupt or stale."""
+    try:
+        with open(_cache_file(), encoding="utf-8") as f:
+            paths = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(paths, dict) or not _paths_exist(paths):
+        return None
+    return paths
+
+
+def _save_cached_paths(paths: Dict[str, Optional[str]]) -> None:
+    cache_file = _cache_file()
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(paths, f)
+        # Atomic swap so concurrent workers never read a half-written file
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logger.warning(f"Could not write driver cache {cache_file}: {e}")
+
+
+def _resolve_paths() -> Dict[str, Optional[str]]:
+    """
+    The slow path: asks webdriver-manager, then Selenium Manager, then $PATH.
+    Only runs when there is no usable cache entry.
+    """
+    driver_path = None
+    chrome_binary = None
+
+    # 1. webdriver-manager (optional dependency, may download a driver)
+    try:
+        from webdriver_manager.chrome import ChromeDriverManager
+        driver_path = ChromeDriverManager().install()
+    except ImportError:
+        pass
+    except Exception as e:
+        logger.warning(f"ChromeDriverManager failed: {e}")
+
+    # 2. Selenium Manager (bundled with selenium >= 4.20)
+    if not driver_path:
+        try:
+            from selenium.webdriver.chrome.options import Options
+            from selenium.webdriver.chrome.service import Service
+            from selenium.webdriver.common.driver_finder import DriverFinder
+
+            finder = DriverFinder(Service(), Options())
+            driver_path = finder.get_driver_path()
+            chrome_binary = finder.get_browser_path() or None
+        except Exception as e:
+            logger.warning(f"Selenium Manager lookup failed: {e}")
+
+    # 3. Plain $PATH lookup
+    if not driver_path:
+        driver_path = shutil.which(CHROMEDRIVER_NAME)
+    if not chrome_binary:
+        chrome_binary = next(filter(None, map(shutil.which, CHROME_BINARY_NAMES)), None)
+
+    return {"driver_path": driver_path, "chrome_binary": chrome_binary}
+
+
+def get_driver_paths() -> Dict[str, Optional[str]]:
+    """
+    Returns {'driver_path': ..., 'chrome_binary': ...}.
+    Resolved once, then served from memory / disk on every later call.
+    """
+    global _resolved_paths
+
+    if _resolved_paths is not None:
+        return _resolved_paths
+
+    paths = load_cached_paths()
+    if paths is None:
+        logger.info("Resolving chromedriver / Chrome binary paths...")
+        paths = _resolve_paths()
+        if paths.get("driver_path"):
+            _save_cached_paths(paths)
+
+    _resolved_paths = paths
+    return paths
+
+
+def invalidate_driver_paths() -> None:
+    """Drops the cache, e.g. after Chrome auto-updated and the driver no longer matches."""
+    global _resolved_paths
+    _resolved_paths = None
+    try:
+        _cache_file().unlink()
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not remove driver cache: {e}")
+
+
+def check_driver_cache() -> bool:
+    """
+    Startup check (see CoreConfig.ready). Never resolves or downloads anything,
+    it only validates what is already cached so the first refresh is fast.
+    """
+    global _resolved_paths
+
+    paths = load_cached_paths()
+    if paths is None:
+        logger.info(
+            f"No valid driver cache at {_cache_file()}. "
+            "Paths will be resolved on the first Selenium refresh."
+        )
+        return False
+
+    _resolved_paths = paths
+    return True
@@ -0,0 +1,133 @@
+"""
+Fleet overview: per-soldier status via annotations (a constant number of
+queries per page, no JSON parsing) and fleet-wide totals from a cached rollup.
+A finished run only drops the cached rollup; the next page load recomputes it,
+so a busy worker fleet costs one recompute per page view, not one per run.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import OutboxReport, ReportedDay, ReportRun, Soldier
+
+logger = logging.getLogger(__name__)
+
+
+ROLLUP_CACHE_KEY = 'fleet:rollup'
+# Finished runs drop the rollup; the timeout only bounds how stale "stale
+# sessions" can get on a day nothing runs (sessions expire without a write).
+ROLLUP_CACHE_TIMEOUT = 15 * 60
+
+
+def stale_threshold() -> datetime.datetime:
+    """Sessions expiring before this are stale: the next foreground run would need a browser."""
+    return timezone.now() + datetime.timedelta(minutes=settings.AUTO_REPORTER_FOREGROUND_REFRESH_MARGIN_MINUTES)
+
+
+def _parse_report_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.datetime.strptime(value, "%d.%m.%Y").date()
+    except (TypeError, ValueError):
+        return None
+
+
+# ---------------------------------------------------------
+# WRITE SIDE (called when a run finishes)
+# ---------------------------------------------------------
+
+def record_run(soldier: Soldier, results, source: str = ReportRun.SOURCE_INTERACTIVE) -> ReportRun:
+    """Stores the run, marks the accepted dates and drops the cached rollup."""
+    ok_dates = {_parse_report_date(r.get('date')) for r in results if r.get('success')}
+    ok_dates.discard(None)
+
+    run = ReportRun.objects.create(
+        soldier=soldier,
+        source=source,
+        success=bool(results) and len(ok_dates) == len(results),
+        days_ok=len(ok_dates),
+        days_total=len(results),
+    )
+    ReportedDay.objects.bulk_create(
+        [ReportedDay(soldier=soldier, date=d) for d in ok_dates],
+        ignore_conflicts=True,
+    )
+    invalidate_rollup()
+    return run
+
+
+def invalidate_rollup() -> None:
+    # After commit, so a page load in between can't cache totals without this run
+    transaction.on_commit(lambda: cache.delete(ROLLUP_CACHE_KEY))
+
+
+def update_rollup() -> dict:
+    rollup = compute_rollup()
+    cache.set(ROLLUP_CACHE_KEY, rollup, ROLLUP_CACHE_TIMEOUT)
+    return rollup
+
+
+# ---------------------------------------------------------
+# READ SIDE
+# ---------------------------------------------------------
+
+def compute_rollup() -> dict:
+    """Three aggregate queries, all served by indexes."""
+    start_of_today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    runs = ReportRun.objects.filter(finished_at__gte=start_of_today).aggregate(
+        soldiers_run=Count('soldier', distinct=True),
+        soldiers_ok=Count('soldier', distinct=True, filter=Q(success=True)),
+    )
+    soldiers = Soldier.objects.aggregate(
+        total=Count('id'),
+        stale=Count('id', filter=Q(session_expires_at__isnull=True) | Q(session_expires_at__lt=stale_threshold())),
+    )
+
+    soldiers_run = runs['soldiers_run'] or 0
+    return {
+        'soldiers_total': soldiers['total'] or 0,
+        'soldiers_stale': soldiers['stale'] or 0,
+        'soldiers_run_today': soldiers_run,
+        'soldiers_ok_today': runs['soldiers_ok'] or 0,
+        'success_rate_today': (runs['soldiers_ok'] or 0) / soldiers_run if soldiers_run else None,
+        'outbox_pending': OutboxReport.objects.filter(status=OutboxReport.STATUS_PENDING).count(),
+        'computed_at': timezone.now(),
+    }
+
+
+def get_rollup() -> dict:
+    rollup = cache.get(ROLLUP_CACHE_KEY)
+    if rollup is None:
+        rollup = update_rollup()
+    return rollup
+
+
+def fleet_queryset():
+    """Every column the fleet table needs, as annotations on one query."""
+    last_run = ReportRun.objects.filter(soldier=OuterRef('pk')).order_by('-finished_at')
+    days_reported = (
+        ReportedDay.objects.filter(soldier=OuterRef('pk'))
+        .order_by().values('soldier').annotate(n=Count('*')).values('n')
+    )
+
+    return (
+        Soldier.objects
+        # Never load the JSON blobs for a listing
+        .only('id', 'personal_id', 'name', 'session_expires_at')
+        .annotate(
+            last_run_at=Subquery(last_run.values('finished_at')[:1]),
+            last_run_success=Subquery(last_run.values('success')[:1]),
+            last_run_days_ok=Subquery(last_run.values('days_ok')[:1]),
+            last_run_days_total=Subquery(last_run.values('days_total')[:1]),
+            days_reported=Coalesce(Subquery(days_reported, output_field=IntegerField()), Value(0)),
+        )
+        .order_by('personal_id')
+    )
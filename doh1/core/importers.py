@@ -0,0 +1,242 @@
+"""
+Session-state import: one normalizer for every export format, plus a bulk
+path that reads zips, directories and NDJSON streams record by record and
+writes soldiers in batches.
+"""
+import io
+import json
+import sys
+import time
+import zipfile
+from http.cookies import SimpleCookie
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .models import Soldier
+from .soldier_cache import invalidate_all_soldiers
+
+
+EXPORT_SUFFIXES = ('.json', '.txt')
+DEFAULT_BATCH_SIZE = 500
+STATE_FIELDS = [
+    '_cookies_data', '_local_storage_data', '_session_storage_data',
+    'session_expires_at', 'last_updated',
+]
+
+# (cookies, local_storage, session_storage)
+State = Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]
+# (label for error messages, personal_id, export data or the exception that broke it)
+Record = Tuple[str, str, Any]
+
+
+# ---------------------------------------------------------
+# NORMALIZATION (shared by the dashboard and the bulk path)
+# ---------------------------------------------------------
+
+def _cookie_list_to_dict(cookies) -> Dict[str, str]:
+    return {c['name']: c['value'] for c in cookies}
+
+def normalize_state(json_data: Any) -> State:
+    """
+    Accepts any supported export shape:
+      * {"cookies": [...] or {...}, "localStorage": {...}, "sessionStorage": {...}}
+      * [{"name": ..., "value": ...}, ...]   (EditThisCookie)
+      * {"name": "value", ...}               (plain cookie dict)
+    """
+    if isinstance(json_data, dict) and "cookies" in json_data:
+        cookies = json_data["cookies"]
+        if isinstance(cookies, list):
+            cookies = _cookie_list_to_dict(cookies)
+        return (
+            dict(cookies or {}),
+            dict(json_data.get("localStorage") or {}),
+            dict(json_data.get("sessionStorage") or {}),
+        )
+    if isinstance(json_data, list):
+        return _cookie_list_to_dict(json_data), {}, {}
+    if isinstance(json_data, dict):
+        return dict(json_data), {}, {}
+    raise ValueError(f"Unsupported export type: {type(json_data).__name__}")
+
+def parse_state_text(raw_data: str) -> State:
+    """Pasted text: a JSON export, or failing that a raw `Cookie:` header value."""
+    raw_data = raw_data.strip()
+    if raw_data.startswith("{") or raw_data.startswith("["):
+        try:
+            return normalize_state(json.loads(raw_data))
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    cookie_parser = SimpleCookie()
+    cookie_parser.load(raw_data)
+    return {key: morsel.value for key, morsel in cookie_parser.items()}, {}, {}
+
+
+# ---------------------------------------------------------
+# BULK SOURCES (each yields one record at a time)
+# ---------------------------------------------------------
+
+def _split_record(obj: Any, default_id: str = "") -> Tuple[str, Any]:
+    """A bulk record is an export plus `personal_id`, or {"personal_id": ..., "export": {...}}."""
+    if isinstance(obj, dict) and "personal_id" in obj:
+        obj = dict(obj)
+        personal_id = str(obj.pop("personal_id")).strip()
+        return personal_id, obj.pop("export", obj)
+    return default_id, obj
+
+def iter_ndjson(stream: Iterable[str], label: str = "ndjson") -> Iterator[Record]:
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            personal_id, export = _split_record(json.loads(line))
+        except ValueError as e:
+            yield f"{label}:{line_no}", "", e
+            continue
+        yield f"{label}:{line_no}", personal_id, export
+
+def _load_member(label: str, default_id: str, fp) -> Record:
+    try:
+        personal_id, export = _split_record(json.load(io.TextIOWrapper(fp, encoding="utf-8")), default_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        return label, default_id, e
+    return label, personal_id, export
+
+def iter_directory(path: Path) -> Iterator[Record]:
+    """One export per file; the file name (without suffix) is the default personal_id."""
+    for file_path in sorted(Path(path).iterdir()):
+        if file_path.is_file() and file_path.suffix.lower() in EXPORT_SUFFIXES:
+            with open(file_path, "rb") as fp:
+                yield _load_member(file_path.name, file_path.stem, fp)
+
+def iter_zip(file) -> Iterator[Record]:
+    """Zip of per-soldier exports, or of NDJSON files. Members are read one at a time."""
+    with zipfile.ZipFile(file) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            name = Path(info.filename)
+            with archive.open(info) as fp:
+                if name.suffix.lower() == ".ndjson":
+                    yield from iter_ndjson(io.TextIOWrapper(fp, encoding="utf-8"), label=name.name)
+                elif name.suffix.lower() in EXPORT_SUFFIXES:
+                    yield _load_member(name.name, name.stem, fp)
+
+def iter_source(source: str) -> Iterator[Record]:
+    """'-' (stdin NDJSON), a directory, a zip file, or an NDJSON file."""
+    if source == "-":
+        yield from iter_ndjson(sys.stdin, label="stdin")
+        return
+
+    path = Path(source)
+    if path.is_dir():
+        yield from iter_directory(path)
+    elif zipfile.is_zipfile(path):
+        yield from iter_zip(path)
+    else:
+        with open(path, encoding="utf-8") as stream:
+            yield from iter_ndjson(stream, label=path.name)
+
+
+# ---------------------------------------------------------
+# BATCHED WRITES
+# ---------------------------------------------------------
+
+def _write_batch(batch: Dict[str, State], create_missing: bool, report: Dict) -> None:
+    now = timezone.now()
+    existing = set(
+        Soldier.objects.filter(personal_id__in=list(batch)).values_list('personal_id', flat=True)
+    )
+    rows = []
+
+    for personal_id, (cookies, local_storage, session_storage) in batch.items():
+        if personal_id not in existing and not create_missing:
+            report['errors'].append((personal_id, "Unknown personal_id"))
+            continue
+
+        soldier = Soldier(personal_id=personal_id)
+        soldier.cookies = cookies
+        soldier.local_storage = local_storage
+        soldier.session_storage = session_storage
+        # bulk writes skip auto_now, so stamp it ourselves
+        soldier.last_updated = now
+        rows.append(soldier)
+
+    try:
+        with transaction.atomic():
+            # One upsert per batch: much cheaper than bulk_update's per-row CASE expressions
+            Soldier.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['personal_id'],
+                update_fields=STATE_FIELDS,
+            )
+    except DatabaseError:
+        # Isolate the offending row(s) instead of losing the whole batch
+        _write_one_by_one(rows, existing, report)
+        return
+
+    # bulk_create sends no post_save, so drop every cached soldier at once
+    invalidate_all_soldiers()
+
+    updated = sum(1 for soldier in rows if soldier.personal_id in existing)
+    report['updated'] += updated
+    report['created'] += len(rows) - updated
+
+def _write_one_by_one(rows, existing, report: Dict) -> None:
+    for soldier in rows:
+        try:
+            with transaction.atomic():
+                Soldier.objects.update_or_create(
+                    personal_id=soldier.personal_id,
+                    defaults={field: getattr(soldier, field) for field in STATE_FIELDS},
+                )
+            report['updated' if soldier.personal_id in existing else 'created'] += 1
+        except DatabaseError as e:
+            report['errors'].append((soldier.personal_id, f"DB error: {e}"))
+
+def import_states(records: Iterable[Record], batch_size: int = DEFAULT_BATCH_SIZE,
+                  create_missing: bool = True) -> Dict:
+    """
+    Normalizes and writes records in batches. A bad record is reported in
+    `errors` and skipped; it never stops the import.
+    """
+    report = {'processed': 0, 'created': 0, 'updated': 0, 'errors': [], 'elapsed': 0.0, 'rows_per_sec': 0.0}
+    started = time.perf_counter()
+    batch: Dict[str, State] = {}
+
+    for label, personal_id, export in records:
+        report['processed'] += 1
+        if isinstance(export, Exception):
+            report['errors'].append((label, f"Parse error: {export}"))
+            continue
+        if not personal_id:
+            report['errors'].append((label, "Missing personal_id"))
+            continue
+        try:
+            state = normalize_state(export)
+        except (ValueError, KeyError, TypeError) as e:
+            report['errors'].append((label, f"Invalid export: {e}"))
+            continue
+        if not state[0]:
+            report['errors'].append((label, "No cookies in export"))
+            continue
+
+        # Later records for the same soldier win
+        batch.pop(personal_id, None)
+        batch[personal_id] = state
+        if len(batch) >= batch_size:
+            _write_batch(batch, create_missing, report)
+            batch = {}
+
+    if batch:
+        _write_batch(batch, create_missing, report)
+
+    report['elapsed'] = time.perf_counter() - started
+    if report['elapsed']:
+        report['rows_per_sec'] = report['processed'] / report['elapsed']
+    return report
@@ -0,0 +1,176 @@
+"""
+Priority lanes: slots shared by an interactive and a background class.
+
+Interactive waiters are admitted first. While both classes are waiting,
+background still gets `background_share` of the admissions, so a batch
+run is slowed down by users but never starved. Queue waits are recorded
+per class (`stats()`) to tune the share and the capacity.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BACKGROUND = 'background'
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+# Recent waits kept per class for the percentiles in stats()
+WAIT_SAMPLES = 1000
+
+
+class LaneTimeout(Exception):
+    """No slot became free within the timeout."""
+
+
+class PriorityLanes:
+    def __init__(self, slots: int = 1, background_share: float = None, poll_interval: Optional[float] = None):
+        """
+        `slots` is the fixed capacity; subclasses with a dynamic capacity override
+        `capacity()` and set `poll_interval` so waiters re-check it periodically.
+        """
+        self.slots = slots
+        self.background_share = (settings.AUTO_REPORTER_BACKGROUND_MIN_SHARE
+                                  if background_share is None else background_share)
+        self.poll_interval = poll_interval
+
+        self._cond = threading.Condition()
+        self._queues = {p: deque() for p in PRIORITIES}
+        self._active = {p: 0 for p in PRIORITIES}
+        # Admissions made while both classes were waiting, and how many went to background
+        self._contested = 0
+        self._contested_background = 0
+        self._waits = {p: deque(maxlen=WAIT_SAMPLES) for p in PRIORITIES}
+        self._admitted = {p: 0 for p in PRIORITIES}
+        self._max_wait = {p: 0.0 for p in PRIORITIES}
+
+    # --- Capacity ---
+    def capacity(self) -> int:
+        return self.slots
+
+    @property
+    def active(self) -> int:
+        return sum(self._active.values())
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    # --- Hooks for limits held outside this process ---
+    def _acquire_external(self, waiter) -> bool:
+        """Called with the lock held once `waiter` may be admitted; False keeps it waiting."""
+        return True
+
+    def _release_external(self, waiter) -> None:
+        pass
+
+    # --- Policy ---
+    def _next_class(self) -> Optional[str]:
+        interactive, background = self._queues[PRIORITY_INTERACTIVE], self._queues[PRIORITY_BACKGROUND]
+        if interactive and background:
+            owed = self._contested_background + 1 <= self.background_share * (self._contested + 1)
+            return PRIORITY_BACKGROUND if owed else PRIORITY_INTERACTIVE
+        if interactive:
+            return PRIORITY_INTERACTIVE
+        return PRIORITY_BACKGROUND if background else None
+
+    def _position(self, waiter, priority: str) -> int:
+        position = self._queues[priority].index(waiter) + 1
+        if priority == PRIORITY_BACKGROUND:
+            position += len(self._queues[PRIORITY_INTERACTIVE])
+        return position
+
+    # --- Slots ---
+    @contextmanager
+    def slot(self, priority: str = PRIORITY_INTERACTIVE, timeout: Optional[float] = None,
+             on_wait: Optional[Callable[[int, int], None]] = None):
+        """
+        Holds a slot for the duration of the block. While queued,
+        `on_wait(position, queue_length)` is called whenever the position changes.
+        Raises LaneTimeout if no slot frees up in time.
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority}")
+
+        waiter = object()
+        queued_at = time.monotonic()
+        deadline = None if timeout is None else queued_at + timeout
+        last_position = None
+
+        with self._cond:
+            self._queues[priority].append(waiter)
+            try:
+                while not (self._queues[priority][0] is waiter
+                           and self._next_class() == priority
+                           and self.active < self.capacity()
+                           and self._acquire_external(waiter)):
+                    position = self._position(waiter, priority)
+                    if on_wait and position != last_position:
+                        on_wait(position, self.waiting)
+                        last_position = position
+
+                    wait_for = self.poll_interval
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise LaneTimeout(f"No {priority} slot within {timeout:.0f}s")
+                        wait_for = remaining if wait_for is None else min(wait_for, remaining)
+                    self._cond.wait(wait_for)
+            except BaseException:
+                self._queues[priority].remove(waiter)
+                self._cond.notify_all()
+                raise
+
+            if self._queues[PRIORITY_INTERACTIVE] and self._queues[PRIORITY_BACKGROUND]:
+                self._contested += 1
+                self._contested_background += priority == PRIORITY_BACKGROUND
+            self._queues[priority].popleft()
+            self._active[priority] += 1
+            self._record_wait(priority, time.monotonic() - queued_at)
+            self._cond.notify_all()
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._release_external(waiter)
+                self._active[priority] -= 1
+                self._cond.notify_all()
+
+    # --- Wait statistics ---
+    def _record_wait(self, priority: str, seconds: float) -> None:
+        self._waits[priority].append(seconds)
+        self._admitted[priority] += 1
+        self._max_wait[priority] = max(self._max_wait[priority], seconds)
+
+    def stats(self) -> Dict[str, dict]:
+        """Per class: admissions, max wait, and p50/p95 over the recent waits (seconds)."""
+        with self._cond:
+            result = {}
+            for priority in PRIORITIES:
+                waits = sorted(self._waits[priority])
+                result[priority] = {
+                    'admitted': self._admitted[priority],
+                    'active': self._active[priority],
+                    'waiting': len(self._queues[priority]),
+                    'p50_wait': waits[len(waits) // 2] if waits else None,
+                    'p95_wait': waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None,
+                    'max_wait': self._max_wait[priority],
+                }
+            return result
+
+
+_report_lanes: Optional[PriorityLanes] = None
+_report_lanes_lock = threading.Lock()
+
+
+def get_report_lanes() -> PriorityLanes:
+    """Lanes for the HTTP phase of a report run (concurrent soldiers sending reports)."""
+    global _report_lanes
+    with _report_lanes_lock:
+        if _report_lanes is None:
+            _report_lanes = PriorityLanes(slots=settings.AUTO_REPORTER_REPORT_SLOTS)
+        return _report_lanes
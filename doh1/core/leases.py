@@ -0,0 +1,107 @@
+"""
+DB-backed work leases for `manage.py report_worker`.
+
+Claiming is a single conditional UPDATE ("take it if nobody holds a live lease"),
+which is atomic on SQLite as well as on server databases, so any number of
+worker processes on any number of hosts can share one database.
+"""
+import datetime
+import os
+import random
+import socket
+import uuid
+from typing import Optional
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ReportLease, Soldier
+
+
+CLAIM_BATCH = 20
+
+
+def make_owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _claimable(now: datetime.datetime) -> Q:
+    return Q(status=ReportLease.STATUS_PENDING) & (Q(expires_at__isnull=True) | Q(expires_at__lt=now))
+
+
+def ensure_leases(run_date: datetime.date) -> int:
+    """Creates the day's lease rows for every soldier that has a session. Idempotent."""
+    soldier_ids = Soldier.objects.exclude(_cookies_data__in=["", "{}"]).values_list('id', flat=True)
+    ReportLease.objects.bulk_create(
+        [ReportLease(soldier_id=sid, run_date=run_date) for sid in soldier_ids],
+        ignore_conflicts=True,
+    )
+    return ReportLease.objects.filter(run_date=run_date).count()
+
+
+def fail_exhausted(run_date: datetime.date, max_attempts: int, now: datetime.datetime = None) -> int:
+    """
+    Gives up on abandoned leases that already had `max_attempts` claims: their
+    workers died mid-run, so another claim would most likely kill one more.
+    """
+    now = now or timezone.now()
+    return ReportLease.objects.filter(_claimable(now), run_date=run_date, attempts__gte=max_attempts).update(
+        owner="",
+        status=ReportLease.STATUS_FAILED,
+        expires_at=None,
+        finished_at=now,
+        last_error=f"Abandoned by its worker {max_attempts} times; giving up.",
+    )
+
+
+def claim_next(owner: str, run_date: datetime.date, ttl: datetime.timedelta,
+               max_attempts: int) -> Optional[ReportLease]:
+    """Claims one pending (or abandoned) lease for `owner`, or returns None."""
+    now = timezone.now()
+    fail_exhausted(run_date, max_attempts, now)
+    candidates = list(
+        ReportLease.objects.filter(_claimable(now), run_date=run_date, attempts__lt=max_attempts)
+        .order_by('id').values_list('id', flat=True)[:CLAIM_BATCH]
+    )
+    # Spread concurrent workers over the batch instead of all racing for row #1
+    random.shuffle(candidates)
+
+    for lease_id in candidates:
+        claimed = ReportLease.objects.filter(_claimable(now), pk=lease_id, attempts__lt=max_attempts).update(
+            owner=owner,
+            expires_at=now + ttl,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return ReportLease.objects.select_related('soldier').get(pk=lease_id)
+    return None
+
+
+def renew(lease: ReportLease, ttl: datetime.timedelta) -> bool:
+    """Extends a held lease. Returns False if it was lost (expired and reclaimed)."""
+    return bool(
+        ReportLease.objects.filter(
+            pk=lease.pk, owner=lease.owner, status=ReportLease.STATUS_PENDING
+        ).update(expires_at=timezone.now() + ttl)
+    )
+
+
+def release(lease: ReportLease, status: str, error: str = "",
+            retry_after: Optional[datetime.timedelta] = None) -> bool:
+    """
+    Gives the lease back. Finished leases get their final status; a lease
+    released as pending becomes claimable again after `retry_after`.
+    """
+    now = timezone.now()
+    fields = {'owner': "", 'status': status, 'last_error': error}
+    if status == ReportLease.STATUS_PENDING:
+        fields['expires_at'] = now + retry_after if retry_after else None
+    else:
+        fields['expires_at'] = None
+        fields['finished_at'] = now
+
+    return bool(ReportLease.objects.filter(pk=lease.pk, owner=lease.owner).update(**fields))
+
+
+def pending_count(run_date: datetime.date) -> int:
+    return ReportLease.objects.filter(run_date=run_date, status=ReportLease.STATUS_PENDING).count()
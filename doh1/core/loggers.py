@@ -1,11 +1,31 @@
+import asyncio
+import contextvars
 import logging
 import queue
+from contextlib import contextmanager
 from datetime import datetime
 
-class ThreadQueueHandler(logging.Handler):
+# Which stream (if any) the current thread/task is logging for. Set by the worker
+# that runs a report and inherited by code running in a copied context.
+current_log_stream = contextvars.ContextVar('current_log_stream', default=None)
+
+class StreamCaptureMixin:
+    """`capture()` marks everything logged inside it (and in contexts copied from it) as this stream's."""
+
+    @contextmanager
+    def capture(self):
+        token = current_log_stream.set(self)
+        try:
+            yield
+        finally:
+            current_log_stream.reset(token)
+
+
+class ThreadQueueHandler(StreamCaptureMixin, logging.Handler):
     """
     Pushes log records to a queue.
     If allowed_thread_ids is None, it captures logs from ALL threads (Promiscuous Mode).
+    Otherwise it captures those threads plus anything logged inside `capture()`.
     """
     def __init__(self, log_queue, allowed_thread_ids=None):
         super().__init__()
@@ -18,18 +38,48 @@ class ThreadQueueHandler(logging.Handler):
             self.allowed_thread_ids = None
 
     def emit(self, record):
-        # Capture if (Mode is Promiscuous) OR (Thread is explicitly allowed)
-        if self.allowed_thread_ids is None or record.thread in self.allowed_thread_ids:
+        # Capture if (Mode is Promiscuous) OR (Thread is explicitly allowed) OR (Logged for this stream)
+        if (self.allowed_thread_ids is None or record.thread in self.allowed_thread_ids
+                or current_log_stream.get() is self):
             try:
-                log_entry = {
-                    'msg': self.format(record),
-                    'level': record.levelname.lower(),
-                    'time': datetime.now().strftime("%H:%M:%S")
-                }
-                self.log_queue.put(log_entry)
+                self.put(make_log_entry(self.format(record), record.levelname.lower()))
             except Exception:
                 self.handleError(record)
 
+    def put(self, log_entry):
+        self.log_queue.put(log_entry)
+
+
+class AsyncQueueHandler(StreamCaptureMixin, logging.Handler):
+    """
+    Pushes log records to an asyncio.Queue owned by an event loop.
+    Only records logged inside `capture()` (in any thread, as long as the
+    context was carried over) are forwarded, so concurrent streams don't
+    see each other's logs.
+    """
+    def __init__(self, log_queue: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        super().__init__()
+        self.log_queue = log_queue
+        self.loop = loop
+
+    def emit(self, record):
+        if current_log_stream.get() is not self:
+            return
+        try:
+            entry = make_log_entry(self.format(record), record.levelname.lower())
+            # Called from worker threads: hand the entry over to the loop thread
+            self.loop.call_soon_threadsafe(self.log_queue.put_nowait, entry)
+        except Exception:
+            self.handleError(record)
+
+
+def make_log_entry(msg, level='info'):
+    return {
+        'msg': msg,
+        'level': level,
+        'time': datetime.now().strftime("%H:%M:%S")
+    }
+
 # get_ui_logger function remains the same...
 def get_ui_logger():
     logger = logging.getLogger('ui_logger')
@@ -0,0 +1,87 @@
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter: boot Django through the real WSGI entry point
+# and serve the first request (the login page) without any network I/O.
+FIRST_REQUEST_SCRIPT = """
+import time
+t0 = time.perf_counter()
+
+from wsgiref.util import setup_testing_defaults
+from doh1.wsgi import application
+t1 = time.perf_counter()
+
+environ = {'PATH_INFO': '/', 'REQUEST_METHOD': 'GET'}
+setup_testing_defaults(environ)
+status = []
+body = b''.join(application(environ, lambda s, h, e=None: status.append(s)))
+t2 = time.perf_counter()
+
+assert status and status[0].startswith('200'), status
+print(f'{t1 - t0:.6f} {t2 - t1:.6f}')
+"""
+
+
+class Command(BaseCommand):
+    help = "Measures cold-start time of `manage.py check` and of the first HTTP request."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Cold starts per measurement")
+
+    def handle(self, *args, **options):
+        runs = options['runs']
+        if runs < 1:
+            raise CommandError("--runs must be at least 1")
+
+        manage_py = str(settings.BASE_DIR / 'manage.py')
+        check_times = []
+        boot_times = []
+        request_times = []
+
+        for _ in range(runs):
+            # --- 1. manage.py check ---
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, manage_py, 'check'],
+                check=True, capture_output=True, cwd=settings.BASE_DIR
+            )
+            check_times.append(time.perf_counter() - start)
+
+            # --- 2. First request through doh1.wsgi ---
+            proc = subprocess.run(
+                [sys.executable, '-c', FIRST_REQUEST_SCRIPT],
+                check=True, capture_output=True, text=True, cwd=settings.BASE_DIR
+            )
+            boot, first_request = map(float, proc.stdout.split())
+            boot_times.append(boot)
+            request_times.append(first_request)
+
+        self._report("manage.py check (wall)", check_times)
+        self._report("wsgi import + django.setup", boot_times)
+        self._report("first request (GET /)", request_times)
+
+        # Sanity check: the web tier must not pull in the heavy reporting deps
+        proc = subprocess.run(
+            [sys.executable, '-c',
+             "import sys; import doh1.wsgi; import core.views; "
+             "print(' '.join(m for m in ('selenium', 'httpx') if m in sys.modules))"],
+            check=True, capture_output=True, text=True, cwd=settings.BASE_DIR
+        )
+        eager = proc.stdout.strip()
+        if eager:
+            self.stdout.write(self.style.WARNING(f"Imported eagerly at startup: {eager}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("selenium / httpx are not imported at startup."))
+
+    def _report(self, label, samples):
+        ms = [s * 1000 for s in samples]
+        self.stdout.write(
+            f"{label:<28} min {min(ms):8.1f} ms   "
+            f"median {statistics.median(ms):8.1f} ms   max {max(ms):8.1f} ms"
+        )
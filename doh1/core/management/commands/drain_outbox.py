@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core import outbox
+from core.drainer import OutboxDrainer
+
+
+class Command(BaseCommand):
+    help = (
+        "Resends reports upstream never received (the outbox), with exponential backoff. "
+        "Logs drain throughput and queue depth after every pass."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=200, help="Max rows per pass")
+        parser.add_argument('--concurrency', type=int, help="Soldiers drained in parallel")
+        parser.add_argument('--max-attempts', type=int, help="Give up on a row after this many tries")
+        parser.add_argument('--poll', type=float, default=30, help="Max idle wait between passes")
+        parser.add_argument('--once', action='store_true', help="Drain whatever is due now, then exit")
+
+    def handle(self, *args, **options):
+        drainer = OutboxDrainer(
+            batch=options['batch'],
+            concurrency=options['concurrency'],
+            max_attempts=options['max_attempts'],
+        )
+
+        try:
+            while True:
+                close_old_connections()
+                stats = drainer.drain_once()
+                queue = outbox.queue_stats()
+                if stats['sent'] or stats['retried'] or stats['failed'] or options['once']:
+                    self._log_pass(stats, queue)
+
+                if options['once']:
+                    break
+                # A full batch means there is more due right away
+                if stats['sent'] + stats['retried'] + stats['failed'] < options['batch']:
+                    time.sleep(self._idle_wait(queue, options['poll']))
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping.")
+        finally:
+            drainer.close()
+            self.stdout.write(f"Sent {drainer.sent}, retried {drainer.retried}, failed {drainer.failed}.")
+
+    def _log_pass(self, stats, queue):
+        rate = stats['sent'] / stats['elapsed'] if stats['elapsed'] else 0.0
+        oldest = f", oldest {queue['oldest_age'].total_seconds() / 60:.0f} min" if queue['oldest_age'] else ""
+        self.stdout.write(
+            f"Pass: {stats['sent']} sent ({rate:.1f}/s), {stats['retried']} retrying, {stats['failed']} failed "
+            f"in {stats['elapsed']:.1f}s. Queue depth {queue['depth']}{oldest}."
+        )
+
+    @staticmethod
+    def _idle_wait(queue, poll):
+        if queue['next_due'] is None:
+            return poll
+        return max(0.5, min(poll, (queue['next_due'] - timezone.now()).total_seconds()))
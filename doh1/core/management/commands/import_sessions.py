@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importers import DEFAULT_BATCH_SIZE, import_states, iter_source
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-imports session exports keyed by personal_id from a zip, a directory "
+        "or an NDJSON file ('-' reads NDJSON from stdin)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--no-create', action='store_true',
+                            help="Only update existing soldiers; unknown personal_ids are errors")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        try:
+            report = import_states(
+                iter_source(options['source']),
+                batch_size=options['batch_size'],
+                create_missing=not options['no_create'],
+            )
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['source']}: {e}")
+
+        for label, message in report['errors']:
+            self.stderr.write(f"{label}: {message}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {report['processed']} records in {report['elapsed']:.2f}s "
+            f"({report['rows_per_sec']:.0f} rows/s): {report['created']} created, "
+            f"{report['updated']} updated, {len(report['errors'])} errors."
+        ))
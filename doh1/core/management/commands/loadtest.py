@@ -0,0 +1,331 @@
+import importlib.util
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.models import Soldier
+
+
+SOLDIER_PREFIX = "loadtest-"
+STUB_RUNNER = "core.stubs.stub_run_attendance"
+STUB_MARKER = "[STUB] Running attendance"
+DB_ALIAS = "loadtest"
+
+# Access-log lines and the run logs' INFO/DEBUG lines; anything else the server prints goes in the report
+ROUTINE_LOG_LINE = re.compile(r'"[A-Z]+ \S+ HTTP/[\d.]+" \d{3}|^\[(INFO|DEBUG)\] ')
+SERVER_LOG_LINES = 20
+
+
+def _proc_stats(pid):
+    """(threads, rss_bytes) of a process, read from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            status = f.read()
+    except OSError:
+        return None, None
+    threads = re.search(r"^Threads:\s+(\d+)", status, re.M)
+    rss = re.search(r"^VmRSS:\s+(\d+) kB", status, re.M)
+    return (
+        int(threads.group(1)) if threads else None,
+        int(rss.group(1)) * 1024 if rss else None,
+    )
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class ServerSampler(threading.Thread):
+    """Samples the server's thread count and RSS while the test runs."""
+
+    def __init__(self, pid, interval=0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.threads = []
+        self.rss = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            threads, rss = _proc_stats(self.pid)
+            if threads is not None:
+                self.threads.append(threads)
+            if rss is not None:
+                self.rss.append(rss)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests the streaming /run/ endpoint: logs in N synthetic soldiers and "
+        "opens concurrent report streams against the stub reporting backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi',
+                            help="Start doh1.wsgi (runserver) or doh1.asgi (uvicorn/daphne)")
+        parser.add_argument('--url', help="Target an already running server instead of starting one. "
+                                          f"It must run with DOH1_REPORT_RUNNER={STUB_RUNNER} on --db")
+        parser.add_argument('--db', help="With --url: the (non-default) SQLite DB that server uses; "
+                                         "the synthetic soldiers are seeded there")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, help="Concurrent streams (defaults to --users)")
+        parser.add_argument('--stub-delay', type=float, default=2.0,
+                            help="Seconds the stub backend takes per soldier")
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep the synthetic soldiers (and the temporary DB) afterwards")
+
+    def handle(self, *args, **options):
+        import httpx
+
+        users = options['users']
+        concurrency = options['concurrency'] or users
+        if users < 1 or concurrency < 1:
+            raise CommandError("--users and --concurrency must be positive")
+
+        # A server we start gets its own throwaway DB and cache. An external one
+        # (--url) must be a test deployment on its own DB, which is where we seed.
+        if options['url']:
+            self._check_external_db(options['db'])
+        elif options['db']:
+            raise CommandError("--db only applies with --url")
+        self.tmp_dir = None if options['url'] else tempfile.mkdtemp(prefix='doh1-loadtest-')
+        self.server_log = None
+        db_alias = self._setup_db(options['db'] or os.path.join(self.tmp_dir, 'db.sqlite3'))
+
+        personal_ids = self._seed_soldiers(users, db_alias)
+        server = None
+        sampler = None
+
+        try:
+            if options['url']:
+                base_url = options['url'].rstrip('/')
+            else:
+                server = self._start_server(options['server'], options['port'], options['stub_delay'], db_alias)
+                base_url = f"http://127.0.0.1:{options['port']}"
+                sampler = ServerSampler(server.pid)
+                sampler.start()
+
+            # --- 1. Log everyone in through login_view ---
+            clients = [httpx.Client(base_url=base_url, timeout=120.0) for _ in personal_ids]
+            with ThreadPoolExecutor(max_workers=min(concurrency, 32)) as pool:
+                logins = list(pool.map(self._login, clients, personal_ids))
+            login_errors = logins.count(False)
+
+            if options['url']:
+                self._check_stub_backend(next((c for c, ok in zip(clients, logins) if ok), None))
+
+            # --- 2. Concurrent streaming runs ---
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                runs = list(pool.map(self._stream_run, [c for c, ok in zip(clients, logins) if ok]))
+            wall = time.perf_counter() - started
+
+            for client in clients:
+                client.close()
+        finally:
+            if sampler:
+                sampler.stop()
+            if server:
+                server.terminate()
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+            server_log = self._read_server_log()
+            if options['keep']:
+                if self.tmp_dir:
+                    self.stdout.write(f"Kept the load-test DB and server log in {self.tmp_dir}")
+            else:
+                Soldier.objects.using(db_alias).filter(personal_id__startswith=SOLDIER_PREFIX).delete()
+                connections[db_alias].close()
+                if self.tmp_dir:
+                    shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+        self._report(options, users, concurrency, login_errors, runs, wall, sampler, server, server_log)
+
+    # --- Setup ---
+    def _check_external_db(self, path):
+        if not path:
+            raise CommandError(f"--url needs --db: the test server's own DB (never the default one); "
+                               f"run that server with DOH1_DB_PATH=<db> DOH1_REPORT_RUNNER={STUB_RUNNER}")
+        if os.path.abspath(path) == os.path.abspath(connections.settings['default']['NAME']):
+            raise CommandError("--db must not be the default DB: the load test seeds synthetic soldiers into it")
+
+    def _setup_db(self, path):
+        connections.settings[DB_ALIAS] = dict(connections.settings['default'], NAME=path)
+        call_command('migrate', database=DB_ALIAS, verbosity=0)
+        return DB_ALIAS
+
+    def _check_stub_backend(self, client):
+        """One run before the real ones: an external target must report through the stub, not upstream."""
+        if client is None:
+            raise CommandError("No synthetic soldier could log in to the target")
+        with client.stream('GET', '/run/') as response:
+            body = response.read().decode('utf-8', 'replace')
+        if STUB_MARKER not in body:
+            raise CommandError(f"The target is not running the stub backend; start it with "
+                               f"DOH1_REPORT_RUNNER={STUB_RUNNER}")
+
+    def _seed_soldiers(self, users, db_alias):
+        personal_ids = [f"{SOLDIER_PREFIX}{i:05d}" for i in range(users)]
+        soldiers = Soldier.objects.using(db_alias)
+        existing = set(
+            soldiers.filter(personal_id__in=personal_ids).values_list('personal_id', flat=True)
+        )
+        soldiers.bulk_create([
+            Soldier(personal_id=pid, _cookies_data='{"AppCookie": "loadtest"}')
+            for pid in personal_ids if pid not in existing
+        ])
+        return personal_ids
+
+    def _start_server(self, kind, port, stub_delay, db_alias):
+        env = dict(os.environ, DOH1_REPORT_RUNNER=STUB_RUNNER, DOH1_STUB_DELAY=str(stub_delay))
+        env.pop('DOH1_STUB_LOG', None)
+        env['DOH1_DB_PATH'] = str(connections.settings[db_alias]['NAME'])
+        # Never the developer's cache: its entries describe a different DB
+        env['DOH1_CACHE_DIR'] = os.path.join(self.tmp_dir, 'cache')
+
+        if kind == 'wsgi':
+            # runserver serves settings.WSGI_APPLICATION (doh1.wsgi.application), one thread per request
+            cmd = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+        elif importlib.util.find_spec('uvicorn'):
+            cmd = [sys.executable, '-m', 'uvicorn', 'doh1.asgi:application',
+                   '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+        elif importlib.util.find_spec('daphne'):
+            cmd = [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), 'doh1.asgi:application']
+        else:
+            raise CommandError("--server asgi needs uvicorn or daphne installed")
+
+        # A file, not a pipe: nobody reads it during the run and a full pipe would stall the server
+        self.server_log = os.path.join(self.tmp_dir, 'server.log')
+        with open(self.server_log, 'w', encoding='utf-8') as log:
+            server = subprocess.Popen(cmd, env=env, cwd=settings.BASE_DIR,
+                                      stdout=log, stderr=subprocess.STDOUT)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"Server exited early with code {server.returncode}:\n"
+                                   + "\n".join(self._read_server_log()))
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                    return server
+            except OSError:
+                time.sleep(0.2)
+
+        server.kill()
+        raise CommandError("Server did not start listening within 30s")
+
+    # --- Per-user actions ---
+    def _login(self, client, personal_id):
+        try:
+            client.get('/')
+            response = client.post('/', data={
+                'personal_id': personal_id,
+                'csrfmiddlewaretoken': client.cookies.get('csrftoken', ''),
+            }, headers={'Referer': f"{client.base_url}/"})
+            return response.status_code == 302
+        except Exception as e:
+            self.stderr.write(f"Login failed for {personal_id}: {e}")
+            return False
+
+    def _stream_run(self, client):
+        result = {'ok': False, 'ttfb': None, 'duration': None, 'error': ""}
+        start = time.perf_counter()
+        try:
+            with client.stream('GET', '/run/') as response:
+                chunks = []
+                for chunk in response.iter_raw():
+                    if result['ttfb'] is None:
+                        result['ttfb'] = time.perf_counter() - start
+                    chunks.append(chunk)
+            body = b''.join(chunks).decode('utf-8', 'replace')
+            result['duration'] = time.perf_counter() - start
+
+            if response.status_code != 200:
+                result['error'] = f"HTTP {response.status_code}"
+            elif "/report/view/" not in body:
+                result['error'] = "stream ended without redirect"
+            elif "Error: " in body:
+                result['error'] = "run reported an error"
+            else:
+                result['ok'] = True
+        except Exception as e:
+            result['error'] = str(e)
+        return result
+
+    # --- Output ---
+    def _read_server_log(self):
+        """The server's output minus the routine lines."""
+        if not self.server_log:
+            return []
+        try:
+            with open(self.server_log, encoding='utf-8', errors='replace') as f:
+                return [line.rstrip() for line in f if line.strip() and not ROUTINE_LOG_LINE.search(line)]
+        except OSError:
+            return []
+
+    def _report(self, options, users, concurrency, login_errors, runs, wall, sampler, server, server_log):
+        ttfb = [r['ttfb'] * 1000 for r in runs if r['ttfb'] is not None]
+        durations = [r['duration'] for r in runs if r['duration'] is not None]
+        errors = [r for r in runs if not r['ok']] + [None] * login_errors
+        attempted = len(runs) + login_errors
+
+        target = options['url'] or f"doh1.{options['server']}"
+        self.stdout.write(f"Target: {target}   users: {users}   concurrency: {concurrency}")
+        if ttfb:
+            self.stdout.write(
+                f"TTFB (ms)        p50 {_percentile(ttfb, 50):8.1f}   p95 {_percentile(ttfb, 95):8.1f}   "
+                f"max {max(ttfb):8.1f}"
+            )
+        if durations:
+            self.stdout.write(
+                f"Stream (s)       p50 {_percentile(durations, 50):8.2f}   p95 {_percentile(durations, 95):8.2f}   "
+                f"max {max(durations):8.2f}   mean {statistics.mean(durations):.2f}"
+            )
+        self.stdout.write(f"Wall time        {wall:.2f} s")
+        if sampler and sampler.threads:
+            self.stdout.write(
+                f"Server threads   max {max(sampler.threads)}   mean {statistics.mean(sampler.threads):.1f}"
+            )
+        if sampler and sampler.rss:
+            self.stdout.write(f"Server RSS       max {max(sampler.rss) / 1024 ** 2:.1f} MB")
+
+        error_rate = len(errors) / attempted if attempted else 0.0
+        style = self.style.SUCCESS if not errors else self.style.ERROR
+        self.stdout.write(style(f"Errors           {len(errors)}/{attempted} ({error_rate:.1%})"))
+        for message in sorted({r['error'] for r in errors if r})[:5]:
+            self.stdout.write(f"  - {message}")
+
+        if server_log:
+            if not errors:
+                hint = "" if options['keep'] else " (--keep to inspect)"
+                self.stdout.write(f"Server output    {len(server_log)} line(s){hint}")
+                return
+            self.stdout.write(self.style.WARNING(
+                f"Server output    {len(server_log)} line(s), last {min(len(server_log), SERVER_LOG_LINES)}:"
+            ))
+            for line in server_log[-SERVER_LOG_LINES:]:
+                self.stdout.write(f"  {line}")
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.refresh_service import DEFAULT_REFRESH_FUNCTION, RefreshService, run_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs browser refreshes for the web process (AUTO_REPORTER_REFRESH_MODE='service') "
+        "on a fixed pool of worker processes behind a Unix socket, recycling workers "
+        "after N refreshes or above an RSS threshold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=str(settings.AUTO_REPORTER_REFRESH_SOCKET))
+        parser.add_argument('--workers', type=int, help="Worker processes (browsers at most)")
+        parser.add_argument('--max-refreshes', type=int, help="Recycle a worker after this many refreshes")
+        parser.add_argument('--max-rss-mb', type=int, help="Recycle a worker whose session uses more memory")
+        parser.add_argument('--refresh-function', default=DEFAULT_REFRESH_FUNCTION,
+                            help="Dotted path of the refresh function workers run")
+        parser.add_argument('--worker', action='store_true', help="(internal) run as a pool worker")
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            run_worker(options['refresh_function'])
+            return
+
+        service = RefreshService(
+            workers=options['workers'],
+            max_refreshes=options['max_refreshes'],
+            max_rss_bytes=options['max_rss_mb'] * 1024 ** 2 if options['max_rss_mb'] else None,
+            refresh_function=options['refresh_function'],
+        )
+        self.stdout.write(
+            f"Refresh service on {options['socket']}: {service.workers} workers, recycled after "
+            f"{service.max_refreshes} refreshes or {service.max_rss_bytes // 1024 ** 2} MB."
+        )
+        self.stdout.flush()
+        try:
+            service.serve_forever(options['socket'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping.")
+        finally:
+            service.close()
+            self.stdout.write(f"Stats: {dict(service.stats)}")
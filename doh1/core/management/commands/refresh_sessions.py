@@ -0,0 +1,55 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.refresher import SessionRefresher
+
+
+class Command(BaseCommand):
+    help = (
+        "Background session refresher: re-runs the Selenium refresh shortly before "
+        "each soldier's tokens expire, preferring off-peak hours, under a concurrency cap."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help="Max browsers at once")
+        parser.add_argument('--lead-minutes', type=float, help="Refresh this long before expiry (peak hours)")
+        parser.add_argument('--off-peak-lead-hours', type=float, help="Refresh window during off-peak hours")
+        parser.add_argument('--reload', type=float, default=60, help="Seconds between queue reloads from the DB")
+        parser.add_argument('--once', action='store_true', help="Refresh whatever is due now, then exit")
+
+    def handle(self, *args, **options):
+        refresher = SessionRefresher(
+            concurrency=options['concurrency'],
+            lead=datetime.timedelta(minutes=options['lead_minutes']) if options['lead_minutes'] else None,
+            off_peak_lead=(datetime.timedelta(hours=options['off_peak_lead_hours'])
+                           if options['off_peak_lead_hours'] else None),
+        )
+
+        try:
+            if options['once']:
+                self._run_once(refresher)
+            else:
+                self._run_forever(refresher, options['reload'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping; waiting for running refreshes...")
+        finally:
+            refresher.shutdown(wait=True)
+            self.stdout.write(f"Refreshed {refresher.refreshed} sessions, {refresher.failed} failed.")
+
+    def _run_once(self, refresher):
+        refresher.reload()
+        while refresher.tick() or refresher.running:
+            refresher.wait_running(timeout=1)
+
+    def _run_forever(self, refresher, reload_every):
+        next_reload = 0.0
+        while True:
+            if time.monotonic() >= next_reload:
+                queued = refresher.reload()
+                next_reload = time.monotonic() + reload_every
+                self.stdout.write(f"{queued} sessions tracked, {refresher.running} refreshing.")
+
+            refresher.tick()
+            time.sleep(max(0.5, min(refresher.seconds_until_next(), next_reload - time.monotonic(), 30)))
@@ -0,0 +1,106 @@
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core import leases
+from core.models import ReportLease, ReportRun
+from core.services import RunAbandoned, run_report, send_guard
+
+
+class Command(BaseCommand):
+    help = (
+        "Claims soldiers through DB leases and reports attendance for them. "
+        "Run as many workers as you like, on one or several hosts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Run date (YYYY-MM-DD), defaults to today")
+        parser.add_argument('--ttl', type=float, default=300, help="Lease length in seconds")
+        parser.add_argument('--max-attempts', type=int, default=3)
+        parser.add_argument('--retry-delay', type=float, default=60, help="Seconds before a failed soldier is retried")
+        parser.add_argument('--poll', type=float, default=5, help="Idle wait between claim attempts")
+        parser.add_argument('--runner', default=settings.AUTO_REPORTER_RUNNER,
+                            help="Dotted path of the per-soldier report function")
+        parser.add_argument('--exit-when-done', action='store_true',
+                            help="Exit once the day has no pending leases left")
+
+    def handle(self, *args, **options):
+        try:
+            run_date = datetime.date.fromisoformat(options['date']) if options['date'] else timezone.localdate()
+        except ValueError:
+            raise CommandError("--date must be YYYY-MM-DD")
+
+        runner = import_string(options['runner'])
+        ttl = datetime.timedelta(seconds=options['ttl'])
+        retry_delay = datetime.timedelta(seconds=options['retry_delay'])
+        owner = leases.make_owner_id()
+
+        total = leases.ensure_leases(run_date)
+        self.stdout.write(f"[{owner}] {total} leases for {run_date}.")
+
+        processed = 0
+        while True:
+            close_old_connections()
+            lease = leases.claim_next(owner, run_date, ttl, options['max_attempts'])
+
+            if lease is None:
+                if options['exit_when_done'] and leases.pending_count(run_date) == 0:
+                    break
+                time.sleep(options['poll'])
+                continue
+
+            self._run_lease(lease, runner, ttl, retry_delay, options['max_attempts'])
+            processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"[{owner}] Done. Processed {processed} soldiers."))
+
+    def _run_lease(self, lease, runner, ttl, retry_delay, max_attempts):
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(lease, ttl, stop, lost), daemon=True)
+        heartbeat.start()
+        # Once the lease is gone the soldier belongs to another worker: send nothing more
+        guard = send_guard.set(lambda: not lost.is_set())
+
+        try:
+            results, _db_updated = run_report(lease.soldier, ReportRun.SOURCE_WORKER, runner)
+            if lost.is_set():
+                # The new owner's outcome is the one that counts; don't overwrite it
+                self.stderr.write(f"{lease.soldier.personal_id}: lease lost during the run; not recording it.")
+                return
+            failed = [r.get('date') for r in results if not r.get('success')]
+            error = f"Failed dates: {', '.join(map(str, failed))}" if failed else ""
+            leases.release(lease, ReportLease.STATUS_DONE, error)
+            self.stdout.write(f"{lease.soldier.personal_id}: {len(results) - len(failed)}/{len(results)} days reported.")
+        except RunAbandoned as e:
+            self.stderr.write(f"{lease.soldier.personal_id}: lease lost before sending. {e}")
+        except Exception as e:
+            if lost.is_set():
+                self.stderr.write(f"{lease.soldier.personal_id}: attempt {lease.attempts} failed after losing the lease: {e}")
+                return
+            if lease.attempts >= max_attempts:
+                leases.release(lease, ReportLease.STATUS_FAILED, str(e))
+            else:
+                leases.release(lease, ReportLease.STATUS_PENDING, str(e), retry_after=retry_delay)
+            self.stderr.write(f"{lease.soldier.personal_id}: attempt {lease.attempts} failed: {e}")
+        finally:
+            send_guard.reset(guard)
+            stop.set()
+            heartbeat.join()
+
+    def _heartbeat(self, lease, ttl, stop, lost):
+        """Keeps the lease alive while the (possibly slow) Selenium run is going; sets `lost` if it can't."""
+        try:
+            while not stop.wait(ttl.total_seconds() / 3):
+                if not leases.renew(lease, ttl):
+                    lost.set()
+                    self.stderr.write(f"Lost lease for {lease.soldier.personal_id} (expired and reclaimed).")
+                    return
+        finally:
+            connection.close()
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('owner', models.CharField(blank=True, default='', max_length=100)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('soldier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leases', to='core.soldier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run_date', 'status', 'expires_at'], name='core_report_run_dat_650675_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reportlease',
+            constraint=models.UniqueConstraint(fields=('soldier', 'run_date'), name='unique_lease_per_soldier_day'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_reportlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportedDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('reported_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReportRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(default='interactive', max_length=20)),
+                ('finished_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('success', models.BooleanField(default=False)),
+                ('days_ok', models.PositiveSmallIntegerField(default=0)),
+                ('days_total', models.PositiveSmallIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='soldier',
+            index=models.Index(fields=['last_updated'], name='core_soldie_last_up_f3f2d5_idx'),
+        ),
+        migrations.AddField(
+            model_name='reportrun',
+            name='soldier',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='core.soldier'),
+        ),
+        migrations.AddField(
+            model_name='reportedday',
+            name='soldier',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reported_days', to='core.soldier'),
+        ),
+        migrations.AddIndex(
+            model_name='reportrun',
+            index=models.Index(fields=['soldier', '-finished_at'], name='core_report_soldier_fafb1f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reportrun',
+            index=models.Index(fields=['finished_at'], name='core_report_finishe_c3b701_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reportedday',
+            constraint=models.UniqueConstraint(fields=('soldier', 'date'), name='unique_reported_day'),
+        ),
+    ]
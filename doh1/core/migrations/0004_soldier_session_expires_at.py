@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_reportrun_reportedday_soldier_last_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='soldier',
+            name='session_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='soldier',
+            index=models.Index(fields=['session_expires_at'], name='core_soldie_session_7d9be0_idx'),
+        ),
+    ]
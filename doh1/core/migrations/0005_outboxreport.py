@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_soldier_session_expires_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_date', models.DateField()),
+                ('_payload_data', models.TextField(default='{}')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('soldier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='core.soldier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='core_outbox_status_3ce982_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='outboxreport',
+            constraint=models.UniqueConstraint(fields=('soldier', 'report_date'), name='unique_outbox_per_soldier_day'),
+        ),
+    ]
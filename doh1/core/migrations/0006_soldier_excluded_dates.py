@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-19 08:00
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_outboxreport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='soldier',
+            name='excluded_dates',
+            field=models.TextField(blank=True, default='', help_text='One ISO date (2026-04-13) or range (2026-04-13..2026-04-19) per line.', validators=[core.models.validate_excluded_dates]),
+        ),
+    ]
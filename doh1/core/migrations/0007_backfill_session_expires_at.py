@@ -0,0 +1,34 @@
+import json
+
+from django.db import migrations
+
+from core.tokens import session_expiry
+
+
+def backfill_session_expires_at(apps, schema_editor):
+    """Soldiers stored before 0004 hold tokens but no expiry: read it from their localStorage."""
+    Soldier = apps.get_model('core', 'Soldier')
+    soldiers = Soldier.objects.using(schema_editor.connection.alias)
+    pending = (soldiers.filter(session_expires_at__isnull=True)
+               .exclude(_local_storage_data__in=['', '{}']).only('id', '_local_storage_data'))
+    updated = []
+    for soldier in pending.iterator():
+        try:
+            local_storage = json.loads(soldier._local_storage_data)
+        except (ValueError, TypeError):
+            continue
+        soldier.session_expires_at = session_expiry(local_storage)
+        if soldier.session_expires_at is not None:
+            updated.append(soldier)
+    soldiers.bulk_update(updated, ['session_expires_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_soldier_excluded_dates'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_session_expires_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 08:35
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_backfill_session_expires_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='soldier',
+            name='core_soldie_last_up_f3f2d5_idx',
+        ),
+    ]
@@ -1,6 +1,25 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 import json
 
+from .reportable_days import closure_lines, parse_closure
+from .tokens import session_expiry
+
+def validate_excluded_dates(value):
+    """Every line must parse: a dropped typo would report a soldier who is on leave."""
+    bad = []
+    for line in closure_lines(value or ""):
+        try:
+            parse_closure(line)
+        except ValueError:
+            bad.append(line)
+    if bad:
+        raise ValidationError(
+            "Not a date (YYYY-MM-DD) or range (YYYY-MM-DD..YYYY-MM-DD): %(lines)s",
+            code='invalid', params={'lines': ", ".join(bad)},
+        )
+
 class Soldier(models.Model):
     personal_id = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=100, blank=True, default="Soldier")
@@ -11,15 +30,44 @@ class Soldier(models.Model):
     _session_storage_data = models.TextField(default="{}", blank=True)
     
     last_updated = models.DateTimeField(auto_now=True)
+    # Denormalized from local storage (see core.tokens) so schedulers can query it
+    session_expires_at = models.DateTimeField(null=True, blank=True)
+    # Days this soldier must not be reported for (leave, courses), on top of the holidays
+    excluded_dates = models.TextField(
+        blank=True, default="", validators=[validate_excluded_dates],
+        help_text="One ISO date (2026-04-13) or range (2026-04-13..2026-04-19) per line.",
+    )
+
+    class Meta:
+        indexes = [
+            # Background refresher: soldiers ordered by token expiry; fleet view: stale sessions
+            models.Index(fields=['session_expires_at']),
+        ]
 
     def __str__(self):
         return self.personal_id
 
+    def save(self, *args, **kwargs):
+        # The admin validates through the form; this also covers code and shell writes
+        validate_excluded_dates(self.excluded_dates)
+        super().save(*args, **kwargs)
+
+    # --- Parsed JSON (memoized per raw value; treat the returned dicts as read-only) ---
+    def _parsed(self, field):
+        raw = getattr(self, field)
+        memo = self.__dict__.setdefault('_parsed_json', {})
+        hit = memo.get(field)
+        if hit is not None and hit[0] is raw:
+            return hit[1]
+        try: value = json.loads(raw)
+        except (ValueError, TypeError): value = {}
+        memo[field] = (raw, value)
+        return value
+
     # --- Cookies Property ---
     @property
     def cookies(self):
-        try: return json.loads(self._cookies_data)
-        except (ValueError, TypeError): return {}
+        return self._parsed('_cookies_data')
 
     @cookies.setter
     def cookies(self, value):
@@ -28,19 +76,149 @@ class Soldier(models.Model):
     # --- Local Storage Property ---
     @property
     def local_storage(self):
-        try: return json.loads(self._local_storage_data)
-        except (ValueError, TypeError): return {}
+        return self._parsed('_local_storage_data')
 
     @local_storage.setter
     def local_storage(self, value):
         self._local_storage_data = json.dumps(value)
+        self.session_expires_at = session_expiry(value)
 
     # --- Session Storage Property ---
     @property
     def session_storage(self):
-        try: return json.loads(self._session_storage_data)
-        except (ValueError, TypeError): return {}
+        return self._parsed('_session_storage_data')
 
     @session_storage.setter
     def session_storage(self, value):
-        self._session_storage_data = json.dumps(value)
\ No newline at end of file
+        self._session_storage_data = json.dumps(value)
+
+    # --- Excluded Days (parsed set of dates) ---
+    @property
+    def excluded_days(self):
+        raw = self.excluded_dates
+        memo = self.__dict__.get('_excluded_days')
+        if memo is None or memo[0] is not raw:
+            days = set().union(*(parse_closure(line) for line in closure_lines(raw)))
+            memo = self.__dict__['_excluded_days'] = (raw, days)
+        return memo[1]
+
+class ReportLease(models.Model):
+    """
+    One row per soldier per reporting day. Worker processes (possibly on several
+    hosts) claim a row by taking its lease; an expired lease belongs to a crashed
+    worker and can be reclaimed by anyone.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    soldier = models.ForeignKey(Soldier, on_delete=models.CASCADE, related_name='leases')
+    run_date = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    owner = models.CharField(max_length=100, blank=True, default="")
+    expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['soldier', 'run_date'], name='unique_lease_per_soldier_day'),
+        ]
+        indexes = [
+            models.Index(fields=['run_date', 'status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.soldier_id}@{self.run_date} ({self.status})"
+
+
+class ReportRun(models.Model):
+    """One finished attendance run, from the web UI or from a worker."""
+    SOURCE_INTERACTIVE = 'interactive'
+    SOURCE_WORKER = 'worker'
+
+    soldier = models.ForeignKey(Soldier, on_delete=models.CASCADE, related_name='runs')
+    source = models.CharField(max_length=20, default=SOURCE_INTERACTIVE)
+    finished_at = models.DateTimeField(default=timezone.now)
+    success = models.BooleanField(default=False)
+    days_ok = models.PositiveSmallIntegerField(default=0)
+    days_total = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # "Last run per soldier" subqueries and "runs today" rollups
+            models.Index(fields=['soldier', '-finished_at']),
+            models.Index(fields=['finished_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.soldier_id} @ {self.finished_at:%Y-%m-%d %H:%M} ({self.days_ok}/{self.days_total})"
+
+
+class ReportedDay(models.Model):
+    """A date upstream accepted for a soldier. Counted (not parsed) by the fleet view."""
+    soldier = models.ForeignKey(Soldier, on_delete=models.CASCADE, related_name='reported_days')
+    date = models.DateField()
+    reported_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['soldier', 'date'], name='unique_reported_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.soldier_id}@{self.date}"
+
+
+class OutboxReport(models.Model):
+    """
+    A report upstream never received (network error or 5xx). Kept until
+    `manage.py drain_outbox` delivers it, so an outage loses no dates.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    soldier = models.ForeignKey(Soldier, on_delete=models.CASCADE, related_name='outbox')
+    report_date = models.DateField()
+    _payload_data = models.TextField(default="{}")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['soldier', 'report_date'], name='unique_outbox_per_soldier_day'),
+        ]
+        indexes = [
+            # The drainer's "what is due" scan and the queue-depth count
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.soldier_id}@{self.report_date} ({self.status})"
+
+    @property
+    def payload(self):
+        try: return json.loads(self._payload_data)
+        except (ValueError, TypeError): return {}
+
+    @payload.setter
+    def payload(self, value):
+        self._payload_data = json.dumps(value)
@@ -0,0 +1,127 @@
+"""
+Durable outbox for reports upstream never received.
+
+`run_attendance_for_user` enqueues a (soldier, date, payload) row whenever a
+report fails at the transport level (no response, or a 5xx). Rows are
+retried by `manage.py drain_outbox` with exponential backoff; a report the
+API actually answered (even with 'false' or a 4xx) is not retried here.
+A later run that delivers the date itself settles its row, and rows whose
+date has passed are given up on (upstream no longer takes them).
+"""
+import datetime
+import json
+import random
+from typing import Iterable, List
+
+from django.conf import settings
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import OutboxReport, ReportedDay, Soldier
+
+
+def is_transport_failure(result: dict) -> bool:
+    """True if upstream never gave a usable answer (network error or server error)."""
+    status = result.get('status') or 0
+    return not result.get('success') and (status == 0 or status >= 500)
+
+
+def backoff_delay(attempts: int) -> datetime.timedelta:
+    """Exponential backoff (with jitter, so a recovered upstream isn't hit all at once)."""
+    base = settings.AUTO_REPORTER_OUTBOX_BACKOFF_SECONDS
+    delay = min(base * 2 ** max(0, attempts - 1), settings.AUTO_REPORTER_OUTBOX_MAX_BACKOFF_SECONDS)
+    return datetime.timedelta(seconds=delay * random.uniform(0.9, 1.1))
+
+
+# ---------------------------------------------------------
+# ENQUEUE
+# ---------------------------------------------------------
+
+def enqueue(soldier: Soldier, report_date: datetime.date, payload: dict, error: str = "") -> OutboxReport:
+    """Adds (or re-arms) the outbox row for this soldier and date."""
+    entry, _created = OutboxReport.objects.update_or_create(
+        soldier=soldier,
+        report_date=report_date,
+        defaults={
+            '_payload_data': json.dumps(payload),
+            'status': OutboxReport.STATUS_PENDING,
+            'attempts': 0,
+            'next_attempt_at': timezone.now() + backoff_delay(1),
+            'last_error': error,
+        },
+    )
+    return entry
+
+
+def settle_delivered(soldier: Soldier, report_dates: Iterable[datetime.date]) -> int:
+    """Marks pending rows as sent for dates a normal run just delivered. Returns how many."""
+    return OutboxReport.objects.filter(
+        soldier=soldier, report_date__in=list(report_dates), status=OutboxReport.STATUS_PENDING,
+    ).update(status=OutboxReport.STATUS_SENT, sent_at=timezone.now(), last_error="")
+
+
+# ---------------------------------------------------------
+# DRAIN SIDE
+# ---------------------------------------------------------
+
+def expire_past_dates(today: datetime.date = None) -> int:
+    """Gives up on pending rows for days that are already over. Returns how many."""
+    today = today or datetime.date.today()
+    return OutboxReport.objects.filter(status=OutboxReport.STATUS_PENDING, report_date__lt=today).update(
+        status=OutboxReport.STATUS_FAILED, last_error="Report date passed before it could be delivered",
+    )
+
+def due_reports(limit: int, now: datetime.datetime = None) -> List[OutboxReport]:
+    now = now or timezone.now()
+    return list(
+        OutboxReport.objects.filter(status=OutboxReport.STATUS_PENDING, next_attempt_at__lte=now)
+        .select_related('soldier').order_by('next_attempt_at')[:limit]
+    )
+
+
+def mark_sent(entries: Iterable[OutboxReport]) -> None:
+    entries = list(entries)
+    now = timezone.now()
+    OutboxReport.objects.filter(pk__in=[e.pk for e in entries]).update(
+        status=OutboxReport.STATUS_SENT, sent_at=now, last_error=""
+    )
+    # Same bookkeeping a normal run does, so the fleet view counts these days
+    ReportedDay.objects.bulk_create(
+        [ReportedDay(soldier_id=e.soldier_id, date=e.report_date) for e in entries],
+        ignore_conflicts=True,
+    )
+
+
+def mark_retry(entry: OutboxReport, error: str, max_attempts: int = None) -> bool:
+    """Schedules another attempt, or gives up after `max_attempts`. Returns True if it will be retried."""
+    max_attempts = max_attempts or settings.AUTO_REPORTER_OUTBOX_MAX_ATTEMPTS
+    entry.attempts += 1
+    entry.last_error = error
+    if entry.attempts >= max_attempts:
+        entry.status = OutboxReport.STATUS_FAILED
+    else:
+        entry.next_attempt_at = timezone.now() + backoff_delay(entry.attempts)
+    entry.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    return entry.status == OutboxReport.STATUS_PENDING
+
+
+def mark_failed(entry: OutboxReport, error: str) -> None:
+    entry.attempts += 1
+    entry.status = OutboxReport.STATUS_FAILED
+    entry.last_error = error
+    entry.save(update_fields=['attempts', 'status', 'last_error'])
+
+
+def queue_stats(now: datetime.datetime = None) -> dict:
+    """Queue depth for logs and the fleet view (one aggregate over the status index)."""
+    now = now or timezone.now()
+    pending = OutboxReport.objects.filter(status=OutboxReport.STATUS_PENDING).aggregate(
+        depth=Count('id'),
+        oldest=Min('created_at'),
+        next_due=Min('next_attempt_at'),
+    )
+    return {
+        'depth': pending['depth'] or 0,
+        'oldest_age': (now - pending['oldest']) if pending['oldest'] else None,
+        'next_due': pending['next_due'],
+    }
@@ -0,0 +1,165 @@
+"""
+Persistent per-soldier Chrome profiles (--user-data-dir) kept in an on-disk
+cache with an LRU eviction policy under a total disk budget.
+
+Each profile directory carries a small metadata file with its last-use time,
+its size at last check-in and whether it holds a working session ("warm").
+Eviction only reads those metadata files, never walks the other profiles.
+
+A profile is locked with flock(2) on `<root>/.locks/<name>.lock` while checked
+out, so the refresh service workers, report workers and the web process never
+open one profile in two Chromes or evict a profile another process is using.
+"""
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+META_FILE = ".auto_reporter.json"
+LOCK_DIR = ".locks"
+
+
+def is_enabled() -> bool:
+    return settings.SELENIUM_PERSISTENT_PROFILES
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class Profile:
+    """A checked-out profile directory. Only valid inside ProfileCache.checkout()."""
+
+    def __init__(self, path: Path, meta: Dict):
+        self.path = path
+        self.meta = meta
+
+    @property
+    def warm(self) -> bool:
+        return bool(self.meta.get("warm"))
+
+    def mark_warm(self) -> None:
+        self.meta["warm"] = True
+
+    def reset(self) -> None:
+        """Wipes the browser state so the profile can be rebuilt from the DB fields."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.meta["warm"] = False
+
+
+class ProfileCache:
+    def __init__(self, root: Path, budget_bytes: int):
+        self.root = Path(root)
+        self.budget_bytes = budget_bytes
+
+    # --- Paths & metadata ---
+    def path_for(self, key: str) -> Path:
+        safe_key = re.sub(r"[^A-Za-z0-9_.-]", "_", str(key))
+        return self.root / safe_key
+
+    def _lock_file(self, path: Path):
+        lock_dir = self.root / LOCK_DIR
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        # Lock files are never deleted: unlinking one could hand two processes different locks
+        return open(lock_dir / f"{path.name}.lock", "a")
+
+    def _read_meta(self, path: Path) -> Dict:
+        try:
+            with open(path / META_FILE, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, path: Path, meta: Dict) -> None:
+        try:
+            with open(path / META_FILE, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        except OSError as e:
+            logger.warning(f"Could not write profile metadata for {path.name}: {e}")
+
+    # --- Checkout ---
+    @contextmanager
+    def checkout(self, key: str) -> Iterator[Profile]:
+        """
+        Hands out the profile for `key`. Chrome refuses to share a profile between
+        two instances, so concurrent checkouts of the same key (in any process)
+        are serialized.
+        """
+        path = self.path_for(key)
+        with self._lock_file(path) as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            path.mkdir(parents=True, exist_ok=True)
+            profile = Profile(path, self._read_meta(path))
+            try:
+                yield profile
+            finally:
+                profile.meta["last_used"] = time.time()
+                profile.meta["size"] = _dir_size(path)
+                self._write_meta(path, profile.meta)
+            # Closing the file releases the lock
+
+        self.evict()
+
+    # --- Eviction ---
+    def evict(self) -> int:
+        """Deletes least-recently-used profiles until the cache fits the budget."""
+        if not self.root.exists():
+            return 0
+
+        entries = []
+        for path in self.root.iterdir():
+            if path.is_dir() and path.name != LOCK_DIR:
+                meta = self._read_meta(path)
+                entries.append((meta.get("last_used", 0), meta.get("size", 0), path))
+
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _last_used, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= self.budget_bytes:
+                break
+            with self._lock_file(path) as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # checked out, possibly by another process
+                shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            evicted += 1
+            logger.info(f"Evicted Chrome profile {path.name} ({size // 1024} KB).")
+
+        return evicted
+
+
+_profile_cache: Optional[ProfileCache] = None
+_profile_cache_lock = threading.Lock()
+
+
+def get_profile_cache() -> ProfileCache:
+    global _profile_cache
+    with _profile_cache_lock:
+        if _profile_cache is None:
+            _profile_cache = ProfileCache(
+                settings.SELENIUM_PROFILE_DIR,
+                settings.SELENIUM_PROFILE_CACHE_BYTES,
+            )
+        return _profile_cache
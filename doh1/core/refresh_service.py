@@ -0,0 +1,372 @@
+"""
+Out-of-process browser refreshes.
+
+`manage.py refresh_service` owns every Chrome: it listens on a Unix socket and
+runs refreshes on a fixed pool of worker processes (`refresh_service --worker`).
+Each worker runs in its own session, so recycling it (after N refreshes, or
+once its session, Chrome children included, is above an RSS threshold) kills
+whatever it leaked along with it. With AUTO_REPORTER_REFRESH_MODE = 'service'
+the web process only talks to the socket and never starts a browser itself.
+
+The protocol is newline-delimited JSON, the same on the socket and on each
+worker's stdin/stdout:
+
+    -> {"method": "refresh", "priority": "interactive" | "background",
+        "params": {"cookies": ..., "local_storage": ..., "session_storage": ..., "profile_key": ...}}
+    <- {"log": {"time": ..., "level": ..., "msg": ...}}      (zero or more)
+    <- {"result": {...} | null}   or   {"error": "..."}
+
+`{"method": "stats"}` returns the pool counters and per-lane queue waits.
+"""
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+
+from .admission import AdmissionTimeout, get_browser_admission
+from .lanes import PRIORITY_INTERACTIVE
+from .loggers import get_ui_logger, make_log_entry
+
+logger = get_ui_logger()
+
+
+DEFAULT_REFRESH_FUNCTION = 'core.selenium_automation.refresh_with_selenium'
+
+
+class WorkerDied(Exception):
+    """The worker exited (or was killed by the watchdog) before answering."""
+
+
+def session_rss(sid: int) -> int:
+    """Total RSS of every process in session `sid` (a worker and its Chrome tree)."""
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total = 0
+    try:
+        entries = os.scandir('/proc')
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry.name}/stat', encoding='utf-8') as f:
+                stat = f.read()
+            # Fields after "(comm)": state ppid pgrp session ... rss is the 22nd of them
+            fields = stat[stat.rindex(')') + 2:].split()
+            if int(fields[3]) == sid:
+                total += int(fields[21]) * page_size
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
+
+
+# ---------------------------------------------------------
+# SERVICE SIDE
+# ---------------------------------------------------------
+
+class WorkerProcess:
+    def __init__(self, refresh_function: str = DEFAULT_REFRESH_FUNCTION):
+        self.proc = subprocess.Popen(
+            [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'refresh_service',
+             '--worker', '--refresh-function', refresh_function],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+            cwd=settings.BASE_DIR, start_new_session=True,
+        )
+        self.refreshes = 0
+
+    @property
+    def pid(self) -> int:
+        return self.proc.pid
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def rss(self) -> int:
+        return session_rss(self.proc.pid)
+
+    def call(self, params: Dict[str, Any], on_log: Callable[[dict], None], timeout: float):
+        """Runs one refresh, relaying its log entries. Raises WorkerDied / RuntimeError."""
+        # A hung Chrome must not hold the worker forever
+        watchdog = threading.Timer(timeout, self.stop)
+        watchdog.start()
+        try:
+            self.proc.stdin.write(json.dumps({'method': 'refresh', 'params': params}) + '\n')
+            self.proc.stdin.flush()
+            self.refreshes += 1
+            for line in self.proc.stdout:
+                message = json.loads(line)
+                if 'log' in message:
+                    on_log(message['log'])
+                elif 'error' in message:
+                    raise RuntimeError(message['error'])
+                else:
+                    return message.get('result')
+        except (OSError, ValueError) as e:
+            raise WorkerDied(str(e))
+        finally:
+            watchdog.cancel()
+        raise WorkerDied(f"worker {self.pid} exited with {self.proc.poll()}")
+
+    def stop(self) -> None:
+        """Kills the worker's whole session (it is the session leader), Chrome included."""
+        for sig, wait in ((signal.SIGTERM, 5), (signal.SIGKILL, 5)):
+            try:
+                os.killpg(self.proc.pid, sig)
+            except ProcessLookupError:
+                break
+            try:
+                self.proc.wait(wait)
+                break
+            except subprocess.TimeoutExpired:
+                continue
+        # Orphaned children stay in the session after the leader is gone
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class RefreshService:
+    def __init__(self, workers: int = None, max_refreshes: int = None, max_rss_bytes: int = None,
+                 timeout: float = None, refresh_function: str = DEFAULT_REFRESH_FUNCTION):
+        self.workers = workers or settings.AUTO_REPORTER_REFRESH_SERVICE_WORKERS
+        self.max_refreshes = max_refreshes or settings.AUTO_REPORTER_REFRESH_WORKER_MAX_REFRESHES
+        self.max_rss_bytes = max_rss_bytes or settings.AUTO_REPORTER_REFRESH_WORKER_MAX_RSS_MB * 1024 ** 2
+        self.timeout = timeout or settings.AUTO_REPORTER_REFRESH_SERVICE_TIMEOUT
+        self.refresh_function = refresh_function
+
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._spawn_lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._all = []
+        for _ in range(self.workers):
+            self._add_worker()
+
+    def _add_worker(self) -> WorkerProcess:
+        worker = WorkerProcess(self.refresh_function)
+        with self._lock:
+            self._all.append(worker)
+        self._idle.put(worker)
+        return worker
+
+    def _respawn(self) -> None:
+        """Tops the pool back up. A worker that fails to start is retried on the next refresh."""
+        with self._spawn_lock:
+            with self._lock:
+                missing = self.workers - len(self._all)
+            for _ in range(missing):
+                try:
+                    self._add_worker()
+                except (OSError, subprocess.SubprocessError) as e:
+                    logger.warning(f"Could not start a refresh worker: {e}")
+                    self._count('spawn_failed')
+                    return
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def refresh(self, params: Dict[str, Any], on_log: Callable[[dict], None],
+                priority: str = PRIORITY_INTERACTIVE):
+        def report_position(position, queue_length):
+            on_log(make_log_entry(f"Waiting for a browser slot (position {position} of {queue_length})...", 'warning'))
+
+        with get_browser_admission().slot(priority, timeout=settings.AUTO_REPORTER_ADMISSION_TIMEOUT,
+                                          on_wait=report_position):
+            self._respawn()
+            try:
+                # The pool may be short of workers that failed to start; never wait on it forever
+                worker = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                self._count('failed')
+                raise WorkerDied(f"No refresh worker became available within {self.timeout:.0f}s")
+            try:
+                result = worker.call(params, on_log, self.timeout)
+                self._count('refreshes')
+                return result
+            except Exception:
+                self._count('failed')
+                raise
+            finally:
+                self._release(worker)
+
+    def _release(self, worker: WorkerProcess) -> None:
+        reason = None
+        if not worker.alive():
+            reason = "exited"
+        elif worker.refreshes >= self.max_refreshes:
+            reason = f"{worker.refreshes} refreshes"
+        else:
+            rss = worker.rss()
+            if rss > self.max_rss_bytes:
+                reason = f"RSS {rss / 1024 ** 2:.0f} MB"
+
+        if reason is None:
+            self._idle.put(worker)
+            return
+
+        logger.info(f"Recycling refresh worker {worker.pid} ({reason}).")
+        with self._lock:
+            self._all.remove(worker)
+        worker.stop()
+        self._count('recycled')
+        self._respawn()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self.stats)
+            workers = list(self._all)
+        return {
+            **counters,
+            'workers': [{'pid': w.pid, 'refreshes': w.refreshes, 'rss': w.rss()} for w in workers],
+            'idle': self._idle.qsize(),
+            'lanes': get_browser_admission().stats(),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            workers = list(self._all)
+        for worker in workers:
+            worker.stop()
+
+    # --- Socket server ---
+    def serve_forever(self, socket_path: str) -> None:
+        path = Path(socket_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            path.unlink()
+
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def send(self, message):
+                self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+                self.wfile.flush()
+
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        if request.get('method') == 'stats':
+                            self.send({'result': service.snapshot()})
+                            continue
+                        result = service.refresh(request.get('params') or {},
+                                                 on_log=lambda entry: self.send({'log': entry}),
+                                                 priority=request.get('priority', PRIORITY_INTERACTIVE))
+                        self.send({'result': result})
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                    except (AdmissionTimeout, WorkerDied, RuntimeError, ValueError) as e:
+                        self.send({'error': str(e)})
+
+        class Server(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True
+
+        with Server(str(path), Handler) as server:
+            os.chmod(path, 0o600)
+            server.serve_forever()
+
+
+# ---------------------------------------------------------
+# WORKER SIDE (`refresh_service --worker`)
+# ---------------------------------------------------------
+
+class _ProtocolLogHandler(logging.Handler):
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+
+    def emit(self, record):
+        try:
+            self.send({'log': make_log_entry(self.format(record), record.levelname.lower())})
+        except Exception:
+            self.handleError(record)
+
+
+def run_worker(refresh_function: str = DEFAULT_REFRESH_FUNCTION) -> None:
+    from django.utils.module_loading import import_string
+
+    # stdout carries the protocol; anything else printing to it goes to stderr instead
+    out = os.fdopen(os.dup(1), 'w', encoding='utf-8', buffering=1)
+    os.dup2(2, 1)
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            out.write(json.dumps(message) + '\n')
+
+    logger.addHandler(_ProtocolLogHandler(send))
+    refresh = import_string(refresh_function)
+
+    for line in sys.stdin:
+        try:
+            params = json.loads(line).get('params') or {}
+            send({'result': refresh(**params)})
+        except Exception as e:
+            send({'error': str(e)})
+
+
+# ---------------------------------------------------------
+# CLIENT SIDE (web process)
+# ---------------------------------------------------------
+
+def _call(request: dict, on_log: Optional[Callable[[dict], None]] = None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(settings.AUTO_REPORTER_REFRESH_SERVICE_TIMEOUT + settings.AUTO_REPORTER_ADMISSION_TIMEOUT)
+        sock.connect(str(settings.AUTO_REPORTER_REFRESH_SOCKET))
+        with sock.makefile('rw', encoding='utf-8', newline='\n') as stream:
+            stream.write(json.dumps(request) + '\n')
+            stream.flush()
+            for line in stream:
+                message = json.loads(line)
+                if 'log' in message:
+                    if on_log:
+                        on_log(message['log'])
+                elif 'error' in message:
+                    raise RuntimeError(message['error'])
+                else:
+                    return message.get('result')
+    raise ConnectionError("refresh service closed the connection")
+
+
+def _relay_log(entry: dict) -> None:
+    # Re-logged here so it reaches whichever UI stream is capturing this thread
+    level = logging.getLevelName(str(entry.get('level', 'info')).upper())
+    logger.log(level if isinstance(level, int) else logging.INFO, entry.get('msg', ''))
+
+
+def refresh_via_service(
+    cookies: Dict[str, str],
+    local_storage: Optional[Dict[str, str]] = None,
+    session_storage: Optional[Dict[str, str]] = None,
+    profile_key: Optional[str] = None,
+    priority: str = PRIORITY_INTERACTIVE
+) -> Optional[Dict[str, Any]]:
+    """Same contract as `refresh_with_selenium`, run by the refresh service. Never starts Chrome locally."""
+    params = {
+        'cookies': cookies,
+        'local_storage': local_storage,
+        'session_storage': session_storage,
+        'profile_key': profile_key,
+    }
+    try:
+        return _call({'method': 'refresh', 'priority': priority, 'params': params}, on_log=_relay_log)
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.warning(f"Refresh service failed: {e}")
+        return None
+
+
+def service_stats() -> dict:
+    return _call({'method': 'stats'})
@@ -0,0 +1,175 @@
+"""
+Background session refresher: keeps every soldier's session fresh ahead of
+token expiry so foreground report runs almost never need a browser.
+
+Soldiers sit in a priority queue ordered by `session_expires_at`. A soldier
+is due once its expiry is within the current lead time: short during the day,
+long during off-peak hours, so most refreshes happen at night. The lead is
+capped at a fraction of the soldier's token lifetime (expiry minus the time the
+tokens were stored), so short-lived tokens are not refreshed again right away.
+A soldier refreshed less than `min_interval` ago is skipped, and one whose
+refresh did not move the expiry forward is retried later like a failure.
+At most `concurrency` browsers run at once.
+"""
+import datetime
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .loggers import get_ui_logger
+from .models import Soldier
+from .lanes import PRIORITY_BACKGROUND
+from .services import refresh_session
+
+logger = get_ui_logger()
+
+
+# Soldiers whose tokens carry no readable expiry are refreshed this long after their last update
+UNKNOWN_EXPIRY_INTERVAL = datetime.timedelta(hours=6)
+
+
+class SessionRefresher:
+    def __init__(self, concurrency: int = None, lead: datetime.timedelta = None,
+                 off_peak_lead: datetime.timedelta = None, off_peak_hours: Tuple[int, int] = None,
+                 retry_delay: datetime.timedelta = datetime.timedelta(minutes=15),
+                 lead_fraction: float = None, min_interval: datetime.timedelta = None):
+        self.concurrency = concurrency or settings.AUTO_REPORTER_REFRESH_CONCURRENCY
+        self.lead = lead or datetime.timedelta(minutes=settings.AUTO_REPORTER_REFRESH_LEAD_MINUTES)
+        self.off_peak_lead = off_peak_lead or datetime.timedelta(hours=settings.AUTO_REPORTER_OFF_PEAK_LEAD_HOURS)
+        self.off_peak_hours = off_peak_hours or settings.AUTO_REPORTER_OFF_PEAK_HOURS
+        self.retry_delay = retry_delay
+        self.lead_fraction = settings.AUTO_REPORTER_REFRESH_LEAD_FRACTION if lead_fraction is None else lead_fraction
+        self.min_interval = (datetime.timedelta(minutes=settings.AUTO_REPORTER_REFRESH_MIN_INTERVAL_MINUTES)
+                             if min_interval is None else min_interval)
+
+        # (expires_at, soldier id, token lifetime)
+        self._heap: List[Tuple[datetime.datetime, int, datetime.timedelta]] = []
+        self._running: Dict[int, object] = {}
+        self._retry_at: Dict[int, datetime.datetime] = {}
+        self._refreshed_at: Dict[int, datetime.datetime] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="session-refresh")
+        self.refreshed = 0
+        self.failed = 0
+
+    # --- Scheduling policy ---
+    def is_off_peak(self, now: datetime.datetime) -> bool:
+        start, end = self.off_peak_hours
+        hour = timezone.localtime(now).hour
+        return start <= hour < end if start <= end else (hour >= start or hour < end)
+
+    def current_lead(self, now: datetime.datetime) -> datetime.timedelta:
+        return self.off_peak_lead if self.is_off_peak(now) else self.lead
+
+    def lead_for(self, lifetime: datetime.timedelta, now: datetime.datetime) -> datetime.timedelta:
+        """The current lead, but never more than `lead_fraction` of the token lifetime."""
+        return min(self.current_lead(now), max(lifetime, datetime.timedelta(0)) * self.lead_fraction)
+
+    # --- Queue ---
+    def reload(self) -> int:
+        """Rebuilds the queue from the DB (one indexed query, no JSON parsing)."""
+        rows = (
+            Soldier.objects.exclude(_cookies_data__in=["", "{}"])
+            .values_list('id', 'session_expires_at', 'last_updated')
+        )
+        heap = []
+        for soldier_id, expires_at, last_updated in rows:
+            if expires_at is None:
+                expires_at = last_updated + UNKNOWN_EXPIRY_INTERVAL
+            heap.append((expires_at, soldier_id, expires_at - last_updated))
+        heapq.heapify(heap)
+
+        with self._lock:
+            self._heap = heap
+        return len(heap)
+
+    def tick(self, now: datetime.datetime = None) -> int:
+        """Starts refreshes for every due soldier, up to the concurrency cap."""
+        now = now or timezone.now()
+        # Nobody's lead exceeds the current one, so nothing past this is due
+        horizon = now + self.current_lead(now)
+        started = 0
+        not_yet = []
+
+        with self._lock:
+            while self._heap and len(self._running) < self.concurrency:
+                expires_at, soldier_id, lifetime = self._heap[0]
+                if expires_at > horizon:
+                    break
+                heapq.heappop(self._heap)
+
+                if expires_at > now + self.lead_for(lifetime, now):
+                    not_yet.append((expires_at, soldier_id, lifetime))
+                    continue
+                refreshed_at = self._refreshed_at.get(soldier_id)
+                if (soldier_id in self._running or self._retry_at.get(soldier_id, now) > now
+                        or (refreshed_at is not None and now - refreshed_at < self.min_interval)):
+                    continue
+                self._refreshed_at[soldier_id] = now
+                self._running[soldier_id] = self._executor.submit(self._refresh_one, soldier_id)
+                started += 1
+
+            for entry in not_yet:
+                heapq.heappush(self._heap, entry)
+
+        return started
+
+    def seconds_until_next(self, now: datetime.datetime = None) -> float:
+        now = now or timezone.now()
+        with self._lock:
+            if not self._heap:
+                return float('inf')
+            # Capped leads make the due order differ from the expiry order
+            due_at = min(expires_at - self.lead_for(lifetime, now) for expires_at, _, lifetime in self._heap)
+        return max(0.0, (due_at - now).total_seconds())
+
+    @property
+    def running(self) -> int:
+        with self._lock:
+            return len(self._running)
+
+    def wait_running(self, timeout: float = None) -> None:
+        with self._lock:
+            futures = list(self._running.values())
+        wait(futures, timeout=timeout)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    # --- Work ---
+    def _refresh_one(self, soldier_id: int) -> None:
+        ok = False
+        try:
+            soldier = Soldier.objects.get(pk=soldier_id)
+            logger.info(f"Refreshing session for {soldier.personal_id} "
+                        f"(expires {soldier.session_expires_at or 'unknown'})")
+            previous_expiry = soldier.session_expires_at
+            ok = refresh_session(soldier, PRIORITY_BACKGROUND)
+            if ok and not self._extended(previous_expiry, soldier.session_expires_at):
+                logger.warning(f"Refresh of {soldier.personal_id} did not extend the session "
+                               f"(expires {soldier.session_expires_at:%H:%M}); retrying later.")
+                ok = False
+        except Soldier.DoesNotExist:
+            ok = True
+        except Exception as e:
+            logger.warning(f"Refresh of soldier {soldier_id} crashed: {e}")
+        finally:
+            connection.close()
+            with self._lock:
+                self._running.pop(soldier_id, None)
+                if ok:
+                    self.refreshed += 1
+                    self._retry_at.pop(soldier_id, None)
+                else:
+                    self.failed += 1
+                    self._retry_at[soldier_id] = timezone.now() + self.retry_delay
+
+    @staticmethod
+    def _extended(previous: datetime.datetime, current: datetime.datetime) -> bool:
+        """Whether the refresh moved the expiry forward (unknown counts as yes)."""
+        return previous is None or current is None or current > previous
@@ -0,0 +1,144 @@
+"""
+Precomputed calendar of reportable days.
+
+Built once per process per day from the weekend days, the configured
+holidays/closures and a horizon, so "the next N reportable days from D" is
+a lookup plus a slice instead of a loop over the calendar for every soldier
+on every run. Dates upstream would reject (holidays) are never sent.
+
+AUTO_REPORTER_HOLIDAYS (and, one per line, AUTO_REPORTER_HOLIDAYS_FILE)
+accept ISO dates ("2026-04-13") and inclusive ranges ("2026-04-13..2026-04-19").
+"""
+import datetime
+import threading
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+from django.conf import settings
+
+from .loggers import get_ui_logger
+
+logger = get_ui_logger()
+
+
+def parse_closure(entry) -> Set[datetime.date]:
+    """One entry: a date, an ISO date or an inclusive ISO range. Raises ValueError if malformed."""
+    if isinstance(entry, datetime.date):
+        return {entry}
+    first, _, last = str(entry).partition('..')
+    start = datetime.date.fromisoformat(first.strip())
+    end = datetime.date.fromisoformat(last.strip()) if last else start
+    if end < start:
+        raise ValueError(f"range ends before it starts: {entry!r}")
+    return {start + datetime.timedelta(days=i) for i in range((end - start).days + 1)}
+
+
+def closure_lines(text: str) -> List[str]:
+    """Non-empty lines of a holidays file or an exclusions field, comments stripped."""
+    lines = (line.split('#', 1)[0].strip() for line in text.splitlines())
+    return [line for line in lines if line]
+
+
+def parse_closures(entries: Iterable) -> Set[datetime.date]:
+    """Settings and the holidays file: malformed entries are logged and skipped."""
+    closed = set()
+    for entry in entries:
+        try:
+            closed |= parse_closure(entry)
+        except ValueError:
+            logger.warning(f"Ignoring invalid holiday entry: {entry!r}")
+    return closed
+
+
+def configured_closures() -> Set[datetime.date]:
+    entries = list(settings.AUTO_REPORTER_HOLIDAYS)
+    path = settings.AUTO_REPORTER_HOLIDAYS_FILE
+    if path:
+        try:
+            entries += closure_lines(Path(path).read_text(encoding='utf-8'))
+        except OSError as e:
+            logger.warning(f"Could not read holidays file {path}: {e}")
+    return parse_closures(entries)
+
+
+class ReportableCalendar:
+    def __init__(self, start: datetime.date, horizon_days: int,
+                 weekend: Iterable[int] = (), closures: Iterable[datetime.date] = ()):
+        self.start = start
+        self.end = start + datetime.timedelta(days=horizon_days)
+        weekend, closures = set(weekend), set(closures)
+
+        days = []
+        # first_from[k]: index in `days` of the first reportable day on or after start + k
+        first_from = []
+        for k in range(horizon_days):
+            d = start + datetime.timedelta(days=k)
+            first_from.append(len(days))
+            if d.weekday() not in weekend and d not in closures:
+                days.append(d)
+
+        self.days = tuple(days)
+        self._first_from = first_from
+
+    def covers(self, day: datetime.date) -> bool:
+        return self.start <= day < self.end
+
+    def next_days(self, count: int, start: Optional[datetime.date] = None,
+                  exclude: Iterable[datetime.date] = ()) -> List[datetime.date]:
+        """
+        The first `count` reportable days on or after `start`, minus `exclude`.
+        Shorter than `count` if the horizon runs out.
+        """
+        start = start or self.start
+        if not self.covers(start):
+            raise ValueError(f"{start} is outside this calendar ({self.start} to {self.end})")
+
+        i = self._first_from[(start - self.start).days]
+        if not exclude:
+            return list(self.days[i:i + count])
+
+        exclude = set(exclude)
+        result = []
+        for d in self.days[i:]:
+            if d not in exclude:
+                result.append(d)
+                if len(result) == count:
+                    break
+        return result
+
+
+def build_calendar(start: datetime.date, horizon_days: int = None) -> ReportableCalendar:
+    return ReportableCalendar(
+        start,
+        horizon_days or settings.AUTO_REPORTER_CALENDAR_HORIZON_DAYS,
+        weekend=settings.AUTO_REPORTER_WEEKEND_DAYS,
+        closures=configured_closures(),
+    )
+
+
+_calendar: Optional[ReportableCalendar] = None
+_calendar_lock = threading.Lock()
+
+
+def get_reportable_calendar(today: datetime.date = None) -> ReportableCalendar:
+    """This process's calendar for today; rebuilt when the date changes."""
+    global _calendar
+    today = today or datetime.date.today()
+    with _calendar_lock:
+        if _calendar is None or _calendar.start != today:
+            _calendar = build_calendar(today)
+        return _calendar
+
+
+def next_reportable_days(count: int, start: datetime.date = None,
+                         exclude: Iterable[datetime.date] = ()) -> List[datetime.date]:
+    start = start or datetime.date.today()
+    calendar = get_reportable_calendar()
+    days = calendar.next_days(count, start, exclude) if calendar.covers(start) else []
+    if len(days) < count and calendar.start != start:
+        # Dates outside (or near the end of) today's window get a one-off calendar
+        days = build_calendar(start).next_days(count, start, exclude)
+    if len(days) < count:
+        logger.warning(f"Only {len(days)} reportable days within "
+                       f"{settings.AUTO_REPORTER_CALENDAR_HORIZON_DAYS} days of {start}.")
+    return days
@@ -0,0 +1,47 @@
+"""
+Bounded threads for long-lived async streams under ASGI.
+
+Django runs every ASGI request in its own ThreadSensitiveContext: the sync
+middleware (sessions, auth, CSRF, messages) gets a thread of its own, which
+stays alive, idle, until the response has been sent. For a report stream that
+is one parked thread per viewer for the whole run.
+
+`SharedRequestThreads` wraps the ASGI application and runs requests routed to
+the async stream view in one of a fixed set of shared contexts instead, so
+their sync work (a few short DB reads and writes per stream) runs on at most
+`threads` threads however many streams are open. Everything else keeps
+Django's per-request threads.
+"""
+import itertools
+
+from asgiref.sync import ThreadSensitiveContext
+from django.urls import Resolver404, resolve
+
+
+class _SharedContext(ThreadSensitiveContext):
+    """A ThreadSensitiveContext that outlives the request: its executor thread is reused."""
+
+    async def __aexit__(self, exc, value, tb):
+        pass
+
+
+class SharedRequestThreads:
+    def __init__(self, app, view, threads: int):
+        self.app = app
+        self.view = view
+        self._contexts = itertools.cycle([_SharedContext() for _ in range(max(1, threads))])
+
+    def _is_stream(self, scope) -> bool:
+        if scope['type'] != 'http':
+            return False
+        try:
+            return resolve(scope['path']).func is self.view
+        except Resolver404:
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if not self._is_stream(scope):
+            return await self.app(scope, receive, send)
+        # Entered first, so Django's own per-request context finds one set and reuses it
+        async with next(self._contexts):
+            return await self.app(scope, receive, send)
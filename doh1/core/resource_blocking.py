@@ -0,0 +1,148 @@
+"""
+Resource-blocking mode for the headless refresh browser.
+
+The refresh only needs the app's auth/redirect traffic. When enabled, we:
+  * route every host that is not in SELENIUM_ALLOWED_URL_PATTERNS to NXDOMAIN
+    (Chrome's --host-resolver-rules), which kills third-party analytics/CDNs,
+  * block images, fonts, stylesheets and media on the allowed hosts via CDP
+    (Network.setBlockedURLs), and
+  * read Chrome's performance log afterwards to report what was avoided.
+"""
+import json
+import fnmatch
+from typing import Dict, List, Any, TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+
+BLOCKED_EXTENSIONS = (
+    "png", "jpg", "jpeg", "gif", "webp", "svg", "ico", "bmp",
+    "woff", "woff2", "ttf", "otf", "eot",
+    "css",
+    "mp4", "webm", "mp3", "wav",
+)
+
+# Analytics endpoints are blocked even if an allowed pattern happens to cover them
+ANALYTICS_URL_PATTERNS = (
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*clarity.ms*", "*hotjar.com*", "*hotjar.io*",
+    "*applicationinsights.azure.com*", "*dc.services.visualstudio.com*",
+)
+
+BLOCKED_RESOURCE_TYPES = {"Image", "Font", "Stylesheet", "Media"}
+
+# Rough transfer sizes for requests that never happened (used for "bytes avoided")
+ESTIMATED_BYTES_BY_TYPE = {
+    "Image": 25_000,
+    "Font": 40_000,
+    "Stylesheet": 20_000,
+    "Media": 250_000,
+    "Script": 60_000,
+    "XHR": 2_000,
+    "Fetch": 2_000,
+    "Ping": 500,
+}
+DEFAULT_ESTIMATED_BYTES = 5_000
+
+
+def is_enabled() -> bool:
+    return settings.SELENIUM_BLOCK_RESOURCES
+
+
+def _allowed_patterns() -> List[str]:
+    return list(settings.SELENIUM_ALLOWED_URL_PATTERNS)
+
+
+def _allowed_hosts(patterns: List[str]) -> List[str]:
+    """'https://*.idf.il/*' -> '*.idf.il' (host-resolver rules work on hostnames)."""
+    hosts = []
+    for pattern in patterns:
+        host = urlsplit(pattern).hostname if "://" in pattern else pattern.split("/")[0]
+        if host and host not in hosts:
+            hosts.append(host)
+    return hosts
+
+
+def blocked_url_patterns() -> List[str]:
+    patterns = []
+    for ext in BLOCKED_EXTENSIONS:
+        patterns.append(f"*.{ext}")
+        patterns.append(f"*.{ext}?*")
+    patterns.extend(ANALYTICS_URL_PATTERNS)
+    return patterns
+
+
+def is_allowed_url(url: str, patterns: List[str] = None) -> bool:
+    patterns = _allowed_patterns() if patterns is None else patterns
+    return any(fnmatch.fnmatchcase(url, p) for p in patterns)
+
+
+def configure_options(options: "Options") -> None:
+    """Chrome-level blocking. Must run before the driver is created."""
+    rules = ["MAP * ~NOTFOUND"] + [f"EXCLUDE {host}" for host in _allowed_hosts(_allowed_patterns())]
+    options.add_argument(f"--host-resolver-rules={' , '.join(rules)}")
+    options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+    })
+    # The performance log is how we count what was blocked
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+
+def install_blocking(driver: "webdriver.Chrome") -> None:
+    """CDP-level blocking of heavy resource types. Must run before the first navigation."""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_url_patterns()})
+
+
+def collect_stats(driver: "webdriver.Chrome") -> Dict[str, Any]:
+    """
+    Summarizes the performance log: what was loaded, what was blocked and
+    (estimated) how many bytes blocking saved. Drains the log buffer.
+    """
+    patterns = _allowed_patterns()
+    requests = {}
+    stats = {
+        "requests_loaded": 0,
+        "bytes_loaded": 0,
+        "requests_blocked": 0,
+        "bytes_avoided_estimate": 0,
+        "blocked_by_type": {},
+    }
+
+    for entry in driver.get_log("performance"):
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, ValueError, TypeError):
+            continue
+
+        method = message.get("method")
+        params = message.get("params", {})
+
+        if method == "Network.requestWillBeSent":
+            requests[params.get("requestId")] = (
+                params.get("request", {}).get("url", ""),
+                params.get("type", "Other"),
+            )
+
+        elif method == "Network.loadingFinished":
+            stats["requests_loaded"] += 1
+            stats["bytes_loaded"] += int(params.get("encodedDataLength") or 0)
+
+        elif method == "Network.loadingFailed":
+            url, resource_type = requests.get(params.get("requestId"), ("", params.get("type", "Other")))
+            blocked_by_cdp = bool(params.get("blockedReason"))
+            blocked_by_dns = (
+                "ERR_NAME_NOT_RESOLVED" in (params.get("errorText") or "")
+                and not is_allowed_url(url, patterns)
+            )
+            if blocked_by_cdp or blocked_by_dns:
+                stats["requests_blocked"] += 1
+                stats["blocked_by_type"][resource_type] = stats["blocked_by_type"].get(resource_type, 0) + 1
+                stats["bytes_avoided_estimate"] += ESTIMATED_BYTES_BY_TYPE.get(resource_type, DEFAULT_ESTIMATED_BYTES)
+
+    return stats
@@ -1,13 +1,17 @@
 import re
 import time
 import logging
-from typing import Dict, Optional, Any
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+from pathlib import Path
+from typing import Dict, Optional, Any, TYPE_CHECKING
 
+from . import profiles, resource_blocking
+from .driver_cache import get_driver_paths, invalidate_driver_paths
 from .loggers import get_ui_logger
 
+if TYPE_CHECKING:
+    # Selenium is heavy, so it is only imported once a refresh actually runs
+    from selenium import webdriver
+
 logger = get_ui_logger()
 
 
@@ -20,25 +24,39 @@ USER_AGENT = (
     "Chrome/115.0.0.0 Safari/537.36"
 )
 
-def _setup_driver() -> webdriver.Chrome:
+def _setup_driver(user_data_dir: Optional[Path] = None) -> "webdriver.Chrome":
     """Configures and initializes the Headless Chrome driver."""
+    from selenium import webdriver
+    from selenium.common.exceptions import WebDriverException
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
     options = Options()
     options.add_argument("--headless=new")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--disable-gpu")
     options.add_argument(f"user-agent={USER_AGENT}")
+    if user_data_dir:
+        options.add_argument(f"--user-data-dir={user_data_dir}")
+
+    if resource_blocking.is_enabled():
+        resource_blocking.configure_options(options)
+
+    paths = get_driver_paths()
+    if paths.get("chrome_binary"):
+        options.binary_location = paths["chrome_binary"]
 
-    service = None
     try:
-        from selenium.webdriver_manager.chrome import ChromeDriverManager
-        service = Service(ChromeDriverManager().install())
-    except ImportError:
-        service = Service()
-    
-    return webdriver.Chrome(service=service, options=options)
+        return webdriver.Chrome(service=Service(paths.get("driver_path")), options=options)
+    except WebDriverException:
+        # Cached paths may be stale (e.g. Chrome auto-updated). Re-resolve once.
+        invalidate_driver_paths()
+        paths = get_driver_paths()
+        options.binary_location = paths.get("chrome_binary") or ""
+        return webdriver.Chrome(service=Service(paths.get("driver_path")), options=options)
 
-def _inject_cookies(driver: webdriver.Chrome, cookies: Dict[str, str]) -> None:
+def _inject_cookies(driver: "webdriver.Chrome", cookies: Dict[str, str]) -> None:
     """Injects cookies into the browser."""
     if not cookies:
         return
@@ -51,7 +69,7 @@ def _inject_cookies(driver: webdriver.Chrome, cookies: Dict[str, str]) -> None:
         except Exception as e:
             logger.info(f"Warning: Failed to inject cookie '{name}': {e}")
 
-def _inject_storage(driver: webdriver.Chrome, data: Dict[str, str], storage_type: str) -> None:
+def _inject_storage(driver: "webdriver.Chrome", data: Dict[str, str], storage_type: str) -> None:
     """
     Injects data into localStorage or sessionStorage using JS.
     storage_type must be 'localStorage' or 'sessionStorage'.
@@ -71,7 +89,7 @@ def _inject_storage(driver: webdriver.Chrome, data: Dict[str, str], storage_type
     except Exception as e:
         logger.info(f"Warning: Failed to inject {storage_type}: {e}")
 
-def _get_storage_data(driver: webdriver.Chrome, storage_type: str) -> Dict[str, str]:
+def _get_storage_data(driver: "webdriver.Chrome", storage_type: str) -> Dict[str, str]:
     """Extracts all data from localStorage or sessionStorage."""
     try:
         return driver.execute_script(f"return {{...window.{storage_type}}};")
@@ -82,34 +100,97 @@ def _get_storage_data(driver: webdriver.Chrome, storage_type: str) -> Dict[str,
 def refresh_with_selenium(
     cookies: Dict[str, str], 
     local_storage: Optional[Dict[str, str]] = None, 
-    session_storage: Optional[Dict[str, str]] = None
+    session_storage: Optional[Dict[str, str]] = None,
+    profile_key: Optional[str] = None
 ) -> Optional[Dict[str, Any]]:
     """
     Restores Cookies, LocalStorage, and SessionStorage, visits the site,
     and returns the fresh (potentially updated) session data.
+
+    With SELENIUM_PERSISTENT_PROFILES and a `profile_key`, the browser runs on a
+    persistent per-soldier profile. A warm profile already holds the session and
+    HTTP cache, so nothing is injected; if it turns out to be logged out, the
+    profile is wiped and rebuilt from the given (DB) state. A run that fails
+    for any other reason (Chrome crash, network error) leaves the profile alone.
+    """
+    if not (profile_key and profiles.is_enabled()):
+        return _run_refresh(cookies, local_storage, session_storage)
+
+    with profiles.get_profile_cache().checkout(profile_key) as profile:
+        if profile.warm:
+            logger.info("Using warm Chrome profile (skipping state injection)...")
+            try:
+                fresh_data = _run_refresh(cookies, local_storage, session_storage,
+                                          user_data_dir=profile.path, inject=False, raise_errors=True)
+            except Exception:
+                logger.info("Keeping the warm profile; the next refresh will try it again.")
+                return None
+            if fresh_data:
+                return fresh_data
+            logger.info("Warm profile has no valid session. Rebuilding it from stored state...")
+            profile.reset()
+
+        fresh_data = _run_refresh(cookies, local_storage, session_storage,
+                                  user_data_dir=profile.path)
+        if fresh_data:
+            profile.mark_warm()
+        return fresh_data
+
+def _run_refresh(
+    cookies: Dict[str, str],
+    local_storage: Optional[Dict[str, str]] = None,
+    session_storage: Optional[Dict[str, str]] = None,
+    user_data_dir: Optional[Path] = None,
+    inject: bool = True,
+    raise_errors: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    One browser session: (optionally) inject state, load the app, harvest state.
+    Returns None if the app redirects to the login page; other failures also
+    return None unless `raise_errors` is set, in which case they propagate.
     """
     logger.info("Starting Selenium Preflight...")
     driver = None
     
     try:
-        driver = _setup_driver()
+        driver = _setup_driver(user_data_dir)
+        blocking = resource_blocking.is_enabled()
+        if blocking:
+            logger.info("Resource blocking enabled (images, fonts, styles, third-party hosts).")
+            resource_blocking.install_blocking(driver)
         
         # 1. Navigate to domain (Required for Same-Origin Policy)
         logger.info(f"Navigating to {TARGET_URL}...")
         driver.get(TARGET_URL)
         
-        # 2. Inject state (Cookies + Storage)
-        _inject_cookies(driver, cookies)
-        _inject_storage(driver, local_storage or {}, "localStorage")
-        _inject_storage(driver, session_storage or {}, "sessionStorage")
-        
-        # 3. Refresh to force the app to load using the injected data
-        logger.info("Refreshing page to trigger app load with injected state...")
-        driver.refresh()
+        if inject:
+            # 2. Inject state (Cookies + Storage)
+            _inject_cookies(driver, cookies)
+            _inject_storage(driver, local_storage or {}, "localStorage")
+            _inject_storage(driver, session_storage or {}, "sessionStorage")
+            
+            # 3. Refresh to force the app to load using the injected data
+            logger.info("Refreshing page to trigger app load with injected state...")
+            driver.refresh()
         
         for _ in range(20): 
             if "finish" in driver.current_url: break
             time.sleep(0.5)
+
+        # 4. Report what blocking saved us
+        resource_stats = None
+        if blocking:
+            # Stats are a nice-to-have: never throw away a refresh that worked over them
+            try:
+                resource_stats = resource_blocking.collect_stats(driver)
+                logger.info(
+                    f"Blocked {resource_stats['requests_blocked']} requests "
+                    f"(~{resource_stats['bytes_avoided_estimate'] // 1024} KB avoided), "
+                    f"loaded {resource_stats['requests_loaded']} requests "
+                    f"({resource_stats['bytes_loaded'] // 1024} KB)."
+                )
+            except Exception as e:
+                logger.warning(f"Could not collect resource stats: {e}")
         
         # 5. Validation Check
         current_url = driver.current_url.lower()
@@ -127,6 +208,8 @@ def refresh_with_selenium(
 
         fresh_data['cookies'] = clean_cookies(fresh_data['cookies'])
         fresh_data['session_storage'] = clean_cookies(fresh_data['session_storage'])
+        if resource_stats is not None:
+            fresh_data['resource_stats'] = resource_stats
 
         logger.info(f"Success. Captured {len(fresh_data['cookies'])} Cookies.")
 
@@ -134,6 +217,8 @@ def refresh_with_selenium(
 
     except Exception as e:
         logger.info(f"Selenium Error: {e}")
+        if raise_errors:
+            raise
         return None
     finally:
         if driver:
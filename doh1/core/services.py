@@ -1,20 +1,49 @@
+import contextvars
 import datetime
 import logging
 from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
 
-import httpx
 # Ensure these imports match your project structure
 from core.selenium_automation import refresh_with_selenium 
-from core.models import Soldier
+from core.models import ReportRun, Soldier
+from . import outbox
+from .admission import AdmissionTimeout, get_browser_admission
+from .fleet import record_run
+from .lanes import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, get_report_lanes
+from .refresh_service import refresh_via_service
+from .reportable_days import next_reportable_days
 from .loggers import get_ui_logger
 
+if TYPE_CHECKING:
+    # httpx is only imported once a report actually runs (keeps startup fast)
+    import httpx
+
 logger = get_ui_logger()
 
 
 # Configuration
-WEEKEND = [4, 5]  # Friday(4), Saturday(5)
 MAX_WORKERS = 4
+REPORT_DAYS = 8
 BASE_URL = "https://one.prat.idf.il"
+# Upstream rejected the session itself (revoked, or expired server-side before the token did)
+AUTH_FAILURE_STATUSES = {401, 403}
+
+# Set by callers that can lose the right to run mid-way (report_worker: its
+# lease). A callable that returns False once nothing may be sent any more.
+send_guard: contextvars.ContextVar = contextvars.ContextVar('send_guard', default=None)
+
+class RunAbandoned(Exception):
+    """The send guard withdrew the run before anything was sent."""
+
+def _check_send_guard():
+    guard = send_guard.get()
+    if guard is not None and not guard():
+        raise RunAbandoned("No longer allowed to report for this soldier; nothing was sent.")
 
 def _extract_auth_token(local_storage: dict):
     """
@@ -35,16 +64,31 @@ def _extract_auth_token(local_storage: dict):
     # you might need deeper parsing logic here.
     return None
 
-def send_report(client: httpx.Client, date_obj: datetime.date) -> dict:
-    url = f"{BASE_URL}/api/Attendance/InsertFutureReport"
-    date_str = date_obj.strftime("%d.%m.%Y")
-    
-    payload = {
+def build_report_payload(date_obj: datetime.date) -> dict:
+    return {
         'MainCode': '01',
         'SecondaryCode': '01',
         'Note': '',
-        'FutureReportDate': date_str
+        'FutureReportDate': date_obj.strftime("%d.%m.%Y")
     }
+
+def report_dates(start: datetime.date, count: int = REPORT_DAYS, exclude=()) -> List[datetime.date]:
+    """
+    The first `count` reportable days from `start` (inclusive): no weekend days,
+    holidays or `exclude`d dates. Sliced from the shared calendar in core.reportable_days.
+    """
+    return next_reportable_days(count, start, exclude)
+
+def send_report(client: "httpx.Client", date_obj: datetime.date, payload: dict = None) -> dict:
+    """
+    Posts one day's report. `payload` defaults to the standard report for
+    `date_obj`; the outbox passes the payload it stored when the send failed.
+    """
+    url = f"{BASE_URL}/api/Attendance/InsertFutureReport"
+    date_str = date_obj.strftime("%d.%m.%Y")
+    
+    if payload is None:
+        payload = build_report_payload(date_obj)
     
     # Note: We rely on the client's default headers for User-Agent/Auth
     # We only add specific headers for this request here.
@@ -93,69 +137,119 @@ def send_report(client: httpx.Client, date_obj: datetime.date) -> dict:
 
     return result
 
-def run_attendance_for_user(soldier: Soldier):
+def build_client(cookies: dict, local_storage: dict) -> "httpx.Client":
+    """An HTTP client carrying the soldier's session (cookies and, if present, Bearer token)."""
+    import httpx
+
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Upgrade-Insecure-Requests": "1"
+    }
+
+    # If your site uses Bearer tokens in LocalStorage, inject them here:
+    token = _extract_auth_token(local_storage)
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+        logger.info("Injecting Authorization token from Local Storage.")
+
+    # We turn off SSL verify because IDF sites often have cert issues, but be careful.
+    return httpx.Client(cookies=cookies, headers=headers, verify=False, timeout=30.0)
+
+def session_needs_refresh(soldier: Soldier, margin: datetime.timedelta = None) -> bool:
+    """True unless the stored tokens are known to be valid for at least `margin`."""
+    if margin is None:
+        margin = datetime.timedelta(minutes=settings.AUTO_REPORTER_FOREGROUND_REFRESH_MARGIN_MINUTES)
+    if soldier.session_expires_at is None:
+        return True
+    return soldier.session_expires_at <= timezone.now() + margin
+
+def refresh_session(soldier: Soldier, priority: str = PRIORITY_INTERACTIVE) -> bool:
+    """
+    Runs the Selenium refresh with the soldier's stored state and saves the
+    fresh state. Returns True if the DB was updated. `priority` is the lane
+    the refresh waits in for a browser.
+    """
+    def report_position(position, queue_length):
+        # Shows up in the streaming terminal, so the user knows why nothing is happening
+        logger.warning(f"Waiting for a browser slot (position {position} of {queue_length})...")
+
+    if settings.AUTO_REPORTER_REFRESH_MODE == 'service':
+        # The refresh service owns Chrome (and its own admission control)
+        fresh_data = refresh_via_service(
+            soldier.cookies,
+            soldier.local_storage,
+            soldier.session_storage,
+            profile_key=soldier.personal_id,
+            priority=priority
+        )
+    else:
+        try:
+            with get_browser_admission().slot(priority, timeout=settings.AUTO_REPORTER_ADMISSION_TIMEOUT,
+                                              on_wait=report_position):
+                # We explicitly pass the current storage state to Selenium
+                fresh_data = refresh_with_selenium(
+                    soldier.cookies, 
+                    soldier.local_storage, 
+                    soldier.session_storage,
+                    profile_key=soldier.personal_id
+                )
+        except AdmissionTimeout as e:
+            logger.warning(f"{e}. Using existing DB data.")
+            return False
+
+    if not fresh_data:
+        logger.info("Selenium refresh skipped or failed. Using existing DB data.")
+        return False
+
+    logger.info("Selenium refresh successful. Updating Soldier data.")
+    
+    # Unpack fresh data
+    soldier.cookies = fresh_data['cookies']
+    soldier.local_storage = fresh_data.get('local_storage', {})
+    soldier.session_storage = fresh_data.get('session_storage', {})
+    soldier.save()
+    return True
+
+def _send_reports(client: "httpx.Client", dates: List[datetime.date]) -> List[dict]:
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # We map the client and dates to the function. Each task runs in a copy of
+        # our context so the UI log stream it belongs to follows it into the pool.
+        ctx = contextvars.copy_context()
+        return list(executor.map(lambda d: ctx.copy().run(send_report, client, d), dates))
+
+def run_attendance_for_user(soldier: Soldier, priority: str = PRIORITY_INTERACTIVE):
     """
-    Orchestrates the attendance reporting process.
+    Orchestrates the attendance reporting process. `priority` decides which
+    lane the run waits in for a browser and for the HTTP phase.
     Returns: (results_list, boolean_indicating_if_db_was_updated)
     """
     logger.info(f"Running attendance for soldier {soldier.personal_id}")
      
     # --- 1. Calculate Dates ---
-    today = datetime.date.today()
-    dates_to_report = []
-    i = 0
-    while len(dates_to_report) < 8:
-        d = today + datetime.timedelta(days=i)
-        if d.weekday() not in WEEKEND:
-            dates_to_report.append(d)
-        i += 1
+    dates_to_report = report_dates(datetime.date.today(), exclude=soldier.excluded_days)
 
     # --- 2. Selenium Refresh Strategy ---
-    # We explicitly pass the current storage state to Selenium
-    fresh_data = refresh_with_selenium(
-        soldier.cookies, 
-        soldier.local_storage, 
-        soldier.session_storage
-    )
-
+    # The background refresher normally keeps sessions fresh, so only launch
+    # a browser here if the stored session is about to expire (or unknown).
     db_updated = False
-    
+    refreshed = session_needs_refresh(soldier)
+    if refreshed:
+        db_updated = refresh_session(soldier, priority)
+    else:
+        logger.info(f"Session valid until {soldier.session_expires_at:%H:%M}. Skipping Selenium refresh.")
+
     # Prepare the active session data
     active_cookies = soldier.cookies
     active_local_storage = soldier.local_storage
-    
-    if fresh_data:
-        logger.info("Selenium refresh successful. Updating Soldier data.")
-        
-        # Unpack fresh data
-        soldier.cookies = fresh_data['cookies']
-        soldier.local_storage = fresh_data.get('local_storage', {})
-        soldier.session_storage = fresh_data.get('session_storage', {})
-        soldier.save()
-        
-        active_cookies = soldier.cookies
-        active_local_storage = soldier.local_storage
-        db_updated = True
-    else:
-        logger.info("Selenium refresh skipped or failed. Using existing DB data.")
-
-    # --- 3. Prepare HTTP Client ---
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Upgrade-Insecure-Requests": "1"
-    }
-
-    # If your site uses Bearer tokens in LocalStorage, inject them here:
-    token = _extract_auth_token(active_local_storage)
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-        logger.info("Injecting Authorization token from Local Storage.")
 
     results = []
 
-    # --- 4. Execute Reports ---
-    # We turn off SSL verify because IDF sites often have cert issues, but be careful.
-    with httpx.Client(cookies=active_cookies, headers=headers, verify=False, timeout=30.0) as client:
+    def report_position(position, queue_length):
+        logger.warning(f"Waiting to send reports (position {position} of {queue_length})...")
+
+    # --- 3. Execute Reports ---
+    with get_report_lanes().slot(priority, on_wait=report_position), \
+            build_client(active_cookies, active_local_storage) as client:
         
         # A. Pre-flight (Lightweight check to ensure session is valid)
         try:
@@ -164,10 +258,8 @@ def run_attendance_for_user(soldier: Soldier):
             logger.info(f"HTTP Client Pre-flight warning: {e}")
 
         # B. Send Reports Concurrently
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            # We map the client and dates to the function
-            future_results = executor.map(lambda d: send_report(client, d), dates_to_report)
-            results = list(future_results)
+        _check_send_guard()
+        results = _send_reports(client, dates_to_report)
 
         # C. Post-Flight: Check if HTTP calls rotated the cookies
         # Some servers rotate the session cookie on every request.
@@ -185,4 +277,46 @@ def run_attendance_for_user(soldier: Soldier):
                 soldier.save()
                 db_updated = True
 
-    return results, db_updated
\ No newline at end of file
+    # --- 3b. A session upstream rejects gets one refresh (if we didn't just do one) and a resend ---
+    rejected = [i for i, result in enumerate(results) if result['status'] in AUTH_FAILURE_STATUSES]
+    if rejected and not refreshed:
+        logger.warning(f"Upstream rejected the session (HTTP {results[rejected[0]]['status']}). Refreshing it...")
+        if refresh_session(soldier, priority):
+            db_updated = True
+            with get_report_lanes().slot(priority, on_wait=report_position), \
+                    build_client(soldier.cookies, soldier.local_storage) as client:
+                _check_send_guard()
+                resent = _send_reports(client, [dates_to_report[i] for i in rejected])
+            for i, result in zip(rejected, resent):
+                results[i] = result
+
+    # --- 4. Keep undelivered days for the outbox drainer; settle the ones delivered now ---
+    delivered = []
+    for date_obj, result in zip(dates_to_report, results):
+        if result['success']:
+            delivered.append(date_obj)
+        elif outbox.is_transport_failure(result):
+            outbox.enqueue(soldier, date_obj, build_report_payload(date_obj), result["message"])
+            logger.warning(f"[QUEUED] [{result['date']}] kept in the outbox; it will be resent when upstream recovers.")
+    if delivered:
+        outbox.settle_delivered(soldier, delivered)
+
+    return results, db_updated
+
+def run_report(soldier: Soldier, source: str = ReportRun.SOURCE_INTERACTIVE, runner=None, priority: str = None):
+    """
+    Entry point for the web views and workers: runs the configured per-soldier
+    report function (AUTO_REPORTER_RUNNER) and records the run for the fleet view.
+    Worker runs go in the background lane unless `priority` says otherwise.
+    """
+    runner = runner or import_string(settings.AUTO_REPORTER_RUNNER)
+    if priority is None:
+        priority = PRIORITY_INTERACTIVE if source == ReportRun.SOURCE_INTERACTIVE else PRIORITY_BACKGROUND
+    results, db_updated = runner(soldier, priority=priority)
+
+    try:
+        record_run(soldier, results, source)
+    except Exception as e:
+        logger.warning(f"Could not record run for fleet view: {e}")
+
+    return results, db_updated
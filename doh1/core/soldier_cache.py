@@ -0,0 +1,75 @@
+"""
+Read-through cache for Soldier rows (with their parsed storage) on top of
+Django's cache framework, so page loads skip the DB hit and the JSON parsing.
+
+Entries are versioned rather than deleted: every save/delete of a soldier
+bumps that soldier's version key, and bulk writes that bypass signals bump a
+global generation. A reader always builds its key from the current versions,
+so a write from any process sharing the cache (workers, refresher, drainer)
+is visible on the next read. Versions are bumped once the write commits: a
+bump inside a transaction would let a concurrent reader cache the old row
+under the new version. With the locmem backend that only holds within
+one process; use the file-based (default) or a shared backend otherwise.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Soldier
+
+
+GENERATION_KEY = 'soldier:generation'
+
+
+def _version_key(soldier_id) -> str:
+    return f'soldier:{soldier_id}:version'
+
+
+def _new_version() -> int:
+    # Time-based, so a version key that was evicted never comes back as an old value
+    return time.time_ns()
+
+
+def _current(versions: dict, key: str) -> int:
+    version = versions.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_soldier(soldier_id) -> Soldier:
+    """Like `Soldier.objects.get(id=...)` (raises DoesNotExist too), served from the cache when possible."""
+    version_key = _version_key(soldier_id)
+    versions = cache.get_many([GENERATION_KEY, version_key])
+    key = f'soldier:{soldier_id}:{_current(versions, GENERATION_KEY)}.{_current(versions, version_key)}'
+
+    soldier = cache.get(key)
+    if soldier is None:
+        soldier = Soldier.objects.get(id=soldier_id)
+        # Parse once here; the memoized values travel with the cached instance
+        soldier.cookies, soldier.local_storage, soldier.session_storage
+        cache.set(key, soldier, settings.AUTO_REPORTER_SOLDIER_CACHE_SECONDS)
+    return soldier
+
+
+def invalidate_soldier(soldier_id) -> None:
+    cache.set(_version_key(soldier_id), _new_version(), None)
+
+
+def invalidate_all_soldiers() -> None:
+    """For writes that skip model signals (bulk_create/update). Takes effect on commit."""
+    transaction.on_commit(lambda: cache.set(GENERATION_KEY, _new_version(), None))
+
+
+@receiver([post_save, post_delete], sender=Soldier)
+def _invalidate_on_write(sender, instance, using, **kwargs):
+    # The cache only ever holds rows read from the default DB
+    if using != DEFAULT_DB_ALIAS:
+        return
+    soldier_id = instance.pk
+    transaction.on_commit(lambda: invalidate_soldier(soldier_id), using=using)
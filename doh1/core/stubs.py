@@ -0,0 +1,51 @@
+"""
+Stand-ins for tests and load tests: same signatures and return shapes as
+`services.run_attendance_for_user` and `refresh_with_selenium`, but no
+browser and no network. Point AUTO_REPORTER_RUNNER (or a command's --runner
+/ --refresh-function) at them.
+"""
+import datetime
+import os
+import time
+
+from .loggers import get_ui_logger
+
+logger = get_ui_logger()
+
+
+def stub_run_attendance(soldier, priority=None):
+    delay = float(os.environ.get('DOH1_STUB_DELAY', '0.05'))
+    log_path = os.environ.get('DOH1_STUB_LOG')
+
+    logger.info(f"[STUB] Running attendance for soldier {soldier.personal_id}")
+    time.sleep(delay)
+
+    if log_path:
+        # One short O_APPEND write per call, safe across processes
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(f"{soldier.personal_id}\n")
+
+    today = datetime.date.today()
+    results = []
+    for i in range(8):
+        date_str = (today + datetime.timedelta(days=i)).strftime("%d.%m.%Y")
+        logger.info(f"[SUCCESS] Updated date for [{date_str}]")
+        results.append({
+            "date": date_str,
+            "success": True,
+            "status": 200,
+            "message": "Reported successfully (stub)",
+            "debug": {}
+        })
+    return results, False
+
+
+def stub_refresh_with_selenium(cookies, local_storage=None, session_storage=None, profile_key=None):
+    """Stand-in for `refresh_with_selenium` (e.g. `refresh_service --refresh-function`)."""
+    logger.info(f"[STUB] Refreshing session in process {os.getpid()}")
+    time.sleep(float(os.environ.get('DOH1_STUB_DELAY', '0.05')))
+    return {
+        'cookies': dict(cookies or {}, StubRefreshedBy=str(os.getpid())),
+        'local_storage': local_storage or {},
+        'session_storage': session_storage or {},
+    }
@@ -1,3 +1,1192 @@
-from django.test import TestCase
+import asyncio
+import base64
+import datetime
+import fnmatch
+import io
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.asgi import get_asgi_application
+from django.urls import path, reverse
+from django.utils import timezone
+
+import httpx
+from asgiref.sync import sync_to_async
+
+from core.admission import AdmissionTimeout, BrowserAdmission
+from core.drainer import OutboxDrainer
+from core.fleet import get_rollup, record_run
+from core.importers import import_states, iter_ndjson, iter_zip
+from core.lanes import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PriorityLanes
+from core.management.commands.report_worker import Command as ReportWorkerCommand
+from core.models import OutboxReport, ReportedDay, ReportLease, Soldier
+from core.refresh_service import RefreshService, WorkerDied, refresh_via_service, service_stats
+from doh1 import settings as project_settings  # as configured, without test overrides
+from core import (driver_cache, leases, profiles, reportable_days, resource_blocking, selenium_automation,
+                  services, views)
+from core.profiles import ProfileCache
+from core.refresher import SessionRefresher
+from core.views import execute_report, execute_report_async
+from core.request_threads import SharedRequestThreads
+from core.services import run_attendance_for_user
+from core.soldier_cache import get_soldier
+from core.tokens import session_expiry
+
+
+MANAGE_PY = str(Path(settings.BASE_DIR) / 'manage.py')
+
+# URLconf for tests that serve /run/ with the async stream, as doh1.asgi deployments do
+urlpatterns = [
+    path('run/', execute_report_async, name='execute_report'),
+    path('report/view/', views.view_report_results, name='view_report_results'),
+]
+
+
+class DriverCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_file = Path(tmp.name) / 'driver_paths.json'
+        self.driver = Path(tmp.name) / 'chromedriver'
+        self.driver.touch()
+
+        overridden = override_settings(DRIVER_CACHE_FILE=self.cache_file)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+        mock.patch.object(driver_cache, '_resolved_paths', None).start()
+        self.resolve = mock.patch.object(
+            driver_cache, '_resolve_paths',
+            return_value={'driver_path': str(self.driver), 'chrome_binary': None},
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_resolved_once_then_reused_across_processes(self):
+        paths = driver_cache.get_driver_paths()
+        self.assertEqual(paths['driver_path'], str(self.driver))
+        self.assertIs(driver_cache.get_driver_paths(), paths)
+
+        # A new process (empty memo) starts from the disk cache
+        driver_cache._resolved_paths = None
+        self.assertTrue(driver_cache.check_driver_cache())
+        self.assertEqual(driver_cache.get_driver_paths(), paths)
+        self.assertEqual(self.resolve.call_count, 1)
+
+    def test_stale_or_invalidated_cache_is_resolved_again(self):
+        driver_cache.get_driver_paths()
+
+        driver_cache.invalidate_driver_paths()
+        self.assertFalse(self.cache_file.exists())
+        driver_cache.get_driver_paths()
+        self.assertEqual(self.resolve.call_count, 2)
+
+        # The cached driver was removed (e.g. Chrome updated and the driver was replaced)
+        self.driver.unlink()
+        driver_cache._resolved_paths = None
+        self.assertFalse(driver_cache.check_driver_cache())
+        self.assertIsNone(driver_cache.load_cached_paths())
+
+
+def perf_entry(method, **params):
+    """One Chrome performance-log entry, as `driver.get_log('performance')` returns them."""
+    return {'message': json.dumps({'message': {'method': method, 'params': params}})}
+
+
+class ResourceBlockingTests(SimpleTestCase):
+    def test_allowed_hosts_from_url_patterns(self):
+        hosts = resource_blocking._allowed_hosts([
+            'https://one.prat.idf.il/*', 'https://*.idf.il/*', 'https://*.idf.il/other/*', 'login.example.com/x',
+        ])
+        self.assertEqual(hosts, ['one.prat.idf.il', '*.idf.il', 'login.example.com'])
+
+    def test_blocked_url_patterns_cover_assets_and_analytics(self):
+        patterns = resource_blocking.blocked_url_patterns()
+        blocked = lambda url: any(fnmatch.fnmatchcase(url, p) for p in patterns)
+        self.assertTrue(blocked('https://one.prat.idf.il/static/logo.png'))
+        self.assertTrue(blocked('https://one.prat.idf.il/app.css?v=3'))
+        self.assertTrue(blocked('https://www.google-analytics.com/collect'))
+        self.assertFalse(blocked('https://one.prat.idf.il/api/Attendance/InsertPersonalReport'))
+
+    def test_collect_stats_counts_loaded_and_blocked_requests(self):
+        driver = mock.Mock()
+        driver.get_log.return_value = [
+            perf_entry('Network.requestWillBeSent', requestId='1', type='Document',
+                       request={'url': 'https://one.prat.idf.il/'}),
+            perf_entry('Network.loadingFinished', requestId='1', encodedDataLength=4096),
+            perf_entry('Network.requestWillBeSent', requestId='2', type='Image',
+                       request={'url': 'https://one.prat.idf.il/logo.png'}),
+            perf_entry('Network.loadingFailed', requestId='2', blockedReason='inspector'),
+            perf_entry('Network.requestWillBeSent', requestId='3', type='Script',
+                       request={'url': 'https://cdn.example.com/tracker.js'}),
+            perf_entry('Network.loadingFailed', requestId='3', errorText='net::ERR_NAME_NOT_RESOLVED'),
+            # A real DNS failure on an allowed host was not our doing
+            perf_entry('Network.requestWillBeSent', requestId='4', type='XHR',
+                       request={'url': 'https://one.prat.idf.il/api'}),
+            perf_entry('Network.loadingFailed', requestId='4', errorText='net::ERR_NAME_NOT_RESOLVED'),
+            {'message': 'not json'},
+        ]
+
+        stats = resource_blocking.collect_stats(driver)
+        self.assertEqual(stats['requests_loaded'], 1)
+        self.assertEqual(stats['bytes_loaded'], 4096)
+        self.assertEqual(stats['requests_blocked'], 2)
+        self.assertEqual(stats['blocked_by_type'], {'Image': 1, 'Script': 1})
+        self.assertEqual(stats['bytes_avoided_estimate'],
+                         resource_blocking.ESTIMATED_BYTES_BY_TYPE['Image']
+                         + resource_blocking.ESTIMATED_BYTES_BY_TYPE['Script'])
+
+    @override_settings(SELENIUM_BLOCK_RESOURCES=True)
+    def test_refresh_survives_missing_performance_log(self):
+        driver = mock.MagicMock(current_url='https://one.prat.idf.il/finish')
+        driver.get_cookies.return_value = [{'name': 'AppCookie', 'value': 'fresh'}]
+        driver.execute_script.return_value = {}
+        driver.get_log.side_effect = Exception("log type 'performance' not found")
+
+        with mock.patch.object(selenium_automation, '_setup_driver', return_value=driver), \
+                self.assertLogs('ui_logger', 'WARNING') as logs:
+            fresh = selenium_automation.refresh_with_selenium({'AppCookie': 'old'})
+
+        self.assertIn('Could not collect resource stats', logs.output[0])
+
+        self.assertEqual(fresh['cookies'], {'AppCookie': 'fresh'})
+        self.assertNotIn('resource_stats', fresh)
+        driver.quit.assert_called_once()
+
+
+class ProfileCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = ProfileCache(Path(tmp.name), budget_bytes=1500)
+
+    def use(self, key, size=1000):
+        with self.cache.checkout(key) as profile:
+            (profile.path / 'Cache').write_bytes(b'x' * size)
+            return profile.path
+
+    def profiles(self):
+        return {p.name for p in self.cache.root.iterdir() if p.is_dir() and not p.name.startswith('.')}
+
+    def test_least_recently_used_profiles_evicted_over_budget(self):
+        self.use('a')
+        self.use('b')
+        self.assertEqual(self.profiles(), {'b'})
+
+        self.use('c', size=100)
+        self.use('b')  # b is now the most recent
+        self.assertEqual(self.profiles(), {'b', 'c'})
+        self.use('d', size=400)  # c was used before b, so c goes first
+        self.assertEqual(self.profiles(), {'b', 'd'})
+
+    def test_profile_checked_out_by_another_process_is_not_evicted(self):
+        self.use('a')
+        holder = subprocess.Popen(
+            [sys.executable, '-c',
+             'import fcntl, sys\n'
+             f'f = open({str(self.cache.root / ".locks" / "a.lock")!r}, "a")\n'
+             'fcntl.flock(f, fcntl.LOCK_EX)\n'
+             'print("locked", flush=True)\n'
+             'sys.stdin.read()\n'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+        self.addCleanup(holder.wait)
+        self.addCleanup(holder.stdin.close)
+        self.assertEqual(holder.stdout.readline().strip(), 'locked')
+
+        self.use('b')
+        self.assertEqual(self.profiles(), {'a'})  # a is older, but in use: b goes instead
+
+        holder.stdin.close()
+        holder.wait(10)
+        self.use('c')
+        self.assertEqual(self.profiles(), {'c'})
+
+    def warm_profile(self, key):
+        with self.cache.checkout(key) as profile:
+            (profile.path / 'Cookies').write_bytes(b'session')
+            profile.mark_warm()
+            return profile.path
+
+    def refresh(self, **driver):
+        with override_settings(SELENIUM_PERSISTENT_PROFILES=True), \
+                mock.patch.object(profiles, 'get_profile_cache', return_value=self.cache), \
+                mock.patch.object(selenium_automation, '_setup_driver', **driver), \
+                mock.patch.object(selenium_automation.time, 'sleep'), \
+                self.assertLogs('ui_logger', 'INFO'):
+            return selenium_automation.refresh_with_selenium({'AppCookie': 'old'}, profile_key='a')
+
+    def test_warm_profile_survives_a_browser_crash(self):
+        path = self.warm_profile('a')
+
+        self.assertIsNone(self.refresh(side_effect=Exception('chrome not reachable')))
+
+        self.assertEqual((path / 'Cookies').read_bytes(), b'session')
+        with self.cache.checkout('a') as profile:
+            self.assertTrue(profile.warm)
+
+    def test_warm_profile_on_the_login_page_is_rebuilt(self):
+        path = self.warm_profile('a')
+        driver = mock.MagicMock(current_url='https://one.prat.idf.il/login')
+
+        self.assertIsNone(self.refresh(return_value=driver))
+
+        self.assertFalse((path / 'Cookies').exists())
+        with self.cache.checkout('a') as profile:
+            self.assertFalse(profile.warm)
+
+
+class ReportWorkerTests(SimpleTestCase):
+    """
+    Runs several real `report_worker` processes against one SQLite file
+    (the test database is in-memory, so these use their own DB).
+    """
+    SOLDIERS = 40
+    WORKERS = 4
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'db.sqlite3')
+        self.stub_log = os.path.join(self.tmp.name, 'reported.log')
+        self.env = dict(
+            os.environ,
+            DOH1_DB_PATH=self.db_path,
+            DOH1_STUB_LOG=self.stub_log,
+            DOH1_STUB_DELAY='0.02',
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def manage(self, *args):
+        return subprocess.run(
+            [sys.executable, MANAGE_PY, *args],
+            env=self.env, check=True, capture_output=True, text=True, cwd=settings.BASE_DIR
+        )
+
+    def test_every_soldier_reported_exactly_once(self):
+        self.manage('migrate', '--verbosity', '0')
+        self.manage('shell', '-c', (
+            "import datetime\n"
+            "from django.utils import timezone\n"
+            "from core.models import Soldier, ReportLease\n"
+            f"for i in range({self.SOLDIERS}):\n"
+            "    Soldier.objects.create(personal_id=f's{i:03d}', _cookies_data='{\"AppCookie\": \"x\"}')\n"
+            "Soldier.objects.create(personal_id='no-session')\n"
+            # A lease left behind by a worker that crashed mid-run
+            "ReportLease.objects.create(soldier=Soldier.objects.get(personal_id='s000'),\n"
+            "    run_date=timezone.localdate(), owner='dead-worker', attempts=1,\n"
+            "    expires_at=timezone.now() - datetime.timedelta(minutes=5))\n"
+        ))
+
+        workers = [
+            subprocess.Popen(
+                [sys.executable, MANAGE_PY, 'report_worker',
+                 '--runner', 'core.stubs.stub_run_attendance',
+                 '--exit-when-done', '--poll', '0.1'],
+                env=self.env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                cwd=settings.BASE_DIR,
+            )
+            for _ in range(self.WORKERS)
+        ]
+        for proc in workers:
+            _out, err = proc.communicate(timeout=120)
+            self.assertEqual(proc.returncode, 0, err)
+
+        with open(self.stub_log, encoding='utf-8') as f:
+            reported = Counter(line.strip() for line in f if line.strip())
+
+        expected = {f's{i:03d}' for i in range(self.SOLDIERS)}
+        self.assertEqual(set(reported), expected)
+        self.assertEqual([pid for pid, n in reported.items() if n != 1], [])
+
+        with sqlite3.connect(self.db_path) as db:
+            statuses = dict(db.execute("SELECT status, COUNT(*) FROM core_reportlease GROUP BY status"))
+            reclaimed_owner = db.execute(
+                "SELECT l.owner FROM core_reportlease l JOIN core_soldier s ON s.id = l.soldier_id "
+                "WHERE s.personal_id = 's000'"
+            ).fetchone()[0]
+        self.assertEqual(statuses, {'done': self.SOLDIERS})
+        self.assertEqual(reclaimed_owner, '')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReportLeaseTests(TransactionTestCase):
+    def lease(self, personal_id, **fields):
+        soldier = Soldier.objects.create(personal_id=personal_id, _cookies_data='{"AppCookie": "x"}')
+        return ReportLease.objects.create(soldier=soldier, run_date=timezone.localdate(), **fields)
+
+    def test_lease_abandoned_max_attempts_times_is_failed_not_reclaimed(self):
+        expired = timezone.now() - datetime.timedelta(minutes=5)
+        crashing = self.lease('crashing', owner='dead-worker', attempts=3, expires_at=expired)
+        retried = self.lease('retried', owner='dead-worker', attempts=2, expires_at=expired)
+
+        claimed = leases.claim_next('me', timezone.localdate(), datetime.timedelta(minutes=5), max_attempts=3)
+        self.assertEqual(claimed.pk, retried.pk)
+        self.assertIsNone(leases.claim_next('me', timezone.localdate(), datetime.timedelta(minutes=5), max_attempts=3))
+
+        crashing.refresh_from_db()
+        self.assertEqual((crashing.status, crashing.owner, crashing.attempts),
+                         (ReportLease.STATUS_FAILED, '', 3))
+        self.assertIsNotNone(crashing.finished_at)
+
+    def test_worker_sends_nothing_and_records_nothing_after_losing_its_lease(self):
+        self.lease('alpha')
+        lease = leases.claim_next('me', timezone.localdate(), datetime.timedelta(seconds=0.3), max_attempts=3)
+
+        def slow_refresh(soldier, priority):
+            # A long Selenium run, during which the heartbeat fails to renew
+            deadline = time.monotonic() + 5
+            while services.send_guard.get()() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            return False
+
+        worker = ReportWorkerCommand(stdout=io.StringIO(), stderr=io.StringIO())
+        with mock.patch.object(leases, 'renew', return_value=False), \
+                mock.patch.object(services, 'refresh_session', side_effect=slow_refresh), \
+                mock.patch.object(services, 'build_client'), \
+                mock.patch.object(services, '_send_reports') as send_reports, \
+                self.assertLogs('ui_logger', 'INFO'):
+            worker._run_lease(lease, run_attendance_for_user, datetime.timedelta(seconds=0.3),
+                              datetime.timedelta(seconds=60), max_attempts=3)
+
+        send_reports.assert_not_called()
+        self.assertIn('lease lost before sending', worker.stderr.getvalue())
+        lease.refresh_from_db()
+        self.assertEqual((lease.status, lease.owner, lease.finished_at), (ReportLease.STATUS_PENDING, 'me', None))
+
+
+@override_settings(AUTO_REPORTER_RUNNER='core.stubs.stub_run_attendance',
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AsyncStreamTests(TransactionTestCase):
+    def request_for(self, personal_id):
+        soldier = Soldier.objects.create(personal_id=personal_id, _cookies_data='{"AppCookie": "x"}')
+        request = RequestFactory().get('/run/')
+        request.session = SessionStore()
+        request.session['user_id'] = soldier.id
+        request.session.save()
+        return request
+
+    async def stream(self, request):
+        response = await execute_report_async(request)
+        return ''.join([chunk.decode() if isinstance(chunk, bytes) else chunk
+                        async for chunk in response.streaming_content])
+
+    async def test_concurrent_streams_only_see_their_own_run(self):
+        requests = [await sync_to_async(self.request_for)(pid) for pid in ('alpha', 'bravo')]
+        bodies = await asyncio.gather(*(self.stream(r) for r in requests))
+
+        for body, mine, other in zip(bodies, ('alpha', 'bravo'), ('bravo', 'alpha')):
+            self.assertIn(f'Running attendance for soldier {mine}', body)
+            self.assertNotIn(f'Running attendance for soldier {other}', body)
+            self.assertIn("window.location.href = '/report/view/'", body)
+
+        for request in requests:
+            session = await sync_to_async(SessionStore)(request.session.session_key)
+            results = await sync_to_async(session.get)('report_results')
+            self.assertEqual(len(results), 8)
+
+    def test_concurrent_sync_streams_only_see_their_own_run(self):
+        requests = [self.request_for(pid) for pid in ('alpha', 'bravo')]
+        both_running = threading.Barrier(2, timeout=5)
+        bodies = {}
+        run_report = views.run_report
+
+        def run_together(soldier):
+            both_running.wait()
+            return run_report(soldier)
+
+        def stream(request):
+            chunks = execute_report(request).streaming_content
+            bodies[request] = ''.join(c.decode() if isinstance(c, bytes) else c for c in chunks)
+
+        with mock.patch('core.views.run_report', side_effect=run_together):
+            threads = [threading.Thread(target=stream, args=(r,)) for r in requests]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(30)
+
+        for request, mine, other in zip(requests, ('alpha', 'bravo'), ('bravo', 'alpha')):
+            self.assertIn(f'Running attendance for soldier {mine}', bodies[request])
+            self.assertNotIn(f'Running attendance for soldier {other}', bodies[request])
+            self.assertIn('All tasks complete', bodies[request])
+
+    @override_settings(ROOT_URLCONF='core.tests')
+    def test_open_streams_hold_a_bounded_number_of_threads(self):
+        streams, shared_threads = 16, 2
+        app = SharedRequestThreads(get_asgi_application(), execute_report_async, shared_threads)
+        release = threading.Event()
+        started = []
+
+        def blocked_run(soldier):
+            release.wait(10)
+            return [], False
+
+        async def open_stream(request):
+            scope = {'type': 'http', 'method': 'GET', 'path': '/run/', 'raw_path': b'/run/', 'query_string': b'',
+                     'headers': [(b'cookie', f'sessionid={request.session.session_key}'.encode())],
+                     'server': ('testserver', 80), 'client': ('127.0.0.1', 0), 'scheme': 'http',
+                     'root_path': '', 'asgi': {'version': '3.0'}, 'http_version': '1.1'}
+            requests = asyncio.Queue()
+            requests.put_nowait({'type': 'http.request', 'body': b'', 'more_body': False})
+            body = []
+
+            async def send(message):
+                body.append(message.get('body', b''))
+                if b'Background worker started' in message.get('body', b''):
+                    started.append(request)
+
+            await app(scope, requests.get, send)
+            return b''.join(body).decode()
+
+        async def serve(requests):
+            tasks = [asyncio.ensure_future(open_stream(r)) for r in requests]
+            while len(started) < streams:
+                await asyncio.sleep(0.05)
+            held = threading.active_count() - before
+            release.set()
+            return held, await asyncio.gather(*tasks)
+
+        requests = [self.request_for(f'stream-{i}') for i in range(streams)]
+        before = threading.active_count()
+        with mock.patch('core.views.run_report', side_effect=blocked_run):
+            # A plain event loop, as under uvicorn (an async test would run sync code on its own thread)
+            held, bodies = asyncio.run(serve(requests))
+
+        # Without the shared contexts every open stream parks one more thread
+        self.assertLessEqual(held, settings.AUTO_REPORTER_RUN_THREADS + shared_threads)
+        self.assertTrue(all("window.location.href = '/report/view/'" in body for body in bodies))
+
+    async def test_stream_errors_are_logged_and_shown(self):
+        request = await sync_to_async(self.request_for)('broken')
+        with mock.patch('core.views.run_report', side_effect=RuntimeError('upstream exploded')), \
+                self.assertLogs('ui_logger', 'ERROR') as logs:
+            body = await self.stream(request)
+
+        self.assertIn('Error: upstream exploded', body)
+        self.assertIn('Traceback', logs.output[0])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SessionImportTests(TestCase):
+    def setUp(self):
+        Soldier.objects.create(personal_id='100', _cookies_data='{"AppCookie": "old"}')
+
+    def export_zip(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            # Per-soldier exports: the file name is the personal_id
+            archive.writestr('100.json', json.dumps({'cookies': [{'name': 'AppCookie', 'value': 'new'}],
+                                                     'localStorage': {'token': 't'}}))
+            archive.writestr('broken.json', '{not json')
+            archive.writestr('more/batch.ndjson', '\n'.join([
+                json.dumps({'personal_id': '200', 'AppCookie': 'a'}),
+                json.dumps({'personal_id': '300', 'export': {'cookies': {'AppCookie': 'b'}}}),
+            ]))
+            archive.writestr('README.md', 'ignored')
+        buffer.seek(0)
+        return buffer
+
+    def cookies(self, personal_id):
+        return Soldier.objects.get(personal_id=personal_id).cookies
+
+    def test_zip_of_exports_and_ndjson(self):
+        report = import_states(iter_zip(self.export_zip()))
+
+        self.assertEqual((report['processed'], report['created'], report['updated']), (4, 2, 1))
+        self.assertEqual([label for label, _ in report['errors']], ['broken.json'])
+        self.assertEqual(self.cookies('100'), {'AppCookie': 'new'})
+        self.assertEqual(Soldier.objects.get(personal_id='100').local_storage, {'token': 't'})
+        self.assertEqual(self.cookies('300'), {'AppCookie': 'b'})
+
+    def test_ndjson_per_record_errors_never_stop_the_import(self):
+        lines = [
+            json.dumps({'personal_id': '200', 'AppCookie': 'first'}),
+            '{"personal_id": ',
+            json.dumps({'AppCookie': 'whose?'}),
+            json.dumps({'personal_id': '400', 'cookies': {}}),
+            '',
+            json.dumps({'personal_id': '500', 'AppCookie': 'e'}),
+            json.dumps({'personal_id': '200', 'AppCookie': 'second'}),
+        ]
+        report = import_states(iter_ndjson(lines, label='in.ndjson'), batch_size=2)
+
+        errors = dict(report['errors'])
+        self.assertEqual(sorted(errors), ['in.ndjson:2', 'in.ndjson:3', 'in.ndjson:4'])
+        self.assertTrue(errors['in.ndjson:2'].startswith('Parse error'))
+        self.assertEqual(errors['in.ndjson:3'], 'Missing personal_id')
+        self.assertEqual(errors['in.ndjson:4'], 'No cookies in export')
+        self.assertEqual(report['processed'], 6)
+        self.assertEqual(self.cookies('200'), {'AppCookie': 'second'})  # later records win
+        self.assertEqual(self.cookies('500'), {'AppCookie': 'e'})
+
+    def test_create_missing_false_only_updates_known_soldiers(self):
+        report = import_states(iter_zip(self.export_zip()), create_missing=False)
+
+        self.assertEqual((report['created'], report['updated']), (0, 1))
+        self.assertEqual(sorted(label for label, message in report['errors'] if message == 'Unknown personal_id'),
+                         ['200', '300'])
+        self.assertFalse(Soldier.objects.filter(personal_id__in=['200', '300']).exists())
+
+    def test_admin_import_view(self):
+        User.objects.create_superuser('admin', password='pw')
+        self.client.login(username='admin', password='pw')
+        url = reverse('admin:core_soldier_import_sessions')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        upload = SimpleUploadedFile('exports.zip', self.export_zip().read(), content_type='application/zip')
+        response = self.client.post(url, {'export_file': upload, 'create_missing': 'on'}, follow=True)
+
+        shown = [str(m) for m in response.context['messages']]
+        self.assertIn('2 created, 1 updated, 1 errors', shown[0])
+        self.assertTrue(any(m.startswith('broken.json:') for m in shown[1:]))
+        self.assertEqual(self.cookies('200'), {'AppCookie': 'a'})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FleetViewTests(TestCase):
+    def setUp(self):
+        staff = User.objects.create_user('operator', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        cache.clear()
+
+    def make_soldiers(self, count, offset=0):
+        for i in range(offset, offset + count):
+            soldier = Soldier.objects.create(personal_id=f"f{i:04d}", _cookies_data='{"AppCookie": "x"}')
+            with self.captureOnCommitCallbacks(execute=True):
+                record_run(soldier, [
+                    {'date': '01.01.2030', 'success': True},
+                    {'date': '02.01.2030', 'success': i % 2 == 0},
+                ])
+
+    def page_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('fleet'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.make_soldiers(3)
+        small = self.page_queries()
+        self.make_soldiers(40, offset=3)
+        self.assertEqual(self.page_queries(), small)
+
+    def test_rollup_is_updated_when_runs_finish(self):
+        self.make_soldiers(4)
+        rollup = get_rollup()
+        self.assertEqual(rollup['soldiers_total'], 4)
+        self.assertEqual(rollup['soldiers_run_today'], 4)
+        self.assertEqual(rollup['soldiers_ok_today'], 2)
+
+        row = self.client.get(reverse('fleet')).context['page'][1]
+        self.assertEqual((row.personal_id, row.days_reported, row.last_run_success), ('f0001', 1, False))
+
+    def test_finished_runs_drop_the_rollup_instead_of_recomputing_it(self):
+        self.make_soldiers(2)
+        self.assertEqual(get_rollup()['soldiers_run_today'], 2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.make_soldiers(5, offset=2)
+        self.assertEqual([q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql']], [])
+
+        self.assertEqual(get_rollup()['soldiers_run_today'], 7)
+
+    def test_stale_sessions_are_counted_by_token_expiry(self):
+        make_soldier_with_session('fresh', datetime.timedelta(hours=2))
+        make_soldier_with_session('expiring', datetime.timedelta(minutes=2))
+        Soldier.objects.create(personal_id='unknown')
+
+        response = self.client.get(reverse('fleet'))
+        self.assertEqual(response.context['rollup']['soldiers_stale'], 2)
+        self.assertContains(response, 'expiry unknown', count=1)
+
+
+def make_jwt(exp):
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': int(exp.timestamp())}).encode()).rstrip(b'=')
+    return f"eyJhbGciOiJub25lIn0.{payload.decode()}.sig"
+
+
+def make_soldier_with_session(personal_id, expires_in):
+    soldier = Soldier(personal_id=personal_id, _cookies_data='{"AppCookie": "x"}')
+    soldier.local_storage = {'token': make_jwt(timezone.now() + expires_in)}
+    soldier.save()
+    return soldier
+
+
+class MigrationTests(SimpleTestCase):
+    def test_database_created_by_run_syncdb_upgrades_with_fake_initial(self):
+        expires = datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'db.sqlite3')
+            manage = lambda *args: subprocess.run(
+                [sys.executable, MANAGE_PY, *args], env=dict(os.environ, DOH1_DB_PATH=db_path),
+                capture_output=True, text=True, cwd=settings.BASE_DIR,
+            )
+            # What `migrate --run-syncdb` left behind before core had migrations:
+            # the baseline tables, but no record of core migrations
+            self.assertEqual(manage('migrate', 'core', '0001', '--verbosity', '0').returncode, 0)
+            with sqlite3.connect(db_path) as db:
+                db.execute("DELETE FROM django_migrations WHERE app = 'core'")
+                insert = ("INSERT INTO core_soldier (personal_id, name, _cookies_data, _local_storage_data, "
+                          "_session_storage_data, last_updated) VALUES (?, 'x', '{}', ?, '{}', '2026-01-01')")
+                db.execute(insert, ('old', '{}'))
+                db.execute(insert, ('signed-in', json.dumps({'token': make_jwt(expires)})))
+
+            upgrade = manage('migrate', '--fake-initial', '--verbosity', '0')
+            self.assertEqual(upgrade.returncode, 0, upgrade.stderr)
+
+            with sqlite3.connect(db_path) as db:
+                columns = {row[1] for row in db.execute("PRAGMA table_info(core_soldier)")}
+                soldiers = db.execute("SELECT personal_id, session_expires_at FROM core_soldier "
+                                      "ORDER BY personal_id").fetchall()
+                db.execute("SELECT COUNT(*) FROM core_outboxreport")
+            self.assertIn('session_expires_at', columns)
+            # Existing sessions get their expiry from the stored tokens, so they skip Selenium right away
+            self.assertEqual(soldiers, [('old', None), ('signed-in', '2030-01-01 00:00:00')])
+
+    def test_models_match_migrations(self):
+        out = io.StringIO()
+        with mock.patch('django.db.migrations.loader.MigrationLoader.check_consistent_history'):
+            call_command('makemigrations', '--check', '--dry-run', stdout=out)
+        self.assertIn('No changes detected', out.getvalue())
+
+
+class SessionRefresherTests(TransactionTestCase):
+    """Refreshes run in worker threads, so the rows must be committed."""
+    def setUp(self):
+        self.now = timezone.now()
+
+    def make_soldier(self, personal_id, expires_in, issued_ago=datetime.timedelta(hours=1)):
+        soldier = Soldier(personal_id=personal_id, _cookies_data='{"AppCookie": "x"}')
+        soldier.local_storage = {'token': make_jwt(self.now + expires_in)}
+        soldier.save()
+        # last_updated is when the current tokens were stored (their lifetime starts there)
+        Soldier.objects.filter(pk=soldier.pk).update(last_updated=self.now - issued_ago)
+        return soldier
+
+    def off_peak_refresher(self, **kwargs):
+        return SessionRefresher(concurrency=1, lead=datetime.timedelta(minutes=30),
+                                off_peak_lead=datetime.timedelta(hours=10), off_peak_hours=(0, 24), **kwargs)
+
+    def run_cycles(self, refresher, cycles=5):
+        """What refresh_sessions does: reload and tick once a minute."""
+        for cycle in range(cycles):
+            refresher.reload()
+            refresher.tick(self.now + datetime.timedelta(minutes=cycle))
+            refresher.wait_running()
+        refresher.shutdown()
+
+    def test_session_expiry_reads_jwt_and_msal_entries(self):
+        exp = (self.now + datetime.timedelta(hours=1)).replace(microsecond=0)
+        msal = json.dumps({'credentialType': 'AccessToken', 'expiresOn': str(int(exp.timestamp()) + 60)})
+        refresh = json.dumps({'credentialType': 'RefreshToken', 'expiresOn': '1'})
+        self.assertEqual(session_expiry({'token': make_jwt(exp), 'msal.at': msal, 'msal.rt': refresh}), exp)
+        self.assertIsNone(session_expiry({'theme': 'dark'}))
+
+    def test_foreground_run_refreshes_once_when_upstream_rejects_the_session(self):
+        soldier = self.make_soldier('revoked', datetime.timedelta(hours=5))  # token looks valid: no upfront refresh
+
+        def build(cookies, local_storage):
+            status = 200 if cookies.get('AppCookie') == 'fresh' else 401
+            return httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(status, text='true')))
+
+        def refresh(s, priority):
+            s.cookies = {'AppCookie': 'fresh'}
+            return True
+
+        with mock.patch('core.services.build_client', build), \
+                mock.patch('core.services.refresh_session', side_effect=refresh) as refreshed, \
+                self.assertLogs('ui_logger', 'WARNING'):
+            results, db_updated = run_attendance_for_user(soldier)
+        refreshed.assert_called_once()
+        self.assertTrue(db_updated)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(r['success'] for r in results))
+
+        # A refresh that fails is not retried, and nothing is resent
+        soldier.cookies = {'AppCookie': 'revoked'}
+        with mock.patch('core.services.build_client', build), \
+                mock.patch('core.services.refresh_session', return_value=False) as refreshed, \
+                self.assertLogs('ui_logger', 'WARNING'):
+            results, db_updated = run_attendance_for_user(soldier)
+        refreshed.assert_called_once()
+        self.assertFalse(any(r['success'] for r in results))
+
+    def test_refreshes_due_soldiers_by_expiry_under_cap(self):
+        self.make_soldier('later', datetime.timedelta(hours=5))
+        soon = self.make_soldier('soon', datetime.timedelta(minutes=5))
+        sooner = self.make_soldier('sooner', datetime.timedelta(minutes=1))
+
+        refresher = SessionRefresher(concurrency=1, lead=datetime.timedelta(minutes=30),
+                                     off_peak_lead=datetime.timedelta(hours=10), off_peak_hours=(0, 0))
+        started = []
+        with mock.patch('core.refresher.refresh_session', side_effect=lambda s, priority: started.append(s.id) or True):
+            refresher.reload()
+            self.assertEqual(refresher.tick(self.now), 1)
+            self.assertEqual(refresher.tick(self.now), 0)  # cap reached
+            refresher.wait_running()
+            self.assertEqual(refresher.tick(self.now), 1)
+            refresher.wait_running()
+            self.assertEqual(refresher.tick(self.now), 0)  # 'later' is not due yet
+            refresher.shutdown()
+
+        self.assertEqual(started, [sooner.id, soon.id])
+
+    def test_off_peak_widens_the_window(self):
+        # 24 h tokens issued 16 h ago: inside the 10 h off-peak lead (capped at 12 h)
+        self.make_soldier('tomorrow-morning', datetime.timedelta(hours=8), issued_ago=datetime.timedelta(hours=16))
+        refresher = self.off_peak_refresher()
+        with mock.patch('core.refresher.refresh_session', return_value=True):
+            refresher.reload()
+            self.assertEqual(refresher.tick(self.now), 1)
+            refresher.shutdown()
+
+    def test_off_peak_lead_is_capped_by_token_lifetime(self):
+        # 1 h tokens: the 10 h off-peak lead would make them due again right after every refresh
+        self.make_soldier('hourly', datetime.timedelta(minutes=20), issued_ago=datetime.timedelta(minutes=40))
+
+        def refresh(soldier, priority):
+            soldier.local_storage = {'token': make_jwt(timezone.now() + datetime.timedelta(hours=1))}
+            soldier.save()
+            return True
+
+        refresher = self.off_peak_refresher(min_interval=datetime.timedelta(0))
+        with mock.patch('core.refresher.refresh_session', side_effect=refresh) as refreshed:
+            self.run_cycles(refresher)
+        self.assertEqual(refreshed.call_count, 1)
+        self.assertGreater(refresher.seconds_until_next(self.now), 25 * 60)  # due at half the new lifetime
+
+    def test_refresh_that_does_not_extend_the_session_is_not_repeated(self):
+        self.make_soldier('stuck', datetime.timedelta(minutes=5))
+        for guard in ({'retry_delay': datetime.timedelta(minutes=15), 'min_interval': datetime.timedelta(0)},
+                      {'retry_delay': datetime.timedelta(0), 'min_interval': datetime.timedelta(minutes=20)}):
+            with self.subTest(**guard):
+                refresher = self.off_peak_refresher(**guard)
+                # "Succeeds" but the stored tokens (and their expiry) stay the same
+                with mock.patch('core.refresher.refresh_session', return_value=True) as refreshed, \
+                        self.assertLogs('ui_logger', 'WARNING') as logs:
+                    self.run_cycles(refresher)
+                self.assertEqual(refreshed.call_count, 1)
+                self.assertIn('did not extend the session', logs.output[0])
+
+
+class BrowserAdmissionTests(SimpleTestCase):
+    MB = 1024 ** 2
+
+    def make_admission(self, free_mb, max_browsers=8):
+        # Like the real MemAvailable, free memory shrinks as browsers start
+        def sampler():
+            mem = (free_mb - 300 * admission.active) * self.MB
+            return {'mem_available': mem, 'cpu_count': 8, 'load': 0.0}
+
+        admission = BrowserAdmission(
+            max_browsers=max_browsers, browser_bytes=300 * self.MB, reserve_bytes=100 * self.MB,
+            cpus_per_browser=0.5, sample_interval=0.01, sampler=sampler,
+        )
+        return admission
+
+    def test_capacity_follows_available_memory(self):
+        self.assertEqual(self.make_admission(1000).capacity(), 3)
+        self.assertEqual(self.make_admission(5000, max_browsers=4).capacity(), 4)
+        # Never zero on an idle host, or nothing could ever run
+        self.assertEqual(self.make_admission(50).capacity(), 1)
+
+    def test_waiters_are_admitted_in_fifo_order_with_positions(self):
+        admission = self.make_admission(400)  # room for exactly one browser
+        order, positions = [], {}
+        release = threading.Event()
+
+        def holder():
+            with admission.slot():
+                release.wait()
+
+        def waiter(name):
+            def on_wait(position, total):
+                positions.setdefault(name, position)
+            with admission.slot(timeout=5, on_wait=on_wait):
+                order.append(name)
+
+        first = threading.Thread(target=holder)
+        first.start()
+        while admission.active == 0:
+            time.sleep(0.01)
+
+        threads = []
+        for name in ('a', 'b', 'c'):
+            t = threading.Thread(target=waiter, args=(name,))
+            t.start()
+            threads.append(t)
+            while admission.waiting < len(threads):
+                time.sleep(0.01)
+
+        release.set()
+        for t in [first] + threads:
+            t.join(5)
+
+        self.assertEqual(order, ['a', 'b', 'c'])
+        self.assertEqual(positions, {'a': 1, 'b': 2, 'c': 3})
+
+    def test_interactive_goes_first_but_background_keeps_its_share(self):
+        lanes = PriorityLanes(slots=1, background_share=0.25)
+        order = []
+        release = threading.Event()
+
+        def holder():
+            with lanes.slot(PRIORITY_BACKGROUND):
+                release.wait()
+
+        def waiter(name, priority):
+            with lanes.slot(priority, timeout=5):
+                order.append(name)
+
+        threads = [threading.Thread(target=holder)]
+        threads[0].start()
+        while lanes.active == 0:
+            time.sleep(0.01)
+
+        # Background work queued first, then a burst of interactive users
+        jobs = [(f"b{i}", PRIORITY_BACKGROUND) for i in range(4)] + [(f"i{i}", PRIORITY_INTERACTIVE) for i in range(8)]
+        for name, priority in jobs:
+            t = threading.Thread(target=waiter, args=(name, priority))
+            t.start()
+            threads.append(t)
+            while lanes.waiting < len(threads) - 1:
+                time.sleep(0.01)
+
+        release.set()
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(order, ['i0', 'i1', 'i2', 'b0', 'i3', 'i4', 'i5', 'b1', 'i6', 'i7', 'b2', 'b3'])
+        stats = lanes.stats()
+        self.assertEqual((stats[PRIORITY_INTERACTIVE]['admitted'], stats[PRIORITY_BACKGROUND]['admitted']), (8, 5))
+        self.assertGreater(stats[PRIORITY_BACKGROUND]['max_wait'], stats[PRIORITY_INTERACTIVE]['p50_wait'])
+
+    def test_browser_cap_holds_across_processes(self):
+        # Separate admission objects stand in for separate processes sharing the slot files
+        with tempfile.TemporaryDirectory() as slot_dir:
+            web, worker = (BrowserAdmission(
+                max_browsers=1, browser_bytes=300 * self.MB, reserve_bytes=100 * self.MB,
+                cpus_per_browser=0.5, sample_interval=0.01, slot_dir=Path(slot_dir),
+                sampler=lambda: {'mem_available': 8000 * self.MB, 'cpu_count': 8, 'load': 0.0},
+            ) for _ in range(2))
+
+            with web.slot():
+                with self.assertRaises(AdmissionTimeout):
+                    with worker.slot(timeout=0.1):
+                        pass
+            with worker.slot(timeout=1):
+                self.assertEqual(worker.active, 1)
+
+    def test_timeout_leaves_the_queue(self):
+        admission = self.make_admission(400)
+        with admission.slot():
+            with self.assertRaises(AdmissionTimeout):
+                with admission.slot(timeout=0.1):
+                    pass
+            self.assertEqual(admission.waiting, 0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class OutboxTests(TransactionTestCase):
+    """The drainer sends from worker threads, so the rows must be committed."""
+    def setUp(self):
+        self.soldier = make_soldier_with_session('outbox', datetime.timedelta(hours=2))
+        self.requests = []
+
+    def fake_client(self, status, body='true'):
+        def handler(request):
+            self.requests.append(request)
+            return httpx.Response(status, text=body)
+
+        def build(cookies, local_storage):
+            return httpx.Client(transport=httpx.MockTransport(handler), cookies=cookies)
+        return build
+
+    def fail_run(self):
+        with mock.patch('core.services.build_client', self.fake_client(503, 'down')):
+            results, _db_updated = run_attendance_for_user(self.soldier)
+        self.assertFalse(any(r['success'] for r in results))
+        self.requests.clear()
+
+    def test_transport_failures_are_queued_and_drained_once_upstream_recovers(self):
+        self.fail_run()
+        self.assertEqual(OutboxReport.objects.filter(status=OutboxReport.STATUS_PENDING).count(), 8)
+        OutboxReport.objects.update(next_attempt_at=timezone.now())
+
+        drainer = OutboxDrainer(concurrency=2)
+        with mock.patch('core.drainer.build_client', self.fake_client(200)), \
+                mock.patch('core.drainer.refresh_session') as refresh:
+            stats = drainer.drain_once()
+            drainer.close()
+
+        self.assertEqual((stats['sent'], stats['retried'], stats['failed']), (8, 0, 0))
+        self.assertEqual(len(self.requests), 8)
+        refresh.assert_not_called()  # the session has not expired
+        self.assertEqual(ReportedDay.objects.filter(soldier=self.soldier).count(), 8)
+        self.assertFalse(OutboxReport.objects.exclude(status=OutboxReport.STATUS_SENT).exists())
+
+    def test_still_down_backs_off_without_hammering(self):
+        self.fail_run()
+        OutboxReport.objects.update(next_attempt_at=timezone.now())
+
+        drainer = OutboxDrainer()
+        with mock.patch('core.drainer.build_client', self.fake_client(502, 'bad gateway')):
+            stats = drainer.drain_once()
+            drainer.close()
+
+        self.assertEqual(stats['retried'], 8)
+        self.assertEqual(len(self.requests), 1)
+        entry = OutboxReport.objects.earliest('next_attempt_at')
+        self.assertEqual(entry.attempts, 1)
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+        self.assertEqual(drainer._clients, {})  # clients only live for the pass
+
+    def test_requeued_rows_start_over(self):
+        self.fail_run()
+        OutboxReport.objects.update(attempts=5)
+        self.fail_run()
+        self.assertEqual(set(OutboxReport.objects.values_list('attempts', flat=True)), {0})
+
+    def test_a_later_run_that_delivers_settles_the_queue(self):
+        self.fail_run()
+        with mock.patch('core.services.build_client', self.fake_client(200)):
+            results, _db_updated = run_attendance_for_user(self.soldier)
+        self.assertTrue(all(r['success'] for r in results))
+
+        self.assertFalse(OutboxReport.objects.exclude(status=OutboxReport.STATUS_SENT).exists())
+        OutboxReport.objects.update(next_attempt_at=timezone.now())
+        self.requests.clear()
+        with mock.patch('core.drainer.build_client', self.fake_client(200)):
+            stats = OutboxDrainer().drain_once()
+        self.assertEqual((stats['sent'], len(self.requests)), (0, 0))  # nothing is sent twice
+
+    def test_rows_for_past_dates_are_given_up(self):
+        self.fail_run()
+        stale = OutboxReport.objects.earliest('report_date')
+        OutboxReport.objects.filter(pk=stale.pk).update(report_date=datetime.date.today() - datetime.timedelta(days=1))
+
+        with mock.patch('core.drainer.build_client', self.fake_client(200)), \
+                self.assertLogs('ui_logger', 'WARNING'):
+            stats = OutboxDrainer().drain_once()
+
+        self.assertEqual((stats['sent'], stats['failed']), (0, 1))  # the rest are not due yet
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, OutboxReport.STATUS_FAILED)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SoldierCacheTests(TestCase):
+    def setUp(self):
+        self.soldier = Soldier.objects.create(personal_id='cached', _cookies_data='{"AppCookie": "v1"}')
+
+    def test_repeat_reads_skip_the_db(self):
+        self.assertEqual(get_soldier(self.soldier.id).cookies, {'AppCookie': 'v1'})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_soldier(self.soldier.id).cookies, {'AppCookie': 'v1'})
+
+    def test_writes_elsewhere_are_visible_on_next_read(self):
+        get_soldier(self.soldier.id)
+
+        # A worker saving its own instance of the row
+        worker_copy = Soldier.objects.get(id=self.soldier.id)
+        worker_copy.cookies = {'AppCookie': 'v2'}
+        with self.captureOnCommitCallbacks(execute=True):
+            worker_copy.save()
+        self.assertEqual(get_soldier(self.soldier.id).cookies, {'AppCookie': 'v2'})
+
+        # Bulk imports bypass signals
+        with self.captureOnCommitCallbacks(execute=True):
+            import_states([('bulk', 'cached', {'cookies': {'AppCookie': 'v3'}})])
+        self.assertEqual(get_soldier(self.soldier.id).cookies, {'AppCookie': 'v3'})
+
+    def test_versions_are_bumped_on_commit_and_only_for_the_default_db(self):
+        version_key = f'soldier:{self.soldier.id}:version'
+        get_soldier(self.soldier.id)
+        version = cache.get(version_key)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.soldier.save()
+            # Not committed yet: a reader now must not cache this row under a new version
+            self.assertEqual(cache.get(version_key), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(version_key), version)
+
+        # Another DB's row with the same pk (e.g. a load test's) leaves this cache alone
+        version = cache.get(version_key)
+        with self.captureOnCommitCallbacks(execute=True):
+            post_save.send(sender=Soldier, instance=self.soldier, created=False, using='loadtest')
+            post_delete.send(sender=Soldier, instance=self.soldier, using='loadtest')
+        self.assertEqual(cache.get(version_key), version)
+
+    def test_configured_file_cache_holds_a_whole_fleet(self):
+        Soldier.objects.bulk_create(Soldier(personal_id=f'fleet-{i}', _cookies_data='{"AppCookie": "x"}')
+                                    for i in range(500))
+        ids = list(Soldier.objects.values_list('id', flat=True))
+
+        with tempfile.TemporaryDirectory() as location, \
+                override_settings(CACHES={'default': dict(project_settings.CACHES['default'], LOCATION=location)}):
+            for soldier_id in ids:
+                get_soldier(soldier_id)
+            # Nothing was culled: the warm pass never touches the DB
+            with self.assertNumQueries(0):
+                for soldier_id in ids:
+                    get_soldier(soldier_id)
+
+
+@override_settings(AUTO_REPORTER_HOLIDAYS=['2030-01-02', '2030-01-06..2030-01-07'],
+                   AUTO_REPORTER_HOLIDAYS_FILE=None, AUTO_REPORTER_CALENDAR_HORIZON_DAYS=30)
+class ReportableDaysTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(reportable_days, '_calendar', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_calendar_skips_weekends_holidays_and_exclusions(self):
+        day = lambda d: datetime.date(2030, 1, d)  # Tuesday the 1st; Friday/Saturday are the 4th/5th
+        calendar = reportable_days.get_reportable_calendar(day(1))
+        self.assertIs(reportable_days.get_reportable_calendar(day(1)), calendar)
+        self.assertIsNot(reportable_days.get_reportable_calendar(day(2)), calendar)
+
+        calendar = reportable_days.get_reportable_calendar(day(1))
+        self.assertEqual(calendar.next_days(3), [day(1), day(3), day(8)])
+        self.assertEqual(calendar.next_days(2, start=day(4)), [day(8), day(9)])
+
+        soldier = Soldier(personal_id='on-leave', excluded_dates='2030-01-08\n# course\n2030-01-10..2030-01-13')
+        self.assertEqual(calendar.next_days(2, start=day(4), exclude=soldier.excluded_days), [day(9), day(14)])
+
+    def test_malformed_exclusions_are_rejected(self):
+        soldier = Soldier(personal_id='typo', excluded_dates='2030-01-08\n2030-13-01\n2030-01-10..2030-01-02')
+        with self.assertRaises(ValidationError) as raised:
+            soldier.clean_fields()  # what the admin form runs
+        self.assertIn('2030-13-01, 2030-01-10..2030-01-02', str(raised.exception))
+        # Code paths that skip form validation are checked on save
+        with self.assertRaises(ValidationError):
+            soldier.save()
+
+
+class RefreshServiceTests(SimpleTestCase):
+    """Runs a real `refresh_service` (with the stub refresh function) on a temp socket."""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket = os.path.join(self.tmp.name, 'refresh.sock')
+        self.service = subprocess.Popen(
+            [sys.executable, MANAGE_PY, 'refresh_service', '--socket', self.socket,
+             '--workers', '1', '--max-refreshes', '2',
+             '--refresh-function', 'core.stubs.stub_refresh_with_selenium'],
+            env=dict(os.environ, DOH1_STUB_DELAY='0'), cwd=settings.BASE_DIR,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while not os.path.exists(self.socket):
+            self.assertLess(time.monotonic(), deadline, "refresh service did not start")
+            time.sleep(0.05)
+
+    def tearDown(self):
+        self.service.send_signal(signal.SIGINT)
+        self.service.wait(30)
+        self.tmp.cleanup()
+
+    def test_refreshes_run_in_recycled_worker_processes(self):
+        with override_settings(AUTO_REPORTER_REFRESH_SOCKET=self.socket):
+            with self.assertLogs('ui_logger', 'INFO') as logs:
+                pids = [refresh_via_service({'AppCookie': 'x'})['cookies']['StubRefreshedBy'] for _ in range(3)]
+            stats = service_stats()
+
+        self.assertNotIn(str(os.getpid()), pids)
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])  # recycled after --max-refreshes
+        self.assertTrue(any('[STUB] Refreshing session' in line for line in logs.output))
+        self.assertEqual((stats['refreshes'], stats['recycled']), (3, 1))
+
+
+class LoadTestCommandTests(SimpleTestCase):
+    def loadtest(self, *args):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        return subprocess.run(
+            [sys.executable, MANAGE_PY, 'loadtest', '--port', str(port), *args],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=120,
+        )
+
+    def test_smoke_run_against_a_started_server(self):
+        run = self.loadtest('--users', '3', '--stub-delay', '0')
+        self.assertEqual(run.returncode, 0, run.stderr)
+        self.assertIn('Errors           0/3', run.stdout)
+
+    def test_external_target_needs_its_own_db(self):
+        run = self.loadtest('--url', 'http://127.0.0.1:1', '--users', '1')
+        self.assertNotEqual(run.returncode, 0)
+        self.assertIn('--url needs --db', run.stderr)
+
+        default_db = os.environ.get('DOH1_DB_PATH', 'db.sqlite3')  # the subprocess's, not the test DB
+        run = self.loadtest('--url', 'http://127.0.0.1:1', '--users', '1', '--db', default_db)
+        self.assertNotEqual(run.returncode, 0)
+        self.assertIn('--db must not be the default DB', run.stderr)
+
+
+class RefreshPoolTests(SimpleTestCase):
+    """RefreshService's worker pool with fake workers, in-process."""
+    class FakeWorker:
+        pid = 0
+
+        def __init__(self):
+            self.refreshes = 0
+            self.stopped = False
+
+        def alive(self):
+            return not self.stopped
+
+        def rss(self):
+            return 0
+
+        def call(self, params, on_log, timeout):
+            self.refreshes += 1
+            return {'cookies': params['cookies']}
+
+        def stop(self):
+            self.stopped = True
+
+    def test_failed_respawn_is_retried_and_never_hangs_a_caller(self):
+        spawns = [self.FakeWorker(), OSError('Too many open files'), OSError('Too many open files'),
+                  self.FakeWorker(), self.FakeWorker()]
+        with mock.patch('core.refresh_service.WorkerProcess', side_effect=spawns), \
+                mock.patch('core.refresh_service.get_browser_admission', return_value=PriorityLanes(slots=1)):
+            service = RefreshService(workers=1, max_refreshes=1, timeout=0.2)
+            params = {'cookies': {'AppCookie': 'x'}}
+
+            with self.assertLogs('ui_logger', 'INFO') as logs:
+                self.assertEqual(service.refresh(params, on_log=print), params)  # recycled; the respawn fails
+                with self.assertRaises(WorkerDied):
+                    service.refresh(params, on_log=print)  # retried once more, then the wait times out
+                self.assertEqual(service.refresh(params, on_log=print), params)
+
+        self.assertEqual(sum('Could not start a refresh worker' in line for line in logs.output), 2)
+        self.assertEqual((service.stats['refreshes'], service.stats['failed'], service.stats['spawn_failed']),
+                         (2, 1, 2))
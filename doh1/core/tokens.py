@@ -0,0 +1,84 @@
+"""
+Reads token expiry out of a soldier's stored localStorage.
+
+Understands raw JWTs, MSAL cache entries ({"credentialType": ..., "expiresOn": ...})
+and oidc-client user entries ({"expires_at": ...}). The session is considered
+to expire when its earliest access/id token does.
+"""
+import base64
+import datetime
+import json
+from typing import Any, Dict, Iterator, Optional
+
+# Refresh tokens outlive the session we can actually use for reporting
+IGNORED_CREDENTIAL_TYPES = {'refreshtoken'}
+
+
+def _to_datetime(value: Any) -> Optional[datetime.datetime]:
+    try:
+        timestamp = int(float(value))
+    except (TypeError, ValueError):
+        return None
+    if timestamp > 10 ** 11:  # milliseconds
+        timestamp //= 1000
+    try:
+        return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def _jwt_exp(token: str) -> Optional[datetime.datetime]:
+    parts = token.split('.')
+    if len(parts) != 3:
+        return None
+    payload = parts[1] + '=' * (-len(parts[1]) % 4)
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+    return _to_datetime(claims.get('exp')) if isinstance(claims, dict) else None
+
+
+def _candidate_expiries(value: Any) -> Iterator[datetime.datetime]:
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith('{'):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                return
+        elif value.count('.') == 2:
+            exp = _jwt_exp(value)
+            if exp:
+                yield exp
+            return
+        else:
+            return
+
+    if not isinstance(value, dict):
+        return
+
+    if str(value.get('credentialType', '')).lower() in IGNORED_CREDENTIAL_TYPES:
+        return
+
+    for key in ('expiresOn', 'expires_on', 'expires_at', 'exp'):
+        exp = _to_datetime(value.get(key))
+        if exp:
+            yield exp
+            return
+
+    for key in ('access_token', 'id_token', 'secret'):
+        token = value.get(key)
+        if isinstance(token, str) and token.count('.') == 2:
+            exp = _jwt_exp(token)
+            if exp:
+                yield exp
+                return
+
+
+def session_expiry(local_storage: Optional[Dict[str, Any]]) -> Optional[datetime.datetime]:
+    """Earliest token expiry found in local storage, or None if there is none."""
+    if not local_storage:
+        return None
+    expiries = [exp for value in local_storage.values() for exp in _candidate_expiries(value)]
+    return min(expiries) if expiries else None
@@ -1,22 +1,32 @@
+import asyncio
 import calendar
+import io
 import json
 import queue
 import threading
-import time
 import re
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
-from http.cookies import SimpleCookie
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.paginator import Paginator
 from django.http import StreamingHttpResponse
 from django.template.loader import render_to_string
 
-from core.loggers import ThreadQueueHandler, get_ui_logger
+from core.loggers import AsyncQueueHandler, ThreadQueueHandler, get_ui_logger, make_log_entry
 
+from .admission import get_browser_admission
+from .fleet import fleet_queryset, get_rollup, stale_threshold
+from .importers import normalize_state, parse_state_text
+from .lanes import get_report_lanes
 from .models import Soldier
-from .services import run_attendance_for_user
+from .services import run_report
+from .soldier_cache import get_soldier
 
 # ---------------------------------------------------------
 # AUTHENTICATION & DASHBOARD
@@ -37,7 +47,7 @@ def dashboard(request):
     if 'user_id' not in request.session:
         return redirect('login')
     
-    soldier = Soldier.objects.get(id=request.session['user_id'])
+    soldier = get_soldier(request.session['user_id'])
     has_cookies = bool(soldier.cookies)
     
     context = {
@@ -50,13 +60,36 @@ def logout_view(request):
     request.session.flush()
     return redirect('login')
 
+# ---------------------------------------------------------
+# FLEET OVERVIEW (operators)
+# ---------------------------------------------------------
+
+FLEET_PAGE_SIZE = 50
+
+@staff_member_required
+def fleet_view(request):
+    """All soldiers at a glance. Constant query count per page; totals come from the cached rollup."""
+    page = Paginator(fleet_queryset(), FLEET_PAGE_SIZE).get_page(request.GET.get('page'))
+
+    context = {
+        'page': page,
+        'rollup': get_rollup(),
+        'stale_before': stale_threshold(),
+        # Per-class queue waits in this process, for tuning AUTO_REPORTER_BACKGROUND_MIN_SHARE
+        'lanes': [
+            ('Browsers', get_browser_admission().stats()),
+            ('Report sending', get_report_lanes().stats()),
+        ],
+    }
+    return render(request, 'fleet.html', context)
+
 # ---------------------------------------------------------
 # COOKIE MANAGEMENT
 # ---------------------------------------------------------
 
 def update_cookies(request):
     if request.method == "POST":
-        soldier = Soldier.objects.get(id=request.session['user_id'])
+        soldier = get_soldier(request.session['user_id'])
         final_cookies = {}
         final_local = {}
         final_session = {}
@@ -65,22 +98,10 @@ def update_cookies(request):
         if 'cookie_file' in request.FILES:
             try:
                 uploaded_file = request.FILES['cookie_file']
-                file_content = uploaded_file.read().decode('utf-8')
-                json_data = json.loads(file_content)
-                
-                if isinstance(json_data, dict) and "cookies" in json_data:
-                    if isinstance(json_data["cookies"], list):
-                        for c in json_data["cookies"]:
-                            final_cookies[c['name']] = c['value']
-                    if "localStorage" in json_data:
-                        final_local = json_data["localStorage"]
-                    if "sessionStorage" in json_data:
-                        final_session = json_data["sessionStorage"]
-                elif isinstance(json_data, list):
-                    for c in json_data:
-                        final_cookies[c['name']] = c['value']
-                elif isinstance(json_data, dict):
-                    final_cookies = json_data
+                # One export is a single JSON document, read whole; large fleets
+                # go through `manage.py import_sessions`, which streams NDJSON
+                json_data = json.load(io.TextIOWrapper(uploaded_file, encoding='utf-8'))
+                final_cookies, final_local, final_session = normalize_state(json_data)
                     
                 messages.success(request, f"Imported state! Cookies: {len(final_cookies)}")
             except Exception as e:
@@ -90,30 +111,10 @@ def update_cookies(request):
         # --- METHOD 2: Text Paste ---
         elif 'cookie_json' in request.POST:
             raw_data = request.POST.get("cookie_json", "").strip()
-            
-            if raw_data.startswith("{") or raw_data.startswith("["):
-                try:
-                    json_data = json.loads(raw_data)
-                    if isinstance(json_data, dict) and "cookies" in json_data:
-                         for c in json_data["cookies"]:
-                            final_cookies[c['name']] = c['value']
-                         final_local = json_data.get("localStorage", {})
-                         final_session = json_data.get("sessionStorage", {})
-                    elif isinstance(json_data, list):
-                        for c in json_data:
-                            final_cookies[c['name']] = c['value']
-                    else:
-                        final_cookies = json_data
-                except:
-                    pass
-            
-            if not final_cookies and raw_data:
+            if raw_data:
                 try:
-                    cookie_parser = SimpleCookie()
-                    cookie_parser.load(raw_data)
-                    for key, morsel in cookie_parser.items():
-                        final_cookies[key] = morsel.value
-                except:
+                    final_cookies, final_local, final_session = parse_state_text(raw_data)
+                except Exception:
                     pass
 
         if final_cookies:
@@ -131,6 +132,40 @@ def update_cookies(request):
 # ---------------------------------------------------------
 # STREAMING REPORT LOGIC
 # ---------------------------------------------------------
+def format_log(log_entry):
+    """Turns a log entry into an addLog() call for loading_terminal.html."""
+    # 1. Determine Color
+    color_class = "text-slate-300"
+    if log_entry['level'] == 'success': color_class = "text-emerald-400"
+    elif log_entry['level'] == 'error': color_class = "text-red-400"
+    elif log_entry['level'] == 'warning': color_class = "text-amber-400"
+    
+    # 2. Escape content
+    timestamp = log_entry['time']
+    msg_content = str(log_entry['msg']).replace("'", "\\'") # Escape single quotes for JS
+    
+    # 3. Build HTML String (Pure Python)
+    html_payload = (
+        f'<li class="flex space-x-3 group animate-fade-in-up">'
+        f'<span class="text-slate-600 flex-shrink-0 select-none w-16 font-mono">{timestamp}</span>'
+        f'<div class="{color_class} flex-1 break-words font-mono">{msg_content}</div>'
+        f'</li>'
+    )
+    
+    # 4. Return simple JS call
+    return f"<script>addLog('{html_payload}');</script>"
+
+def sanitize_results(results):
+    """Makes report results JSON-serializable for the session."""
+    processed_results = []
+    for res in results:
+        clean_res = res.copy()
+        if 'date' in clean_res and isinstance(clean_res['date'], (date, datetime)):
+            clean_res['date'] = clean_res['date'].strftime("%d.%m.%Y")
+        if 'dt' in clean_res: del clean_res['dt']
+        processed_results.append(clean_res)
+    return processed_results
+
 def execute_report(request):
     if 'user_id' not in request.session:
         return redirect('login')
@@ -147,29 +182,6 @@ def stream_generator(request):
     # 1. Render Loading Screen
     yield render_to_string('loading_terminal.html')
 
-    # Helper for JS
-    def format_log(log_entry):
-        # 1. Determine Color
-        color_class = "text-slate-300"
-        if log_entry['level'] == 'success': color_class = "text-emerald-400"
-        elif log_entry['level'] == 'error': color_class = "text-red-400"
-        elif log_entry['level'] == 'warning': color_class = "text-amber-400"
-        
-        # 2. Escape content
-        timestamp = log_entry['time']
-        msg_content = str(log_entry['msg']).replace("'", "\\'") # Escape single quotes for JS
-        
-        # 3. Build HTML String (Pure Python)
-        html_payload = (
-            f'<li class="flex space-x-3 group animate-fade-in-up">'
-            f'<span class="text-slate-600 flex-shrink-0 select-none w-16 font-mono">{timestamp}</span>'
-            f'<div class="{color_class} flex-1 break-words font-mono">{msg_content}</div>'
-            f'</li>'
-        )
-        
-        # 4. Return simple JS call
-        return f"<script>addLog('{html_payload}');</script>"
-
     # 2. Setup
     log_queue = queue.Queue()
     results_container = {}
@@ -178,10 +190,11 @@ def stream_generator(request):
     # Get ID of the current (Main) thread so we can capture its logs too
     main_thread_id = threading.get_ident()
 
-    # Worker Function
+    # Worker Function: its logs (and those of threads it hands its context to) belong to this stream
     def worker(soldier_obj):
         try:
-            res, updated = run_attendance_for_user(soldier_obj)
+            with handler.capture():
+                res, updated = run_report(soldier_obj)
             results_container['data'] = (res, updated)
         except Exception as e:
             results_container['error'] = e
@@ -196,19 +209,19 @@ def stream_generator(request):
         yield format_log(start_msg)
         captured_logs_history.append(start_msg)
 
-        soldier = Soldier.objects.get(id=request.session['user_id'])
+        soldier = get_soldier(request.session['user_id'])
         if not soldier.cookies:
             # ... Error handling ...
             return
 
+        # --- ATTACH HANDLER (Monitor Worker AND Main Thread) ---
+        # Not promiscuous: other streams' workers log through the same logger
+        handler = ThreadQueueHandler(log_queue, allowed_thread_ids=[main_thread_id])
+        logger.addHandler(handler)
+
         # --- START THREAD ---
         t = threading.Thread(target=worker, args=(soldier,))
         t.start()
-        
-        # --- ATTACH HANDLER (Monitor Worker AND Main Thread) ---
-        # We pass a LIST of thread IDs: [Main, Worker]
-        handler = ThreadQueueHandler(log_queue)
-        logger.addHandler(handler)
 
         # Now we can use standard logger in the Main Thread too!
         logger.warning("Background worker started.")
@@ -236,13 +249,7 @@ def stream_generator(request):
         logger.info(f"Processing {len(results)} days of attendance data...")
         
         # Sanitize Results
-        processed_results = []
-        for res in results:
-            clean_res = res.copy()
-            if 'date' in clean_res and isinstance(clean_res['date'], (date, datetime)):
-                clean_res['date'] = clean_res['date'].strftime("%d.%m.%Y")
-            if 'dt' in clean_res: del clean_res['dt']
-            processed_results.append(clean_res)
+        processed_results = sanitize_results(results)
 
         request.session['report_results'] = processed_results
         
@@ -275,44 +282,145 @@ def stream_generator(request):
         # Redirect
         yield "<script>transitionToResults();</script>"
         
-        # 2. Wait slightly for the CSS transition (700ms) to mostly finish
-        time.sleep(1) 
-        
-        # 3. Redirect
-        yield "<script>window.location.href = '/report/view/';</script>"
+        # 2. Redirect once the CSS transition (700ms) has mostly finished; the browser waits, not this thread
+        yield "<script>setTimeout(function () { window.location.href = '/report/view/'; }, 1000);</script>"
     except Exception as e:
         if handler: logger.removeHandler(handler)
-        print(f"Stream Error: {e}")
+        logger.exception(f"Stream error for soldier {request.session.get('user_id')}")
         err_msg = {'time': datetime.now().strftime("%H:%M:%S"), 'level': 'error', 'msg': f"Error: {str(e)}"}
         yield format_log(err_msg)
         yield "<script>window.location.href = '/report/view/';</script>"
 
-def view_report_results(request):
-    if 'user_id' not in request.session:
+# ---------------------------------------------------------
+# ASYNC STREAMING (ASGI deployments)
+# ---------------------------------------------------------
+# Report runs still need a thread (Selenium/httpx are blocking), but they come from
+# a bounded pool and waiting for log events happens on the event loop. The sync
+# middleware and session calls run on the few threads doh1.asgi shares between
+# streams (core.request_threads), so however many streams are open the process
+# holds AUTO_REPORTER_RUN_THREADS + AUTO_REPORTER_STREAM_REQUEST_THREADS threads
+# for them, against two per stream for the sync view.
+_report_executor = ThreadPoolExecutor(
+    max_workers=settings.AUTO_REPORTER_RUN_THREADS,
+    thread_name_prefix="report-run",
+)
+KEEPALIVE_SECONDS = 10
+
+async def execute_report_async(request):
+    user_id = await sync_to_async(request.session.get)('user_id')
+    if user_id is None:
         return redirect('login')
 
-    raw_results = request.session.get('report_results', [])
-    results = [r.copy() for r in raw_results]
+    response = StreamingHttpResponse(
+        async_stream_generator(request, user_id),
+        content_type='text/html'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-    cookie_updated = request.session.pop('cookie_updated_flag', False)
+async def async_stream_generator(request, user_id):
+    # 1. Render Loading Screen
+    yield render_to_string('loading_terminal.html')
 
-    execution_logs = request.session.get('execution_logs', [])
-    # 2. Process Results (Date Parsing & Sorting)
-    for res in results:
-        if 'date' in res and res['date']:
-            try:
-                res['dt'] = datetime.strptime(res['date'], "%d.%m.%Y").date()
-            except (ValueError, TypeError):
-                res['dt'] = datetime.now().date()
-        else:
-            res['dt'] = datetime.now().date()
-    
-    results.sort(key=lambda x: x.get('dt', datetime.max.date()))
+    # 2. Setup
+    loop = asyncio.get_running_loop()
+    log_queue = asyncio.Queue()
+    handler = AsyncQueueHandler(log_queue, loop)
+    captured_logs_history = []
 
-    for res in results:
-        res['json_str'] = json.dumps(res, default=str)
+    def log_line(msg, level='info'):
+        entry = make_log_entry(msg, level)
+        captured_logs_history.append(entry)
+        return format_log(entry)
 
-    # 3. Calendar Logic
+    def worker(soldier_obj):
+        # Runs in the executor; everything logged from here (and from pools the
+        # runner spawns with a copied context) goes to this stream only.
+        with handler.capture():
+            return run_report(soldier_obj)
+
+    def save_session(processed_results, cookie_updated):
+        if cookie_updated:
+            request.session['cookie_updated_flag'] = True
+        request.session['report_results'] = processed_results
+        request.session['execution_logs'] = captured_logs_history
+        request.session.save()
+
+    # Acquire Logger
+    logger = get_ui_logger()
+    get_task = None
+
+    try:
+        yield log_line('Initializing...')
+
+        soldier = await sync_to_async(get_soldier)(user_id)
+        if not soldier.cookies:
+            return
+
+        logger.addHandler(handler)
+        run_future = loop.run_in_executor(_report_executor, worker, soldier)
+        yield log_line("Background worker started.", 'warning')
+
+        # --- LOOP: AWAIT LOG EVENTS UNTIL THE WORKER IS DONE ---
+        while True:
+            if get_task is None:
+                get_task = asyncio.ensure_future(log_queue.get())
+            done, _ = await asyncio.wait(
+                {get_task, run_future},
+                timeout=KEEPALIVE_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if get_task in done:
+                log_entry = get_task.result()
+                get_task = None
+                captured_logs_history.append(log_entry)
+                yield format_log(log_entry)
+            elif run_future in done:
+                break
+            else:
+                yield " "
+
+        # Logs are handed over before the future resolves, so whatever is left is already queued
+        get_task.cancel()
+        get_task = None
+        while not log_queue.empty():
+            log_entry = log_queue.get_nowait()
+            captured_logs_history.append(log_entry)
+            yield format_log(log_entry)
+
+        logger.removeHandler(handler)
+        results, cookie_updated = run_future.result()
+
+        if cookie_updated:
+            yield log_line("Session cookies successfully rotated.")
+        yield log_line(f"Processing {len(results)} days of attendance data...")
+        yield log_line("Saving session state...")
+
+        await sync_to_async(save_session)(sanitize_results(results), cookie_updated)
+
+        yield format_log(make_log_entry("All tasks complete. Redirecting..."))
+        yield "<script>transitionToResults();</script>"
+
+        # Wait for the CSS transition without blocking anything
+        await asyncio.sleep(1)
+
+        yield "<script>window.location.href = '/report/view/';</script>"
+    except Exception as e:
+        logger.exception(f"Stream error for soldier {user_id}")
+        yield format_log(make_log_entry(f"Error: {str(e)}", 'error'))
+        yield "<script>window.location.href = '/report/view/';</script>"
+    finally:
+        if get_task is not None:
+            get_task.cancel()
+        logger.removeHandler(handler)
+
+def build_calendar(results):
+    """
+    Month grids (Sunday first) spanning the first to the last result, each day
+    carrying its result if there is one. `results` must be sorted by 'dt'.
+    """
     cal_data = []
     
     if results:
@@ -360,6 +468,36 @@ def view_report_results(request):
                 'weeks': month_weeks
             })
 
+    return cal_data
+
+def view_report_results(request):
+    if 'user_id' not in request.session:
+        return redirect('login')
+
+    raw_results = request.session.get('report_results', [])
+    results = [r.copy() for r in raw_results]
+
+    cookie_updated = request.session.pop('cookie_updated_flag', False)
+
+    execution_logs = request.session.get('execution_logs', [])
+    # 2. Process Results (Date Parsing & Sorting)
+    for res in results:
+        if 'date' in res and res['date']:
+            try:
+                res['dt'] = datetime.strptime(res['date'], "%d.%m.%Y").date()
+            except (ValueError, TypeError):
+                res['dt'] = datetime.now().date()
+        else:
+            res['dt'] = datetime.now().date()
+    
+    results.sort(key=lambda x: x.get('dt', datetime.max.date()))
+
+    for res in results:
+        res['json_str'] = json.dumps(res, default=str)
+
+    # 3. Calendar Logic
+    cal_data = build_calendar(results)
+
     context = {
         'results': results,
         'calendars': cal_data,
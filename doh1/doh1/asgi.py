@@ -12,5 +12,15 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'doh1.settings')
+# Under ASGI, /run/ is served by the native async stream unless DOH1_ASYNC_STREAMING=0
+os.environ.setdefault('DOH1_ASYNC_STREAMING', '1')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402  (settings are configured now)
+
+from core.request_threads import SharedRequestThreads  # noqa: E402
+from core.views import execute_report_async  # noqa: E402
+
+# Open streams share a few threads for their sync middleware instead of parking one each
+application = SharedRequestThreads(application, execute_report_async, settings.AUTO_REPORTER_STREAM_REQUEST_THREADS)
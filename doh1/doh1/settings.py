@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import hashlib
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -77,7 +79,33 @@ WSGI_APPLICATION = 'doh1.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DOH1_DB_PATH', BASE_DIR / 'db.sqlite3'),
+        # Several report workers may write at once; wait for the lock instead of failing
+        'OPTIONS': {'timeout': 30},
+        # On disk rather than Django's shared-cache in-memory DB, which fails
+        # concurrent writes with "table is locked" instead of waiting
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+
+# Cache
+# File-based so the web tier and report workers on one host share entries.
+# Each cached soldier takes two entries (its version and its row), and replaced
+# rows linger until they expire. Past MAX_ENTRIES the next write culls
+# 1/CULL_FREQUENCY of everything, so keep it well above twice the fleet size.
+# Keys are prefixed with the database they describe, so processes running on
+# another DB (a load test, a copy) never read or overwrite this one's entries.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DOH1_CACHE_DIR', BASE_DIR / '.state' / 'cache'),
+        'KEY_PREFIX': hashlib.sha1(os.path.abspath(DATABASES['default']['NAME']).encode()).hexdigest()[:12],
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('DOH1_CACHE_MAX_ENTRIES', 10000)),
+            'CULL_FREQUENCY': 3,
+        },
     }
 }
 
@@ -122,3 +150,95 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Auto Reporter
+# Runtime state (resolved driver paths, browser profiles, ...) lives here.
+
+AUTO_REPORTER_STATE_DIR = BASE_DIR / '.state'
+
+# chromedriver / Chrome binary paths are resolved once and cached in this file.
+DRIVER_CACHE_FILE = AUTO_REPORTER_STATE_DIR / 'driver_paths.json'
+
+# Headless refresh: block images/fonts/styles and every host not matched below.
+SELENIUM_BLOCK_RESOURCES = False
+SELENIUM_ALLOWED_URL_PATTERNS = [
+    'https://one.prat.idf.il/*',
+    'https://*.idf.il/*',
+    'https://login.microsoftonline.com/*',
+    'https://*.microsoftonline.com/*',
+    'https://*.msauth.net/*',
+    'https://*.msftauth.net/*',
+]
+
+# Headless refresh: keep one persistent Chrome profile per soldier (warm HTTP
+# cache, no state injection), evicted LRU-style above the disk budget.
+SELENIUM_PERSISTENT_PROFILES = False
+SELENIUM_PROFILE_DIR = AUTO_REPORTER_STATE_DIR / 'profiles'
+SELENIUM_PROFILE_CACHE_BYTES = 2 * 1024 ** 3
+
+# Per-soldier report function used by the /run/ view and report workers
+# (point it at core.stubs.stub_run_attendance for tests and load tests).
+AUTO_REPORTER_RUNNER = os.environ.get('DOH1_REPORT_RUNNER', 'core.services.run_attendance_for_user')
+
+# Serve /run/ with the native async stream. doh1.asgi turns it on (DOH1_ASYNC_STREAMING=0 opts out);
+# leave it off under WSGI.
+AUTO_REPORTER_ASYNC_STREAMING = os.environ.get('DOH1_ASYNC_STREAMING') == '1'
+# Report runs executing at once in one process (async streaming only).
+AUTO_REPORTER_RUN_THREADS = 8
+# Threads shared by all open async streams for their sync middleware and session writes.
+AUTO_REPORTER_STREAM_REQUEST_THREADS = 4
+
+# Foreground runs only launch Chrome if the session expires within this margin.
+# The fleet view counts those sessions (and ones with no known expiry) as stale.
+AUTO_REPORTER_FOREGROUND_REFRESH_MARGIN_MINUTES = 10
+
+# Background session refresher (manage.py refresh_sessions)
+AUTO_REPORTER_REFRESH_CONCURRENCY = 2
+AUTO_REPORTER_REFRESH_LEAD_MINUTES = 30        # refresh this long before expiry
+AUTO_REPORTER_OFF_PEAK_HOURS = (22, 5)         # local hours [start, end)
+AUTO_REPORTER_OFF_PEAK_LEAD_HOURS = 10         # off-peak: refresh anything expiring this soon
+AUTO_REPORTER_REFRESH_LEAD_FRACTION = 0.5      # ...but never earlier than half the token lifetime
+AUTO_REPORTER_REFRESH_MIN_INTERVAL_MINUTES = 20  # and never twice within this
+
+# Browser admission control: concurrent Chrome instances are limited by live
+# memory/CPU samples; extra refreshes queue (FIFO) for up to the timeout.
+AUTO_REPORTER_MAX_BROWSERS = 4
+AUTO_REPORTER_BROWSER_MEMORY_MB = 350
+AUTO_REPORTER_MEMORY_RESERVE_MB = 512
+AUTO_REPORTER_CPUS_PER_BROWSER = 0.5
+AUTO_REPORTER_ADMISSION_TIMEOUT = 120
+# MAX_BROWSERS holds across processes (web, report workers, refresh service) via lock files here.
+AUTO_REPORTER_BROWSER_SLOT_DIR = AUTO_REPORTER_STATE_DIR / 'browser-slots'
+
+# Outbox: reports that failed at the transport level are resent by
+# `manage.py drain_outbox` with exponential backoff (base doubling up to the max).
+AUTO_REPORTER_OUTBOX_BACKOFF_SECONDS = 30
+AUTO_REPORTER_OUTBOX_MAX_BACKOFF_SECONDS = 3600
+AUTO_REPORTER_OUTBOX_MAX_ATTEMPTS = 12
+AUTO_REPORTER_OUTBOX_CONCURRENCY = 4
+
+# Read-through cache for Soldier rows used by the web views (core.soldier_cache)
+AUTO_REPORTER_SOLDIER_CACHE_SECONDS = 300
+
+# Browser refreshes run in-process ('local') or in `manage.py refresh_service`
+# ('service'), in which case the web process never starts Chrome itself.
+AUTO_REPORTER_REFRESH_MODE = os.environ.get('DOH1_REFRESH_MODE', 'local')
+AUTO_REPORTER_REFRESH_SOCKET = Path(os.environ.get('DOH1_REFRESH_SOCKET', AUTO_REPORTER_STATE_DIR / 'refresh.sock'))
+AUTO_REPORTER_REFRESH_SERVICE_WORKERS = 2
+AUTO_REPORTER_REFRESH_WORKER_MAX_REFRESHES = 25
+AUTO_REPORTER_REFRESH_WORKER_MAX_RSS_MB = 1024
+AUTO_REPORTER_REFRESH_SERVICE_TIMEOUT = 180     # seconds per refresh before the worker is killed
+
+# Priority lanes (core.lanes): interactive runs go first for browsers and for the
+# HTTP phase; background work still gets this share of contested admissions.
+AUTO_REPORTER_BACKGROUND_MIN_SHARE = 0.25
+AUTO_REPORTER_REPORT_SLOTS = 8                 # soldiers sending reports at once
+
+# Reportable days (core.reportable_days): precomputed once per process per day.
+# Holidays/closures are ISO dates or inclusive ranges ("2026-04-13..2026-04-19");
+# the optional file holds one entry per line (# comments allowed).
+AUTO_REPORTER_WEEKEND_DAYS = (4, 5)            # Friday, Saturday
+AUTO_REPORTER_HOLIDAYS = []
+AUTO_REPORTER_HOLIDAYS_FILE = os.environ.get('DOH1_HOLIDAYS_FILE')
+AUTO_REPORTER_CALENDAR_HORIZON_DAYS = 120
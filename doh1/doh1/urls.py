@@ -1,14 +1,19 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from core import views
 
+# Under ASGI the native async stream runs reports on a bounded pool (see views.execute_report_async)
+execute_report = views.execute_report_async if settings.AUTO_REPORTER_ASYNC_STREAMING else views.execute_report
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.login_view, name='login'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('update-cookies/', views.update_cookies, name='update_cookies'),
-    path('run/', views.execute_report, name='execute_report'),
+    path('run/', execute_report, name='execute_report'),
     path('logout/', views.logout_view, name='logout'),
-    path('report/execute/', views.execute_report, name='execute_report'),
+    path('report/execute/', execute_report, name='execute_report'),
     path('report/view/', views.view_report_results, name='view_report_results'),
+    path('fleet/', views.fleet_view, name='fleet'),
 ]
\ No newline at end of file